@@ -0,0 +1,224 @@
+"""
+Benchmark the core functions on synthetic data of increasing size.
+
+For every scale (number of builds) a synthetic dataset is generated with
+synthetic_data.py, and the following functions are timed (best of several
+runs) and memory profiled (peak of traced allocations in a separate run):
+    load_results, pickle_data, make_char_dict, get_planes, get_p_vals,
+    add_laser_angle, the data preparation of the plot scripts
+    (load_plot_data and get_char_means) and the loading of the room and
+    weather data (load_environment)
+
+With --startup, the import time of the modules is checked instead. The check
+fails (exit code 1) if importing a module loads one of the heavy dependencies
+that are only needed for statistics and plotting, or exceeds the time limit.
+
+Usage:
+    python benchmark.py                             # 3, 10 and 30 builds
+    python benchmark.py --scales 3 100 1000 --repeat 1 --out benchmark.csv
+    python benchmark.py --startup --max-startup 1.0
+
+"""
+
+# Import libraries
+
+import os
+import sys
+import time
+import json
+import shutil
+import subprocess
+import argparse
+import tempfile
+import tracemalloc
+import pandas as pd
+
+import my_functions as func
+import my_environment as myenv
+import synthetic_data
+
+##############################################################################
+
+# Characteristics used by the benchmarked analyses
+CYLINDRICITY = ['Cylindricity_Cyl_4mm_Pos', 'Cylindricity_Cyl_8mm_Neg', 'Cylindricity_Cyl_8mm_Pos',
+                'Cylindricity_Cyl_16mm-Neg', 'Cylindricity_Cyl_16mm_Pos', 'Cylindricity_Cyl_24mm_Neg',
+                'Cylindricity_Cyl_24mm_Pos']
+FLATNESS = ['Flatness_HX{}_Plane{}'.format(i, j) for i in [1, 2] for j in range(1, 7)]
+
+# Modules checked for startup time, and dependencies they must not load on import
+STARTUP_MODULES = ['my_functions', 'my_plot', 'my_environment', 'my_profiling']
+HEAVY_MODULES = ['scipy', 'seaborn', 'matplotlib']
+
+# Code run in a fresh interpreter to time the import of a module
+STARTUP_CODE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+
+def measure(function, repeat=3):
+    """
+    Time a function and measure the peak memory of its allocations.
+
+    Arguments:
+        function = a function without arguments returning the number of rows processed
+        repeat = number of timed runs (default = 3)
+
+    Return:
+        a tuple with the best time in seconds, the peak memory in MB and the number of rows
+
+    """
+    # Timed runs without tracing (tracing slows down allocations)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = function()
+        best = min(best, time.perf_counter() - start)
+
+    # Separate run for the peak memory
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return best, peak / 2**20, rows
+
+
+def get_cases(data):
+    """
+    Get the benchmarked functions for a dataset.
+
+    Arguments:
+        data = folder of the dataset
+
+    Return:
+        a dictionary of functions without arguments returning the number of rows processed
+
+    """
+    # Inputs prepared once, copied where the function modifies its input
+    char_dict = func.make_char_dict(data)
+    planes = {char: char_dict[char] for char in FLATNESS}
+    cylinders = pd.concat([char_dict[char] for char in CYLINDRICITY])
+    layout = func.load_layout(data)
+    n_results = len(pd.read_pickle(os.path.join(data, 'prep_data.pkl')))
+    builds = sorted(layout['build'].unique().tolist())
+
+    def pickle_data():
+        func.pickle_data(data)
+        return n_results
+
+    def get_p_vals():
+        func.get_p_vals(cylinders, 'angle')
+        return len(cylinders)
+
+    def plot_data():
+        func.PLOT_DATA.clear()
+        return len(func.get_char_means(CYLINDRICITY + FLATNESS, folder=data))
+
+    return {'load_results': lambda: len(func.load_results(data)),
+            'pickle_data': pickle_data,
+            'make_char_dict': lambda: sum(len(df) for df in func.make_char_dict(data).values()),
+            'get_planes': lambda: sum(len(df) for df in
+                                      func.get_planes({k: v.copy() for k, v in planes.items()})),
+            'get_p_vals': get_p_vals,
+            'add_laser_angle': lambda: len(func.add_laser_angle(layout.copy())),
+            'plot_data': plot_data,
+            'load_environment': lambda: len(myenv.load_environment(builds, data, cache=False).data)}
+
+
+def check_startup(modules=STARTUP_MODULES, heavy=HEAVY_MODULES, repeat=3):
+    """
+    Measure the import time of modules in fresh interpreters.
+
+    Arguments:
+        modules = list of module names (default = STARTUP_MODULES)
+        heavy = list of dependencies that must not be loaded (default = HEAVY_MODULES)
+        repeat = number of timed imports per module (default = 3)
+
+    Return:
+        a dataframe with the best import time and the heavy dependencies loaded per module
+
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    records = []
+
+    for module in modules:
+        code = STARTUP_CODE.format(module=module, heavy=heavy)
+        runs = [json.loads(subprocess.run([sys.executable, '-c', code], cwd=root, check=True,
+                                          capture_output=True, text=True).stdout)
+                for _ in range(repeat)]
+        records.append({'module': module, 'seconds': min(r['seconds'] for r in runs),
+                        'loaded': ', '.join(runs[0]['loaded'])})
+
+    return pd.DataFrame(records).set_index('module')
+
+
+def run(scales, repeat=3, seed=0):
+    """
+    Run the benchmark for all scales.
+
+    Return:
+        a dataframe with one row per scale and function
+
+    """
+    records = []
+
+    for n_builds in scales:
+        root = tempfile.mkdtemp(prefix='benchmark_')
+        try:
+            data = os.path.join(root, 'data')
+            start = time.perf_counter()
+            synthetic_data.generate(data, n_builds, seed)
+            print("{} builds: generated in {:.1f} s".format(n_builds, time.perf_counter() - start))
+
+            func.pickle_data(data)
+
+            for name, function in get_cases(data).items():
+                seconds, peak, rows = measure(function, repeat)
+                records.append({'builds': n_builds, 'function': name, 'rows': rows,
+                                'seconds': seconds, 'peak_mb': peak})
+                print("    {:<16}{:>10} rows{:>10.3f} s{:>10.1f} MB".format(name, rows, seconds, peak))
+        finally:
+            func.PLOT_DATA.clear()
+            shutil.rmtree(root, ignore_errors=True)
+
+    return pd.DataFrame(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the core functions on synthetic data")
+    parser.add_argument('--scales', nargs='+', type=int, default=[3, 10, 30],
+                        help="numbers of builds (default = 3 10 30)")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timed runs (default = 3)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default = 0)")
+    parser.add_argument('--out', default=None, help="CSV-file for the results (optional)")
+    parser.add_argument('--startup', action='store_true', help="check the import time of the modules instead")
+    parser.add_argument('--max-startup', type=float, default=1.0,
+                        help="maximum import time of a module in seconds (default = 1.0)")
+    args = parser.parse_args(argv)
+
+    # Startup check: no heavy dependencies on import and import times within the limit
+    if args.startup:
+        df = check_startup(repeat=args.repeat)
+        print(df.to_string(float_format='{:.3f}'.format))
+        failed = df[(df['loaded'] != '') | (df['seconds'] > args.max_startup)]
+        if len(failed):
+            print("Startup regression: {}".format(', '.join(failed.index)), file=sys.stderr)
+            return 1
+        return 0
+
+    df = run(args.scales, args.repeat, args.seed)
+
+    if args.out:
+        df.to_csv(args.out, sep=';', index=False, float_format='%.6g')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
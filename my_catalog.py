@@ -0,0 +1,309 @@
+"""
+Module of a catalog of experiments with configurable data roots.
+
+Every experiment is registered with a data root and the names of its results-
+and layout-files. The data of all experiments is loaded once per process into a
+shared cache, and combined into a single store where the rows are partitioned
+by experiment and the characteristic names are categorical. Queries across
+experiments (e.g. all 'Diameter_Cyl_*') are then a single scan of the codes of
+the store rather than one load per experiment.
+
+The catalog can be read from a CSV-file with the columns name;root;results;layout
+(results and layout are optional, roots are relative to the file).
+
+
+Contents:
+    Experiment(name, root, results, layout)     # Data root and files of a single experiment
+    load_experiment(experiment)                 # Load (or get from cache) the results and layout
+    Catalog(experiments=None)                   # Registered experiments and their combined store
+    load_catalog(path=None)                     # Load a catalog from CSV (default = Exp1 in 'data')
+
+"""
+
+# Import libraries
+
+import os
+import fnmatch
+import numpy as np
+import pandas as pd
+
+import my_functions as func
+import my_characteristics as mychars
+
+##############################################################################
+
+# Folder of the data of Exp1 in the repository
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Data of every experiment loaded in this process (see load_experiment)
+#   PS: Keyed by the paths of the files, so experiments sharing files share the cache
+EXPERIMENT_DATA = {}
+
+
+class Experiment:
+    """
+    Data root and files of a single experiment.
+
+    Arguments:
+        name = name of the experiment (e.g. 'Exp1')
+        root = folder containing the data of the experiment
+        results = name of the results-file (default = 'Leirmo_Exp1_ALL.csv')
+        layout = name of the layout-file (default = 'leirmo_exp1_layout.csv')
+
+    """
+
+    def __init__(self, name, root, results='Leirmo_Exp1_ALL.csv', layout='leirmo_exp1_layout.csv'):
+        self.name = name
+        self.root = root
+        self.results = results
+        self.layout = layout
+
+    def __repr__(self):
+        return "Experiment({!r}, {!r})".format(self.name, self.root)
+
+    def path(self, file):
+        """
+        Get the path of a file in the data root.
+
+        """
+        return os.path.join(self.root, file)
+
+    def key(self):
+        """
+        Get the key of the experiment in the shared cache (the paths of its files and pickles).
+
+        """
+        return tuple(os.path.abspath(self.path(f)) for f in [self.results, self.layout])
+
+    def sources(self):
+        """
+        Get the files the data is loaded from, i.e. the pickles if they exist and else the CSV-files.
+
+        """
+        pickles = [self.path('prep_data.pkl'), self.path('layout_data.pkl')]
+        if all(os.path.exists(p) for p in pickles):
+            return pickles
+        return [self.path(self.results), self.path(self.layout)]
+
+
+def load_experiment(experiment):
+    """
+    Load the results and the layout of an experiment. The data is loaded once
+    per process and reloaded only when the files have been modified.
+
+    Arguments:
+        experiment = an Experiment
+
+    Return:
+        a tuple with the results and the layout dataframes
+
+    """
+    key = experiment.key()
+    sources = experiment.sources()
+    mtimes = [os.path.getmtime(p) for p in sources]
+
+    cached = EXPERIMENT_DATA.get(key)
+    if cached is None or cached[0] != mtimes:
+        # Pickled data if available, else the exported files
+        if sources[0].endswith('.pkl'):
+            df = pd.read_pickle(sources[0])
+            layout = pd.read_pickle(sources[1])
+        else:
+            df = func.load_results(experiment.root, experiment.results)
+            layout = func.load_layout(experiment.root, experiment.layout)
+
+        cached = EXPERIMENT_DATA[key] = (mtimes, df, layout)
+
+    return cached[1], cached[2]
+
+
+class Catalog:
+    """
+    Registered experiments and the combined store of their data.
+
+    Arguments:
+        experiments = a list of Experiments (default = None, i.e. empty)
+
+    Attributes:
+        experiments = a dictionary of the registered experiments by name
+
+    """
+
+    def __init__(self, experiments=None):
+        self.experiments = {}
+        self._store = None
+        for experiment in experiments or []:
+            self.add(experiment)
+
+    def __repr__(self):
+        return "Catalog({})".format(list(self.experiments.values()))
+
+    def __getitem__(self, name):
+        return self.experiments[name]
+
+    def __contains__(self, name):
+        return name in self.experiments
+
+    def add(self, experiment):
+        """
+        Add an Experiment to the catalog (replacing any experiment with the same name).
+
+        """
+        self.experiments[experiment.name] = experiment
+        self._store = None
+        return experiment
+
+    def register(self, name, root, results='Leirmo_Exp1_ALL.csv', layout='leirmo_exp1_layout.csv'):
+        """
+        Register an experiment by its data root and files.
+
+        Return:
+            the new Experiment
+
+        """
+        return self.add(Experiment(name, root, results, layout))
+
+    def names(self):
+        """
+        Get the names of the registered experiments.
+
+        """
+        return list(self.experiments)
+
+    def store(self):
+        """
+        Get the combined store of all experiments, rebuilt only when an experiment
+        has been added or its files have been modified.
+
+        Return:
+            a dictionary with
+                results = the results of all experiments with the categorical columns
+                          'experiment' and 'char_name' and the fields of the characteristic
+                          names (rows partitioned by experiment)
+                layout = the layouts of all experiments indexed by experiment and part_name
+                bounds = the first and last row of every experiment in the results
+                codes = the codes of the characteristic names (as a numpy array)
+
+        """
+        data = [(name, load_experiment(e)) for name, e in self.experiments.items()]
+        ids = [id(df) for _, (df, _) in data]
+
+        if self._store is None or self._store['ids'] != ids:
+            # Shared categories of the characteristic names
+            chars = pd.Index(sorted(set().union(*[df['char_name'].unique() for _, (df, _) in data])))
+
+            # One partition per experiment
+            parts, layouts, bounds, start = [], [], {}, 0
+            for name, (df, layout) in data:
+                df = df.assign(char_name=pd.Categorical(df['char_name'], categories=chars))
+                df.insert(0, 'experiment', name)
+                parts.append(df)
+                layouts.append(layout.assign(experiment=name).set_index('experiment', append=True)
+                               .reorder_levels(['experiment', 'part_name']))
+                bounds[name] = (start, start + len(df))
+                start += len(df)
+
+            names = pd.CategoricalDtype(list(self.experiments))
+            results = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+            if parts:
+                results['experiment'] = results['experiment'].astype(names)
+
+                # Fields of the characteristic names as compact columns (measure, feature, size, ...)
+                results = pd.concat([results, mychars.char_fields(results['char_name'])], axis=1)
+
+            self._store = {'ids': ids,
+                           'results': results,
+                           'layout': pd.concat(layouts) if layouts else pd.DataFrame(),
+                           'bounds': bounds,
+                           'codes': results['char_name'].cat.codes.to_numpy() if parts else np.array([])}
+
+        return self._store
+
+    def match_chars(self, patterns):
+        """
+        Get the characteristic names in the store matching one or more patterns (e.g. 'Diameter_Cyl_*').
+
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        chars = self.store()['results']['char_name'].cat.categories
+        return [c for c in chars if any(fnmatch.fnmatchcase(c, p) for p in patterns)]
+
+    def query(self, patterns, columns=None, experiments=None):
+        """
+        Get the measurements of the matching characteristics across experiments.
+
+        Arguments:
+            patterns = a characteristic name or pattern, or a list of these (e.g. 'Diameter_Cyl_*')
+            columns = a list of columns to include (default = None, i.e. all)
+            experiments = a list of experiment names (default = None, i.e. all)
+
+        Return:
+            a dataframe with the measurements in the order of the store
+
+        """
+        store = self.store()
+        df = store['results']
+        chars = self.match_chars(patterns)
+
+        # A single scan of the codes, limited to the partitions of the selected experiments
+        codes = df['char_name'].cat.categories.get_indexer(chars)
+        if experiments is None:
+            rows = np.flatnonzero(np.isin(store['codes'], codes))
+        else:
+            rows = np.concatenate([a + np.flatnonzero(np.isin(store['codes'][a:b], codes))
+                                   for a, b in (store['bounds'][e] for e in experiments)] or [[]])
+            rows = rows.astype(np.int64)
+
+        return df.iloc[rows][columns if columns is not None else df.columns]
+
+    def char_means(self, patterns, columns=None, experiments=None):
+        """
+        Get the mean error of repeated measurements with layout data of the matching characteristics.
+
+        Arguments:
+            patterns = a characteristic name or pattern, or a list of these (e.g. 'Diameter_Cyl_*')
+            columns = a list of columns to include (default = None, i.e. all)
+            experiments = a list of experiment names (default = None, i.e. all)
+
+        Return:
+            a dataframe indexed by part_name with the columns 'experiment', 'char' and 'error' and the layout data
+
+        """
+        df = self.query(patterns, ['experiment', 'char_name', 'part_name', 'error'], experiments)
+
+        # Mean of the repeated measurements in a single groupby, joined with the layouts
+        means = df.groupby(['experiment', 'char_name', 'part_name'], observed=True)['error'].mean()
+        means = means.reset_index(level='char_name').rename(columns={'char_name': 'char'})
+        means = means.join(self.store()['layout']).reset_index(level='experiment')
+
+        return means[columns] if columns is not None else means
+
+
+def load_catalog(path=None):
+    """
+    Load a catalog of experiments.
+
+    Arguments:
+        path = a CSV-file with the columns name;root;results;layout (default = None, i.e.
+               only 'Exp1' with the data of the repository)
+
+    Return:
+        a Catalog
+
+    """
+    catalog = Catalog()
+
+    if path is None:
+        catalog.register('Exp1', DATA_DIR)
+        return catalog
+
+    # Roots relative to the catalog file
+    df = pd.read_csv(path, sep=';', dtype=str).fillna('')
+    base = os.path.dirname(os.path.abspath(path))
+    for row in df.to_dict('records'):
+        files = {k: row[k] for k in ['results', 'layout'] if row.get(k)}
+        catalog.register(row['name'], os.path.join(base, row['root']), **files)
+
+    return catalog
@@ -0,0 +1,340 @@
+"""
+Module of the registry of characteristics measured in the experiments.
+
+The registry is parsed from "data_description.txt", where every line holds the
+name of a characteristic, its description and an optional note, e.g.
+    Diameter_Cyl_4mm_Neg    =   Diameter for concave cylinder of 4 mm   (NB! Invalid!)
+
+Notes marking a characteristic as invalid or questionable give its validity;
+other notes (e.g. naming errors) are kept but do not affect the validity.
+
+
+Contents:
+    load_registry(path=None)                    # Parse "data_description.txt" into a dataframe
+    get_chars(pattern=None, validity=...)       # Names of registered characteristics by pattern and validity
+    get_validity(chars, path=None)              # Validity of characteristic names ('unknown' if not registered)
+    split_by_validity(df, exclude=...)          # Split rows of results into kept and excluded rows
+    parse_char_name(name)                       # Decompose a characteristic name into its fields
+    feature_key(name)                           # Key of the feature of a characteristic (e.g. 'Cyl_16mm_Neg')
+    parse_chars(names)                          # Fields of several names as compact categorical columns
+    char_fields(chars)                          # Fields of every row of a column of names
+    add_char_fields(df, column='char_name')     # Add the fields as columns to a dataframe
+    select_chars(names=None, **criteria)        # Names matching criteria on the fields (e.g. size >= 16)
+
+"""
+
+# Import libraries
+
+import os
+import re
+import fnmatch
+import pandas as pd
+
+##############################################################################
+
+# Default location of the description of the characteristics
+DESCRIPTION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'data_description.txt')
+
+# Levels of validity (in order) and the notes marking them
+VALIDITY = ['valid', 'questionable', 'invalid', 'unknown']
+NOTES = {'invalid': re.compile(r'invalid', re.I),
+         'questionable': re.compile(r'questionable', re.I)}
+
+# Validity levels excluded when exclusion is requested without levels
+EXCLUDE = ['invalid', 'questionable']
+
+# Parsed registries (see load_registry)
+REGISTRIES = {}
+
+# Fields of a characteristic name, e.g. 'Position_Cyl_16mm_Neg.X':
+#   measure = 'Position', feature = 'Cyl', feature_index = 0, size = 16.0, polarity = 'Neg',
+#   sub_index = NaN, axis = 'X'
+FIELDS = ['measure', 'feature', 'feature_index', 'size', 'polarity', 'sub_index', 'axis']
+
+# Features named differently in the characteristic names
+#   PS: CC1 is the group of coaxial cylinders (the pair of cylinders is given by the sub-index)
+FEATURES = {'CC': 'Cyl'}
+
+# Parsed names (see parse_chars)
+PARSED = {}
+
+
+def load_registry(path=None):
+    """
+    Parse the description of the characteristics. The file is parsed once per process.
+
+    Arguments:
+        path = path of the description (default = None, i.e. "data/data_description.txt")
+
+    Return:
+        a dataframe indexed by char_name with the columns 'description', 'note',
+        'validity' (categorical) and 'valid' (boolean), in the order of the file
+
+    """
+    path = os.path.abspath(path or DESCRIPTION)
+
+    if path not in REGISTRIES:
+        records = []
+        with open(path, encoding='latin-1') as f:
+            for line in f:
+                if '=' not in line:
+                    continue
+
+                # Name, description and note in brackets (e.g. "(NB! Invalid!)")
+                name, text = [s.strip() for s in line.split('=', 1)]
+                match = re.search(r'\(NB!\s*([^)]*)\)', text)
+                note = match.group(1).strip() if match else ''
+                description = text[:match.start()].strip() if match else text
+
+                # Invalid takes precedence over questionable
+                validity = 'valid'
+                for level in ['invalid', 'questionable']:
+                    if NOTES[level].search(note):
+                        validity = level
+                        break
+
+                records.append({'char_name': name, 'description': description, 'note': note,
+                                'validity': validity})
+
+        df = pd.DataFrame(records).set_index('char_name')
+        df['validity'] = pd.Categorical(df['validity'], categories=VALIDITY, ordered=True)
+        df['valid'] = df['validity'] == 'valid'
+        REGISTRIES[path] = df
+
+    return REGISTRIES[path]
+
+
+def get_chars(pattern=None, validity=['valid'], path=None):
+    """
+    Get the names of the registered characteristics.
+
+    Arguments:
+        pattern = a pattern of names (e.g. 'Diameter_Cyl_*', default = None, i.e. all)
+        validity = list of validity levels to include (default = ['valid'], None for all)
+        path = path of the description (default = None, i.e. "data/data_description.txt")
+
+    Return:
+        a list of names in the order of the description
+
+    """
+    df = load_registry(path)
+    if validity is not None:
+        df = df[df['validity'].isin(validity)]
+
+    names = list(df.index)
+    if pattern is not None:
+        names = [n for n in names if fnmatch.fnmatchcase(n, pattern)]
+
+    return names
+
+
+def get_validity(chars, path=None):
+    """
+    Get the validity of characteristic names.
+
+    Arguments:
+        chars = a list, array or series of characteristic names
+        path = path of the description (default = None, i.e. "data/data_description.txt")
+
+    Return:
+        a categorical series of validity levels ('unknown' for names not in the description)
+
+    """
+    validity = load_registry(path)['validity']
+    chars = pd.Series(chars)
+
+    # Look up the unique names only
+    codes, uniques = pd.factorize(chars)
+    levels = validity.reindex(uniques).fillna('unknown').to_numpy()
+
+    return pd.Series(pd.Categorical(levels[codes], categories=VALIDITY, ordered=True), index=chars.index)
+
+
+def split_by_validity(df, exclude=EXCLUDE, path=None):
+    """
+    Split the rows of a dataframe of results by the validity of the characteristics.
+
+    Arguments:
+        df = a dataframe with the column 'char_name'
+        exclude = list of validity levels to exclude (default = ['invalid', 'questionable'])
+        path = path of the description (default = None, i.e. "data/data_description.txt")
+
+    Return:
+        a tuple with the kept rows and the excluded rows
+
+    """
+    mask = get_validity(df['char_name'], path).isin(exclude).to_numpy()
+
+    return df[~mask], df[mask]
+
+
+def parse_char_name(name, description=''):
+    """
+    Decompose a characteristic name into its fields (see FIELDS).
+
+    Arguments:
+        name = name of the characteristic (e.g. 'Diameter_Cone_12_mm_Pos_Low')
+        description = description of the characteristic, used for the polarity of
+                      names without 'Pos' or 'Neg' (default = '')
+
+    Return:
+        a dictionary of the fields (None if not given by the name)
+
+    """
+    fields = dict.fromkeys(FIELDS)
+    fields['feature_index'] = 0
+
+    # Axis component (.X/.Y/.Z and .x/.y/.z)
+    base, _, axis = name.partition('.')
+    if axis.upper() in ['X', 'Y', 'Z']:
+        fields['axis'] = axis.upper()
+    else:
+        base = name
+
+    #   PS: Fix the naming inconsistencies '12_mm' and '16mm-Neg'
+    tokens = base.replace('_mm', 'mm').replace('mm-', 'mm_').split('_')
+
+    # Measure type and feature (e.g. 'Cone_Angle_12mm_Neg' is the angle of a cone)
+    if tokens[:2] == ['Cone', 'Angle']:
+        fields['measure'], feature, tokens = 'Angle', 'Cone', tokens[2:]
+    else:
+        fields['measure'], feature, tokens = tokens[0], tokens[1], tokens[2:]
+
+    match = re.match(r'([A-Za-z]+)(\d*)$', feature)
+    fields['feature'] = FEATURES.get(match.group(1), match.group(1))
+    fields['feature_index'] = int(match.group(2) or 0)
+
+    # Size, polarity and any remaining sub-index (e.g. 'Plane1', '1-4', 'Low')
+    rest = []
+    for token in tokens:
+        size = re.match(r'(\d+(?:\.\d+)?)mm$', token)
+        if size:
+            fields['size'] = float(size.group(1))
+        elif token in ['Pos', 'Neg']:
+            fields['polarity'] = token
+        else:
+            rest.append(token)
+    fields['sub_index'] = '_'.join(rest) or None
+
+    # Polarity from the description (e.g. "Coaxiality between convex cylinders")
+    if fields['polarity'] is None:
+        if re.search(r'\bconvex\b', description, re.I):
+            fields['polarity'] = 'Pos'
+        elif re.search(r'\bconcave\b', description, re.I):
+            fields['polarity'] = 'Neg'
+
+    return fields
+
+
+def feature_key(name):
+    """
+    Get the key of the feature a characteristic is measured on, i.e. the name
+    without the measure and the axis (e.g. 'Cyl_16mm_Neg' for 'Cylindricity_Cyl_16mm-Neg'
+    and 'Position_Cyl_16mm_Neg.X').
+
+    """
+    base, _, axis = name.partition('.')
+    if axis.upper() not in ['X', 'Y', 'Z']:
+        base = name
+
+    tokens = base.replace('_mm', 'mm').replace('mm-', 'mm_').split('_')
+    tokens = ['Cone'] + tokens[2:] if tokens[:2] == ['Cone', 'Angle'] else tokens[1:]
+
+    return '_'.join(tokens)
+
+
+def parse_chars(names, path=None):
+    """
+    Parse several characteristic names. Every name is parsed once per process.
+
+    Arguments:
+        names = a list of unique characteristic names
+        path = path of the description (default = None, i.e. "data/data_description.txt")
+
+    Return:
+        a dataframe indexed by the names with categorical fields, 'feature_index' as int8 and 'size' as float32
+
+    """
+    registry = load_registry(path)['description']
+
+    records = []
+    for name in names:
+        if name not in PARSED:
+            PARSED[name] = parse_char_name(name, registry.get(name, ''))
+        records.append(PARSED[name])
+
+    df = pd.DataFrame(records, index=pd.Index(names, name='char_name'), columns=FIELDS)
+    for col in ['measure', 'feature', 'polarity', 'sub_index', 'axis']:
+        df[col] = df[col].astype('category')
+    df['feature_index'] = df['feature_index'].astype('int8')
+    df['size'] = df['size'].astype('float32')
+
+    return df
+
+
+def char_fields(chars, path=None):
+    """
+    Get the fields of every row of a column of characteristic names, parsing every unique name once.
+
+    Arguments:
+        chars = a series (or list) of characteristic names, possibly categorical
+        path = path of the description (default = None, i.e. "data/data_description.txt")
+
+    Return:
+        a dataframe of fields with the index of chars
+
+    """
+    chars = pd.Series(chars)
+    codes, uniques = pd.factorize(chars)
+
+    #   PS: Taking rows by the codes keeps the categorical columns
+    df = parse_chars(list(uniques), path).iloc[codes]
+    df.index = chars.index
+
+    return df
+
+
+def add_char_fields(df, column='char_name', path=None):
+    """
+    Add the fields of the characteristic names as compact columns to a dataframe.
+
+    Return:
+        a copy of the dataframe with the columns of FIELDS
+
+    """
+    return pd.concat([df, char_fields(df[column], path)], axis=1)
+
+
+def select_chars(names=None, validity=['valid'], path=None, min_size=None, max_size=None, **criteria):
+    """
+    Get the characteristic names with fields matching the criteria, e.g. all
+    convex cylinders of at least 16 mm:
+        select_chars(feature='Cyl', polarity='Pos', min_size=16)
+
+    Arguments:
+        names = list of names to select from (default = None, i.e. the registry)
+        validity = list of validity levels to include (default = ['valid'], None for all)
+        path = path of the description (default = None, i.e. "data/data_description.txt")
+        min_size, max_size = limits of the size in mm (default = None)
+        criteria = fields and the value (or list of values) to match
+
+    Return:
+        a list of names
+
+    """
+    if names is None:
+        names = get_chars(validity=validity, path=path)
+    elif validity is not None:
+        names = [n for n, v in zip(names, get_validity(list(names), path)) if v in validity]
+
+    df = parse_chars(list(names), path)
+    mask = pd.Series(True, index=df.index)
+
+    for field, value in criteria.items():
+        mask &= df[field].isin(value if isinstance(value, (list, tuple, set)) else [value])
+    if min_size is not None:
+        mask &= df['size'] >= min_size
+    if max_size is not None:
+        mask &= df['size'] <= max_size
+
+    return list(df.index[mask.to_numpy()])
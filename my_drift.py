@@ -0,0 +1,400 @@
+"""
+Module of the analysis of drift of the CMM over a measurement campaign.
+
+All characteristics are analysed at once: the measurements are sorted by
+characteristic and time, so that every characteristic is a contiguous block,
+and all windowed statistics are computed from cumulative sums with the block
+boundaries as limits (no loop per characteristic).
+
+The errors also vary with the build, and with the position and rotation of
+the parts. These effects are removed by a fit of every characteristic on the
+layout terms within every build (see my_regression.design_matrix), and the
+changes in level are analysed on the residuals. As the parts of a build are
+measured in the order of their position, a steady drift within a build is
+taken up by the layout terms. The drift is therefore also estimated from the
+differences between the repeated measurements of every part, which are free of
+the effects of the build and the layout.
+
+The timestamps of the CMM are eight minutes late (see load_results), which does
+not affect the drift, as only the relative time is used.
+
+
+Contents:
+    layout_residuals(df, layout)                # Residuals of the errors from a fit on the layout terms within every build
+    sort_measurements(df, layout)               # Sort by characteristic and time, and add residuals and increments
+    rolling_stats(df, window=135)               # Rolling mean and std of the error per characteristic
+    rep_spread(df)                              # Spread of repeated measurements in order of measurement
+    drift_table(df, window=135, ...)            # Drift rate, change point and drift test of every characteristic
+    analyse_drift(folder='data', chars=None)    # Drift table of the pickled results
+
+"""
+
+# Import libraries
+
+import os
+import numpy as np
+import pandas as pd
+
+import my_functions as func
+import my_regression as myreg
+
+##############################################################################
+
+# Number of measurements of a characteristic in one build (45 parts measured three times)
+BUILD_WINDOW = 135
+
+
+def layout_residuals(df, layout, **kwargs):
+    """
+    Get the residuals of the errors from a fit of every characteristic on the layout
+    terms (positions and rotation of the parts) within every build.
+
+    Arguments:
+        df = a dataframe of results with 'char_name', 'part_name', 'rep' and 'error'
+        layout = a dataframe of the layout indexed by part_name (see load_layout)
+        kwargs = arguments of my_regression.design_matrix (default = degree 2 and the rotation)
+
+    Return:
+        an array of the residuals of the rows of df (NaN where the error is missing or a
+        characteristic has too few measurements in a build for the fit)
+
+    """
+    kwargs = dict({'laser_angle': False, 'builds': False}, **kwargs)
+
+    # One row per measurement run (part and repetition), one column per characteristic
+    Y = df.pivot_table(index=['part_name', 'rep'], columns='char_name', values='error', observed=True)
+    parts = Y.index.get_level_values('part_name')
+    builds = layout['build'].reindex(parts).to_numpy()
+    fitted = np.full(Y.shape, np.nan)
+
+    # Fit all characteristics of a build at once and predict every run
+    for b in pd.unique(builds):
+        rows = np.flatnonzero(builds == b)
+        X = myreg.design_matrix(layout.loc[parts[rows].unique()], **kwargs).reindex(parts[rows])\
+            .set_axis(Y.index[rows])
+        coef = myreg.fit(Y.iloc[rows], X)['coef']
+        fitted[rows] = X.to_numpy() @ coef.to_numpy().T
+
+    # Residual of every row (by the run and the characteristic)
+    run = Y.index.get_indexer(pd.MultiIndex.from_arrays([df['part_name'], df['rep']]))
+    char = Y.columns.get_indexer(df['char_name'])
+    return df['error'].to_numpy(dtype=float) - fitted[run, char]
+
+
+def _previous(parts):
+    """
+    Get the row of the previous measurement of the same part for every row (-1 for the first),
+    of rows sorted by time within every part.
+
+    """
+    order = np.argsort(parts, kind='stable')
+    same = parts[order[1:]] == parts[order[:-1]]
+    previous = np.full(len(parts), -1)
+    previous[order[1:][same]] = order[:-1][same]
+
+    return previous
+
+
+def sort_measurements(df, layout, **kwargs):
+    """
+    Sort measurements by characteristic and time, and add the order of the measurement runs,
+    the residuals of the errors from the layout terms, and the increments within every part.
+
+    Arguments:
+        df = a dataframe of results with 'char_name', 'part_name', 'rep', 'time' and 'error'
+        layout = a dataframe of the layout indexed by part_name (see load_layout)
+        kwargs = arguments of my_regression.design_matrix (see layout_residuals)
+
+    Return:
+        a dataframe sorted by characteristic and time with the columns
+            char, part_name, rep, time, error
+            build               = build of the part
+            hours               = hours since the first measurement
+            order               = rank of the run of the part and repetition by its first measurement
+            residual            = residual of the error from the layout terms (see layout_residuals)
+            increment           = change of the residual since the previous measurement of the
+                                  characteristic on the part (NaN for the first)
+            rate                = increment per hour since the previous measurement [mm/hour]
+
+    """
+    residual = layout_residuals(df, layout, **kwargs)
+
+    df = df[['char_name', 'part_name', 'rep', 'time', 'error']].rename(columns={'char_name': 'char'})
+    df = df.assign(char=df['char'].astype('category'), build=layout['build'].reindex(df['part_name']).to_numpy(),
+                   residual=residual)
+
+    # Order of the measurement runs (part and repetition) by their first timestamp
+    run = df.groupby(['part_name', 'rep'], observed=True)['time'].transform('min')
+    df['order'] = run.rank(method='dense').astype(np.int32)
+    df['hours'] = (df['time'] - df['time'].min()) / pd.Timedelta(hours=1)
+    df = df.sort_values(['char', 'time'], kind='stable').reset_index(drop=True)
+
+    # Increments since the previous measurement of the same characteristic and part
+    previous = _previous(df.groupby(['char', 'part_name'], observed=True).ngroup().to_numpy())
+    first = previous < 0
+    residual, hours = df['residual'].to_numpy(), df['hours'].to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['increment'] = np.where(first, np.nan, residual - residual[previous])
+        df['rate'] = df['increment'] / np.where(first, np.nan, hours - hours[previous])
+
+    return df
+
+
+def _blocks(codes):
+    """
+    Get the start of the block of every row, and the start and size of every block, of sorted codes.
+
+    """
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(codes)])
+    return np.repeat(starts, sizes), starts, sizes
+
+
+def _rolling(values, row_start, window):
+    """
+    Rolling sum, sum of squares and count of the last window values, limited to
+    the block of every row (missing values are not counted).
+
+    """
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0)
+
+    cs = np.r_[0, np.cumsum(values)]
+    cs2 = np.r_[0, np.cumsum(values ** 2)]
+    cn = np.r_[0, np.cumsum(valid)]
+    i = np.arange(len(values))
+    lo = np.maximum(i - window + 1, row_start)
+
+    return cs[i + 1] - cs[lo], cs2[i + 1] - cs2[lo], cn[i + 1] - cn[lo]
+
+
+def rolling_stats(df, window=BUILD_WINDOW, column='error'):
+    """
+    Rolling mean and standard deviation of every characteristic in order of measurement.
+
+    Arguments:
+        df = a dataframe from sort_measurements
+        window = number of measurements in the window (default = 135, i.e. one build of 45 parts
+                 measured three times)
+        column = column of the values (default = 'error', e.g. 'residual')
+
+    Return:
+        a copy of the dataframe with the columns 'rolling_mean', 'rolling_std' and 'rolling_n'
+        (the number of values in the window, missing values excluded)
+
+    """
+    values = df[column].to_numpy(dtype=float)
+    row_start, _, _ = _blocks(df['char'].cat.codes.to_numpy())
+
+    s, s2, n = _rolling(values, row_start, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s / n
+        std = np.sqrt(np.maximum(s2 - n * mean ** 2, 0) / (n - 1))
+
+    return df.assign(rolling_mean=mean, rolling_std=std, rolling_n=n)
+
+
+def rep_spread(df):
+    """
+    Spread (max - min) of the repeated measurements of every characteristic and
+    part, sorted by characteristic and the time of the first measurement.
+
+    Arguments:
+        df = a dataframe from sort_measurements
+
+    Return:
+        a dataframe with 'char', 'part_name', 'time', 'hours', 'order' and 'spread'
+
+    """
+    spread = df.groupby(['char', 'part_name'], observed=True).agg(time=('time', 'min'), hours=('hours', 'min'),
+                                                                   order=('order', 'min'), lo=('error', 'min'),
+                                                                   hi=('error', 'max'))
+    spread['spread'] = spread['hi'] - spread['lo']
+
+    return spread.drop(columns=['lo', 'hi']).reset_index().sort_values(['char', 'time'], kind='stable')\
+        .reset_index(drop=True)
+
+
+def _block_trend(x, y, codes, n_blocks):
+    """
+    Slope and correlation of y on x within every block (from sums by bincount).
+
+    """
+    n = np.bincount(codes, minlength=n_blocks).astype(float)
+    sx = np.bincount(codes, x, n_blocks)
+    sy = np.bincount(codes, y, n_blocks)
+    sxx = np.bincount(codes, x * x, n_blocks)
+    syy = np.bincount(codes, y * y, n_blocks)
+    sxy = np.bincount(codes, x * y, n_blocks)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vx = n * sxx - sx ** 2
+        vy = n * syy - sy ** 2
+        slope = (n * sxy - sx * sy) / vx
+        corr = (n * sxy - sx * sy) / np.sqrt(vx * vy)
+
+    return slope, corr
+
+
+def _cusum(z, row_start, starts, codes, n_blocks):
+    """
+    Absolute cumulative sum of z within every block, and its maximum in every block (NaN for empty blocks).
+
+    """
+    cs = np.cumsum(z)
+    cusum = np.abs(cs - np.r_[0, cs][row_start])
+
+    maximum = np.full(n_blocks, np.nan)
+    maximum[codes[starts]] = np.maximum.reduceat(cusum, starts)
+
+    return cusum, maximum
+
+
+def drift_table(df, window=BUILD_WINDOW, permutations=199, alpha=0.05, seed=0):
+    """
+    Summarise the drift of every characteristic over the measurement campaign.
+
+    Two kinds of drift are tested by CUSUM statistics, i.e. the largest deviation
+    from zero of the cumulative sum of standardised values in order of measurement:
+        - changes in level, from the residuals of the layout terms within every build,
+          tested against random permutations of the parts within every build
+        - a steady drift, from the increments between the repeated measurements of
+          every part, tested against random permutations of the repetitions of every part
+    The permutations keep the dependence of the measurements of a part. Measurements
+    without a residual are ignored.
+
+    Arguments:
+        df = a dataframe from sort_measurements
+        window = number of measurements in the rolling window (default = 135, i.e. one build)
+        permutations = number of permutations of the tests (default = 199)
+        alpha = significance level of the tests (default = 0.05)
+        seed = seed of the permutations (default = 0)
+
+    Return:
+        a dataframe indexed by characteristic with
+            n                   = number of measurements
+            slope_per_hour      = drift rate from the increments within the parts [mm/hour]
+            corr_time           = correlation of the residuals with time
+            rolling_range       = range of the rolling mean of the residuals divided by their std
+            spread_slope        = slope of the spread of repeated measurements with time [mm/hour]
+            cusum               = normalised CUSUM statistic of the residuals
+            p_change            = p-value of the CUSUM statistic of the residuals (permutations)
+            change_time         = time of the change point
+            change_order        = run order of the change point
+            change_point        = True if p_change < alpha
+            drift_cusum         = normalised CUSUM statistic of the increments
+            p_drift             = p-value of the CUSUM statistic of the increments (permutations)
+            drift               = True if p_drift < alpha
+
+    """
+    df = df[df['residual'].notna()].reset_index(drop=True)
+    codes = df['char'].cat.codes.to_numpy()
+    n_blocks = len(df['char'].cat.categories)
+    residual = df['residual'].to_numpy(dtype=float)
+    hours = df['hours'].to_numpy(dtype=float)
+    row_start, starts, _ = _blocks(codes)
+
+    # Trend of the residuals with time
+    _, corr = _block_trend(hours, residual, codes, n_blocks)
+
+    # Standardised residuals within every characteristic
+    n = np.bincount(codes, minlength=n_blocks)
+    std = np.sqrt(np.bincount(codes, residual ** 2, n_blocks) / np.maximum(n - 1, 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.nan_to_num(residual / std[codes])
+
+    # Range of the rolling mean relative to the std of the residuals
+    rolling = rolling_stats(df, window, 'residual')
+    full = rolling['rolling_n'].to_numpy() == np.minimum(window, n[codes])
+    rolling = rolling['rolling_mean']
+    rmax = rolling[full].groupby(codes[full]).max().reindex(range(n_blocks)).to_numpy()
+    rmin = rolling[full].groupby(codes[full]).min().reindex(range(n_blocks)).to_numpy()
+
+    # CUSUM of the residuals within every characteristic
+    cusum, stat = _cusum(z, row_start, starts, codes, n_blocks)
+    peak = pd.Series(cusum).groupby(codes).idxmax().reindex(range(n_blocks)).fillna(0).astype(int).to_numpy()
+
+    # Increments within the parts (recomputed from the residuals, as rows may have been removed)
+    parts = df.groupby(['char', 'part_name'], observed=True).ngroup().to_numpy()
+    previous = _previous(parts)
+    first = previous < 0
+    increment = np.where(first, 0, residual - residual[previous])
+    elapsed = np.where(first, 0, hours - hours[previous])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = np.bincount(codes, increment, n_blocks) / np.bincount(codes, elapsed, n_blocks)
+        scale = np.sqrt(np.bincount(codes, increment ** 2, n_blocks) / np.bincount(codes, ~first, n_blocks))
+        drift_z = np.nan_to_num(increment / scale[codes])
+
+    # CUSUM of the increments within every characteristic
+    _, drift_stat = _cusum(drift_z, row_start, starts, codes, n_blocks)
+
+    # Permutations of the parts within every build (the residuals of the parts in random order, with
+    # the repetitions of every part in their order of measurement), and of the repetitions of every part
+    rng = np.random.default_rng(seed)
+    groups = df.groupby(['char', 'build'], observed=True).ngroup().to_numpy()
+    slots = np.argsort(groups, kind='stable')
+    rep_slots = np.argsort(parts, kind='stable')
+    rows = np.arange(len(z))
+    exceed = np.zeros(n_blocks)
+    drift_exceed = np.zeros(n_blocks)
+    shuffled = np.empty_like(z)
+    for p in range(permutations):
+        shuffled[slots] = z[np.lexsort((rows, rng.random(parts.max() + 1)[parts], groups))]
+        exceed += _cusum(shuffled, row_start, starts, codes, n_blocks)[1] >= stat - 1e-12
+
+        shuffled[rep_slots] = residual[np.lexsort((rng.random(len(z)), parts))]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shuffled = np.nan_to_num(np.where(first, 0, shuffled - shuffled[previous]) / scale[codes])
+        drift_exceed += _cusum(shuffled, row_start, starts, codes, n_blocks)[1] >= drift_stat - 1e-12
+    p_change = (exceed + 1) / (permutations + 1)
+    p_drift = (drift_exceed + 1) / (permutations + 1)
+
+    # Trend of the spread of repeated measurements with time
+    spread = rep_spread(df)
+    spread_slope, _ = _block_trend(spread['hours'].to_numpy(dtype=float), spread['spread'].to_numpy(dtype=float),
+                                   spread['char'].cat.codes.to_numpy(), n_blocks)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rolling_range = (rmax - rmin) / std
+        stat = stat / np.sqrt(n)
+        drift_stat = drift_stat / np.sqrt(n)
+
+    table = pd.DataFrame({'n': n,
+                          'slope_per_hour': rate,
+                          'corr_time': corr,
+                          'rolling_range': rolling_range,
+                          'spread_slope': spread_slope,
+                          'cusum': stat,
+                          'p_change': p_change,
+                          'change_time': df['time'].to_numpy()[peak],
+                          'change_order': df['order'].to_numpy()[peak],
+                          'change_point': p_change < alpha,
+                          'drift_cusum': drift_stat,
+                          'p_drift': p_drift,
+                          'drift': p_drift < alpha},
+                         index=pd.Index(df['char'].cat.categories, name='char'))
+
+    return table[table['n'] > 0]
+
+
+def analyse_drift(folder='data', chars=None, **kwargs):
+    """
+    Get the drift table of the pickled results of an experiment.
+
+    Arguments:
+        folder = folder containing the pickled data (default = 'data')
+        chars = a list of characteristic names (default = None, i.e. all)
+        kwargs = arguments of drift_table (window, permutations, alpha, seed)
+
+    Return:
+        the dataframe of drift_table, sorted by the CUSUM statistic (largest first)
+
+    """
+    df = func.load_plot_data(folder)['results']
+    if chars is not None:
+        df = df[df['char_name'].isin(chars)]
+
+    layout = pd.read_pickle(os.path.join(folder, 'layout_data.pkl'))
+    table = drift_table(sort_measurements(df, layout), **kwargs)
+
+    return table.sort_values('cusum', ascending=False)
@@ -0,0 +1,582 @@
+"""
+Module of functions for the environmental data of the experiments, i.e. the
+room sensor logs (P395 logger) and the weather data.
+
+
+Contents:
+    parse_room_data(source, build)              # Parse a room data log into a compact dataframe
+    load_room_data(build)                       # Load the room data of a single build
+    load_weather_data()                         # Load the weather data
+    EnvironmentStore(data, weather)             # Time-indexed store with per-build aggregates
+    load_environment(builds=[1, 2, 3])          # Load (or unpickle) the store for all builds
+    get_readings(store, times, window=None)     # Nearest or window-averaged readings at given times
+    attach_environment(df, store, ...)          # Add sensor readings to every measurement row
+    get_build_environment(store, layout=None)   # Add per-build aggregates to every build (or part)
+    RoomDataTail(path, build, store)            # Read newly appended rows of a room data log
+    follow(tails, interval=60)                  # Poll several room data logs during running builds
+
+"""
+
+# Import libraries
+
+import io
+import os
+import time
+import pickle
+import numpy as np
+import pandas as pd
+
+##############################################################################
+
+# Column names of the room data (in the order of the P395 export)
+ROOM_COLUMNS = ['record', 'time', 'temperature', 'humidity', 'dew_point']
+
+# Columns holding sensor values
+ROOM_VALUES = ['temperature', 'humidity', 'dew_point']
+
+# Column names of the weather data
+WEATHER_COLUMNS = ['date', 'min_temperature', 'max_temperature', 'mean_temperature', 'precipitation', 'build']
+
+# Default windows for rolling aggregates
+WINDOWS = ['15min', '60min']
+
+# The timestamps of the CMM are eight minutes late (see my_functions.load_results)
+CMM_TIME_OFFSET = pd.Timedelta('8min')
+
+
+def parse_room_data(source, build, header=True):
+    """
+    Parse a room data log into a compact dataframe.
+
+    Arguments:
+        source = path or file-like object with tab-separated P395 data
+        build = build number used to tag the rows
+        header = whether the source starts with the header line (default = True)
+
+    Return:
+        a dataframe with 'build' and 'time' as index and float32 sensor values
+
+    """
+    # Read only the defined columns with explicit datatypes
+    df = pd.read_csv(source, sep='\t', encoding='latin-1', header=0 if header else None,
+                     usecols=range(5), names=ROOM_COLUMNS,
+                     dtype={'record': np.int32, 'time': str, 'temperature': np.float32,
+                            'humidity': np.float32, 'dew_point': np.float32})
+
+    # Parse timestamps with the explicit format of the logger (e.g. "02.06.2020 10:00")
+    df['time'] = pd.to_datetime(df['time'], format='%d.%m.%Y %H:%M')
+
+    # Tag the rows with the build number
+    df.insert(0, 'build', np.int8(build))
+
+    # record      = Record number of the logger   (Increasing for every reading)
+    # time        = Timestamp                     (One reading per minute)
+    # temperature = Room temperature              ([°C])
+    # humidity    = Relative humidity             ([%rh])
+    # dew_point   = Dew point                     ([°C])
+
+    return df.set_index(['build', 'time'])
+
+
+def load_room_data(build, folder='data'):
+    """
+    Load the room data of a single build.
+
+    Arguments:
+        build = build number (1-3)
+        folder = folder containing the files (default = 'data')
+
+    Return:
+        a dataframe (see parse_room_data)
+
+    """
+    return parse_room_data(os.path.join(folder, 'Room_data_Build_{}.csv'.format(build)), build)
+
+
+def load_weather_data(folder='data'):
+    """
+    Load the daily weather data.
+
+    Arguments:
+        folder = folder containing the file (default = 'data')
+
+    Return:
+        a dataframe with 'date' as index, float32 weather values and the
+        build number (0 when no build was running)
+
+    """
+    path = os.path.join(folder, 'Weather_data.csv')
+
+    # Read with fixed column names regardless of the original header
+    df = pd.read_csv(path, sep=';', encoding='utf-8-sig', header=0, names=WEATHER_COLUMNS,
+                     dtype={'date': str, 'build': str})
+
+    # Parse dates with explicit format and use compact datatypes
+    df['date'] = pd.to_datetime(df['date'], format='%d.%m.%Y')
+    df['build'] = pd.to_numeric(df['build'].replace('NONE', '0')).astype(np.int8)
+    for col in WEATHER_COLUMNS[1:5]:
+        df[col] = df[col].astype(np.float32)
+
+    return df.set_index('date')
+
+
+class EnvironmentStore:
+    """
+    Time-indexed store of room sensor data tagged by build.
+
+    The readings (and rolling means) of every build are kept as a list of
+    chunks, so that appending new readings only adds a chunk at the tail. The
+    chunks are combined into single dataframes when 'data' or 'rolling' is
+    accessed after an append.
+
+    Attributes:
+        data = dataframe with 'build' and 'time' as index and float32 sensor values
+        weather = dataframe with the daily weather data (or None)
+        windows = list of windows for the rolling aggregates
+        summary = dataframe with mean, min and max of every sensor value per build
+        rolling = dictionary of rolling means with window as key
+
+    """
+
+    def __init__(self, data, weather=None, windows=WINDOWS):
+        self.weather = weather
+        self.windows = list(windows)
+        self._chunks = {build: [df] for build, df in data.sort_index().groupby(level='build')}
+        self.update_aggregates()
+
+    def __getstate__(self):
+        # Pickle the combined dataframes only
+        state = dict(self.__dict__)
+        state['_chunks'] = {b: [df] for b, df in self.data.groupby(level='build')}
+        state['_rolling_chunks'] = {w: {b: [df] for b, df in r.groupby(level='build')}
+                                    for w, r in self.rolling.items()}
+        state['_data'] = state['_rolling_data'] = None
+        return state
+
+    def __setstate__(self, state):
+        # Stores pickled before the chunks were introduced hold the combined data only
+        if '_chunks' not in state:
+            self.__init__(state['data'], state.get('weather'), state.get('windows', WINDOWS))
+        else:
+            self.__dict__.update(state)
+
+    @property
+    def data(self):
+        # Combine the chunks of all builds (once after every append)
+        if self._data is None:
+            for build, chunks in self._chunks.items():
+                if len(chunks) > 1:
+                    self._chunks[build] = [pd.concat(chunks)]
+            self._data = pd.concat([self._chunks[b][0] for b in sorted(self._chunks)])
+        return self._data
+
+    @property
+    def rolling(self):
+        # Combine the chunks of the rolling means of all builds (once after every append)
+        if self._rolling_data is None:
+            self._rolling_data = {}
+            for window, builds in self._rolling_chunks.items():
+                for build, chunks in builds.items():
+                    if len(chunks) > 1:
+                        builds[build] = [pd.concat(chunks)]
+                self._rolling_data[window] = pd.concat([builds[b][0] for b in sorted(builds)])
+        return self._rolling_data
+
+    def update_aggregates(self):
+        """
+        Recompute the per-build summary and rolling aggregates.
+
+        """
+        self._data = self._rolling_data = None
+        self._stats = self._get_stats(self.data)
+        self._make_summary()
+
+        # Time-based rolling means within every build (the chunks are combined by self.data)
+        self._rolling_chunks = {window: {build: [self._rolling(chunks[0], window)]
+                                         for build, chunks in self._chunks.items()}
+                                for window in self.windows}
+
+    @staticmethod
+    def _get_stats(data):
+        # Additive statistics per build (can be combined when appending readings)
+        grouped = data[ROOM_VALUES].astype(np.float64).groupby(level='build')
+        times = data.index.get_level_values('time').to_series(index=data.index).groupby(level='build')
+        return {'count': grouped.size(), 'sum': grouped.sum(), 'min': grouped.min(),
+                'max': grouped.max(), 'start': times.min(), 'end': times.max()}
+
+    def _make_summary(self):
+        # Mean, min and max of every sensor value, as well as the time span of every build
+        stats = self._stats
+        self.summary = pd.concat({'mean': stats['sum'].div(stats['count'], axis=0),
+                                  'min': stats['min'], 'max': stats['max']}, axis=1)
+        self.summary = self.summary.swaplevel(axis=1)[[(c, a) for c in ROOM_VALUES
+                                                       for a in ['mean', 'min', 'max']]].astype(np.float32)
+        self.summary['start'] = stats['start']
+        self.summary['end'] = stats['end']
+
+    @staticmethod
+    def _rolling(data, window):
+        # Rolling mean within every build with the same index as the data
+        result = []
+        for build, df in data.groupby(level='build'):
+            df = df.droplevel('build')[ROOM_VALUES].rolling(window).mean().astype(np.float32)
+            result.append(pd.concat({build: df}, names=['build']))
+        return pd.concat(result)
+
+    def _recent(self, build, since):
+        # Readings of a build at or after a time, taken from the last chunks
+        recent = []
+        for chunk in reversed(self._chunks.get(build, [])):
+            #   PS: The chunks are sorted by time, so the start is found by a binary search
+            i = chunk.index.get_level_values('time').searchsorted(since)
+            part = chunk.iloc[i:]
+
+            # Rebuild the index, as a slice keeps the levels of the whole chunk (slow to concatenate)
+            part.index = pd.MultiIndex.from_arrays([part.index.get_level_values(n) for n in part.index.names])
+            recent.insert(0, part)
+            if i > 0:
+                break
+        return recent
+
+    def last_time(self, build):
+        """
+        Return the time of the last reading of a build (None if the build is not in the store).
+
+        """
+        end = self._stats['end']
+        return end[build] if build in end.index else None
+
+    def append(self, df):
+        """
+        Append new readings and update the aggregates incrementally.
+
+        The new readings are added as chunks at the tail of every build, and only
+        the new readings (and the preceding readings within the largest rolling
+        window) are processed, so appending a few rows is cheap. Readings at or
+        before the last reading of their build are ignored.
+
+        Arguments:
+            df = a dataframe from parse_room_data
+
+        """
+        # Keep only the readings later than the last reading of every build
+        last = self._stats['end'].reindex(df.index.get_level_values('build')).to_numpy()
+        times = df.index.get_level_values('time').to_numpy()
+        df = df[pd.isna(last) | (times > last)]
+
+        if len(df) == 0:
+            return
+
+        df = df.sort_index()
+        self._data = self._rolling_data = None
+
+        # Combine the existing and the new statistics
+        old, new = self._stats, self._get_stats(df)
+        self._stats = {}
+        for key, how in [('count', 'sum'), ('sum', 'sum'), ('min', 'min'),
+                         ('max', 'max'), ('start', 'min'), ('end', 'max')]:
+            self._stats[key] = pd.concat([old[key], new[key]]).groupby(level='build').agg(how)
+        self._make_summary()
+
+        for build, rows in df.groupby(level='build'):
+            start = new['start'][build]
+
+            # Rolling means of the new readings (from the preceding readings within the window)
+            for window in self.windows:
+                recent = self._recent(build, start - pd.Timedelta(window))
+                rolled = self._rolling(pd.concat(recent + [rows]), window)
+                rolled = rolled[rolled.index.get_level_values('time') >= start]
+                self._rolling_chunks.setdefault(window, {}).setdefault(build, []).append(rolled)
+
+            self._chunks.setdefault(build, []).append(rows)
+
+    def builds(self):
+        """
+        Return a sorted list of the builds in the store.
+
+        """
+        return sorted(self.data.index.get_level_values('build').unique())
+
+    def get_build(self, build, window=None):
+        """
+        Get the sensor values (or a rolling aggregate) of a single build.
+
+        Arguments:
+            build = build number
+            window = rolling window (default = None, i.e. the raw values)
+
+        Return:
+            a dataframe with 'time' as index
+
+        """
+        df = self.data if window is None else self.rolling[window]
+        return df.xs(build, level='build')
+
+    def save(self, path):
+        """
+        Pickle the store (including aggregates) to the specified path.
+
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """
+        Load a pickled store from the specified path.
+
+        """
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def load_environment(builds=[1, 2, 3], folder='data', cache=True):
+    """
+    Load the room data of all builds and the weather data into a single store.
+
+    The parsed store, including the aggregates, is pickled to 'environment.pkl'
+    and reused as long as it is newer than all of the source files.
+
+    Arguments:
+        builds = list of build numbers (default = [1, 2, 3])
+        folder = folder containing the files (default = 'data')
+        cache = use and update the pickled store (default = True)
+
+    Return:
+        an EnvironmentStore
+
+    """
+    path = os.path.join(folder, 'environment.pkl')
+    sources = [os.path.join(folder, 'Room_data_Build_{}.csv'.format(b)) for b in builds]
+    sources.append(os.path.join(folder, 'Weather_data.csv'))
+
+    # Reuse the pickled store if it is up to date and contains the requested builds
+    if cache and os.path.exists(path) and \
+            os.path.getmtime(path) >= max(os.path.getmtime(s) for s in sources):
+        store = EnvironmentStore.load(path)
+        if store.builds() == sorted(builds):
+            return store
+
+    # Parse all sources
+    data = pd.concat([load_room_data(b, folder) for b in builds])
+    store = EnvironmentStore(data, load_weather_data(folder))
+
+    if cache:
+        store.save(path)
+
+    return store
+
+
+def get_readings(store, times, window=None, tolerance='5min', build=None):
+    """
+    Get the sensor readings at the given times by an as-of lookup.
+
+    The readings are found with a binary search in the sorted timeline, and
+    window averages are calculated from cumulative sums, so the lookup is
+    O(n log m) for n times and m readings.
+
+    Arguments:
+        store = an EnvironmentStore
+        times = array-like of timestamps
+        window = width of a centered averaging window, e.g. '30min' (default = None, i.e. nearest reading)
+        tolerance = maximum distance to the nearest reading (default = '5min')
+        build = only use the readings of this build (default = None, i.e. all readings)
+
+    Return:
+        a dataframe of float32 sensor values (NaN where no reading is found) with one row per time
+
+    """
+    data = store.data if build is None else store.data.xs(build, level='build', drop_level=False)
+
+    # Flatten to a single sorted timeline
+    t_ref = data.index.get_level_values('time').to_numpy(dtype='datetime64[ns]').view(np.int64)
+    order = np.argsort(t_ref, kind='stable')
+    t_ref = t_ref[order]
+    values = data[ROOM_VALUES].to_numpy(dtype=np.float64)[order]
+
+    # Convert the query times to integers (NaT is handled as missing)
+    times = pd.DatetimeIndex(times)
+    t = times.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    missing = np.asarray(times.isna())
+
+    result = np.full((len(t), len(ROOM_VALUES)), np.nan)
+
+    if len(t_ref) == 0:
+        return pd.DataFrame(result.astype(np.float32), columns=ROOM_VALUES)
+
+    if window is None:
+        # Find the nearest reading on either side
+        right = np.clip(np.searchsorted(t_ref, t, side='left'), 0, len(t_ref) - 1)
+        left = np.clip(right - 1, 0, len(t_ref) - 1)
+        nearest = np.where(np.abs(t_ref[left] - t) <= np.abs(t_ref[right] - t), left, right)
+
+        # Only accept readings within the tolerance
+        ok = (np.abs(t_ref[nearest] - t) <= pd.Timedelta(tolerance).value) & ~missing
+        result[ok] = values[nearest[ok]]
+    else:
+        # Average all readings within the window using cumulative sums
+        half = pd.Timedelta(window).value // 2
+        cumsum = np.vstack([np.zeros(len(ROOM_VALUES)), np.cumsum(values, axis=0)])
+        left = np.searchsorted(t_ref, t - half, side='left')
+        right = np.searchsorted(t_ref, t + half, side='right')
+        count = right - left
+
+        ok = (count > 0) & ~missing
+        result[ok] = (cumsum[right[ok]] - cumsum[left[ok]]) / count[ok, None]
+
+    return pd.DataFrame(result.astype(np.float32), columns=ROOM_VALUES)
+
+
+def attach_environment(df, store, time_col='time', offset=CMM_TIME_OFFSET, window=None, tolerance='5min'):
+    """
+    Add the sensor readings at the time of measurement to every row of a dataframe.
+
+    Arguments:
+        df = a dataframe with a column of timestamps (e.g. from load_results)
+        store = an EnvironmentStore
+        time_col = name of the column with timestamps (default = 'time')
+        offset = clock offset subtracted from the timestamps (default = eight minutes)
+        window = width of a centered averaging window (default = None, i.e. nearest reading)
+        tolerance = maximum distance to the nearest reading (default = '5min')
+
+    Return:
+        a copy of the dataframe with the columns 'env_temperature', 'env_humidity' and 'env_dew_point'
+
+    """
+    # Correct the timestamps before the lookup
+    times = pd.to_datetime(df[time_col]) - pd.Timedelta(offset)
+
+    readings = get_readings(store, times, window=window, tolerance=tolerance)
+
+    # Insert the readings as new columns
+    df = df.copy()
+    for col in ROOM_VALUES:
+        df['env_' + col] = readings[col].to_numpy()
+
+    return df
+
+
+def get_build_environment(store, layout=None):
+    """
+    Get the aggregated room conditions during every build.
+
+    Arguments:
+        store = an EnvironmentStore
+        layout = a dataframe with a 'build' column (default = None)
+
+    Return:
+        the per-build summary with flat column names (e.g. 'temperature_mean'),
+        or a copy of the layout with the summary joined on 'build'
+
+    """
+    summary = store.summary.copy()
+    summary.columns = ['_'.join(c for c in col if c) if isinstance(col, tuple) else col
+                       for col in summary.columns]
+
+    if layout is None:
+        return summary
+
+    return layout.join(summary, on='build')
+
+
+class RoomDataTail:
+    """
+    Follow a room data log that is being appended by the logger.
+
+    Every call to poll() reads only the bytes appended since the previous call
+    (tracked as a file offset), parses the complete lines, appends them to the
+    store and calls the callback for every reading outside the thresholds.
+    Readings the store already holds (e.g. when following a log that was loaded
+    with load_environment) are ignored by the store, so only new readings are
+    appended and checked.
+
+    Arguments:
+        path = path to the room data log
+        build = build number used to tag the rows
+        store = an EnvironmentStore to update
+        thresholds = dictionary of (lower, upper) limits, e.g. {'temperature': (19, 22)}
+        callback = function called as callback(build, time, column, value, limits)
+
+    """
+
+    def __init__(self, path, build, store, thresholds=None, callback=None):
+        self.path = path
+        self.build = build
+        self.store = store
+        self.thresholds = thresholds or {}
+        self.callback = callback
+        self.offset = 0
+
+    def poll(self):
+        """
+        Read and process newly appended rows.
+
+        Return:
+            the number of new rows
+
+        """
+        # Nothing to do until the logger has created the file
+        if not os.path.exists(self.path):
+            return 0
+
+        # Start over if the file has been truncated or replaced
+        if os.path.getsize(self.path) < self.offset:
+            self.offset = 0
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read()
+
+        # Only consume complete lines (the logger may be halfway through a row)
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        lines = chunk[:end]
+
+        # Skip the header line at the start of the file
+        if self.offset == 0 and lines.startswith(b'P395'):
+            lines = lines[lines.find(b'\n') + 1:]
+
+        self.offset += end
+
+        if not lines.strip():
+            return 0
+
+        df = parse_room_data(io.BytesIO(lines), self.build, header=False)
+
+        # Ignore the readings already in the store
+        last = self.store.last_time(self.build)
+        if last is not None:
+            df = df[df.index.get_level_values('time') > last]
+
+        self.store.append(df)
+        self._check(df)
+
+        return len(df)
+
+    def _check(self, df):
+        # Call the callback for every reading outside the limits
+        if self.callback is None:
+            return
+
+        for col, (lower, upper) in self.thresholds.items():
+            values = df[col].to_numpy()
+            outside = np.flatnonzero((values < lower) | (values > upper))
+            for i in outside:
+                self.callback(self.build, df.index[i][1], col, values[i], (lower, upper))
+
+
+def follow(tails, interval=60, stop=None):
+    """
+    Poll several room data logs at a fixed interval.
+
+    Arguments:
+        tails = a list of RoomDataTail objects
+        interval = seconds between every poll (default = 60)
+        stop = function returning True when following should stop (default = None, i.e. never)
+
+    """
+    while stop is None or not stop():
+        for tail in tails:
+            tail.poll()
+        time.sleep(interval)
@@ -0,0 +1,294 @@
+"""
+Module of interpolated error fields over the build volume.
+
+An error field predicts the error of a characteristic at any position in the
+build volume. It is fitted by smoothed radial basis functions with a linear
+trend to the mean error at the part positions (the smoothing is chosen by
+cross-validation), and evaluated once on a dense regular grid that is clamped
+to the bounding box of the positions (no extrapolation). Later queries are vectorized trilinear interpolation on the grid, so that millions of
+positions can be evaluated quickly (e.g. inside a placement search). Fields are
+plain numpy arrays and can be pickled into the cache.
+
+
+Contents:
+    ErrorField(char, points, values, ...)       # Error field of a single characteristic
+    cross_validate(points, values, ...)         # Choose the smoothing by k-fold cross-validation
+    combine_fields(fields, weights=None)        # Weighted sum of fields on the same grid
+    fit_error_fields(chars, folder='data')      # Fit (or unpickle) the fields of several characteristics
+
+"""
+
+# Import libraries
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+import my_functions as func
+
+# scipy.interpolate is imported by ErrorField on fitting, as it is slow to import
+
+##############################################################################
+
+# Build volume of the machine (EOS P 395, with the laser at [170, 170, 600], see calc_laser_angle) [mm]
+BUILD_VOLUME = ((0, 340), (0, 340), (0, 600))
+
+# Default grid spacing [mm]
+STEP = 10.0
+
+# Candidates of the smoothing chosen by cross-validation (large values give the linear trend)
+SMOOTHING = 10.0 ** np.arange(-2, 10)
+
+# Number of folds of the cross-validation
+FOLDS = 5
+
+# Version of the pickled fields (increase when the fitting changes)
+CACHE_VERSION = 2
+
+
+class ErrorField:
+    """
+    Interpolated error field of a single characteristic.
+
+    Arguments:
+        char = name of the characteristic
+        points = array of positions (n x 3) [mm]
+        values = array of errors (n), averaged per unique position before fitting
+        bounds = bounds of the grid per axis (default = BUILD_VOLUME)
+        step = grid spacing (default = 10 mm)
+        kernel = kernel of the radial basis functions (default = 'thin_plate_spline')
+        smoothing = smoothing of the fit (default = None, i.e. chosen from SMOOTHING by
+                    cross-validation, 0 interpolates the values exactly)
+
+    Attributes:
+        grid = predicted error on the grid (float32, nx x ny x nz)
+        origin = position of the first grid point
+        step = grid spacing
+        n_points = number of unique positions fitted
+        smoothing = smoothing of the fit
+        cv_error = root mean squared error of the cross-validation (NaN if not cross-validated)
+        fit_error = root mean squared difference between the field and the fitted values
+
+    """
+
+    def __init__(self, char, points, values, bounds=BUILD_VOLUME, step=STEP, kernel='thin_plate_spline',
+                 smoothing=None):
+        from scipy.interpolate import RBFInterpolator
+
+        self.char = char
+        self.step = float(step)
+        self.origin = np.array([b[0] for b in bounds], dtype=float)
+        shape = tuple(int(np.floor((b[1] - b[0]) / self.step)) + 1 for b in bounds)
+
+        # Mean error at every unique position (repeated positions make the interpolation singular)
+        df = pd.DataFrame(np.asarray(points, dtype=float), columns=['x', 'y', 'z'])
+        df['value'] = np.asarray(values, dtype=float)
+        df = df.dropna().groupby(['x', 'y', 'z'], as_index=False)['value'].mean()
+        pts = df[['x', 'y', 'z']].to_numpy()
+        values = df['value'].to_numpy()
+        self.n_points = len(df)
+        self.cv_error = np.nan
+
+        # Fit only along axes with variation (e.g. all parts at one z-level)
+        active = np.ptp(pts, axis=0) > 0
+        axes = [self.origin[i] + self.step * np.arange(n) for i, n in enumerate(shape)]
+        grid_points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+
+        # Clamp the grid to the bounding box of the positions (constant outside, no extrapolation)
+        grid_points = np.clip(grid_points, pts.min(axis=0), pts.max(axis=0))
+
+        if active.any() and self.n_points > active.sum() + 1:
+            if smoothing is None:
+                smoothing, self.cv_error = cross_validate(pts[:, active], values, kernel)
+            rbf = RBFInterpolator(pts[:, active], values, kernel=kernel, smoothing=smoothing, degree=1)
+            grid = rbf(grid_points[:, active])
+        else:
+            grid = np.full(len(grid_points), values.mean())
+
+        self.smoothing = smoothing
+        self.grid = grid.reshape(shape).astype(np.float32)
+        self.fit_error = float(np.sqrt(np.mean((self.evaluate(pts) - values) ** 2)))
+
+    def __repr__(self):
+        return "ErrorField({!r}, grid={})".format(self.char, self.grid.shape)
+
+    def __call__(self, points):
+        return self.evaluate(points)
+
+    def evaluate(self, points):
+        """
+        Predict the error at positions by trilinear interpolation on the grid
+        (positions outside the grid are clamped to its bounds).
+
+        Arguments:
+            points = array of positions (... x 3) [mm]
+
+        Return:
+            an array of predicted errors with the shape of points without the last axis
+
+        """
+        return trilinear(self.grid, self.origin, self.step, points)
+
+    def save(self, path):
+        """
+        Pickle the field to the specified path.
+
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """
+        Load a pickled field from the specified path.
+
+        """
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def cross_validate(points, values, kernel='thin_plate_spline', candidates=SMOOTHING, folds=FOLDS, seed=0):
+    """
+    Choose the smoothing of the radial basis functions by k-fold cross-validation.
+
+    Arguments:
+        points = array of unique positions (n x d)
+        values = array of values (n)
+        kernel = kernel of the radial basis functions (default = 'thin_plate_spline')
+        candidates = smoothing values to compare (default = SMOOTHING)
+        folds = number of folds (default = 5, at most the number of points)
+        seed = seed of the assignment of the points to the folds (default = 0)
+
+    Return:
+        a tuple with the smoothing of the smallest error and its root mean squared error
+
+    """
+    from scipy.interpolate import RBFInterpolator
+
+    fold = np.arange(len(values)) % min(folds, len(values))
+    np.random.default_rng(seed).shuffle(fold)
+
+    # Sum the squared prediction errors of the left-out points (skip folds too small for the trend)
+    errors = np.zeros(len(candidates))
+    for k in np.unique(fold):
+        train = fold != k
+        if train.sum() <= points.shape[1] + 1:
+            continue
+        for i, smoothing in enumerate(candidates):
+            rbf = RBFInterpolator(points[train], values[train], kernel=kernel, smoothing=smoothing, degree=1)
+            errors[i] += ((rbf(points[~train]) - values[~train]) ** 2).sum()
+
+    best = int(np.argmin(errors))
+    return float(candidates[best]), float(np.sqrt(errors[best] / len(values)))
+
+
+def trilinear(grid, origin, step, points):
+    """
+    Trilinear interpolation of a regular grid at positions (clamped to the grid).
+
+    """
+    points = np.asarray(points, dtype=float)
+    shape = points.shape[:-1]
+    points = points.reshape(-1, 3)
+    n = np.array(grid.shape)
+
+    # Index of the lower corner and the fraction along every axis
+    f = np.clip((points - origin) / step, 0, n - 1)
+    i = np.minimum(f.astype(np.int64), np.maximum(n - 2, 0))
+    t = (f - i).astype(np.float32)
+    i1 = np.minimum(i + 1, n - 1)
+
+    # Interpolate along x, then y, then z
+    x0, y0, z0 = i.T
+    x1, y1, z1 = i1.T
+    tx, ty, tz = t.T
+    c00 = grid[x0, y0, z0] * (1 - tx) + grid[x1, y0, z0] * tx
+    c10 = grid[x0, y1, z0] * (1 - tx) + grid[x1, y1, z0] * tx
+    c01 = grid[x0, y0, z1] * (1 - tx) + grid[x1, y0, z1] * tx
+    c11 = grid[x0, y1, z1] * (1 - tx) + grid[x1, y1, z1] * tx
+    c0 = c00 * (1 - ty) + c10 * ty
+    c1 = c01 * (1 - ty) + c11 * ty
+
+    return (c0 * (1 - tz) + c1 * tz).reshape(shape)
+
+
+def combine_fields(fields, weights=None):
+    """
+    Combine fields on the same grid into a single field of the weighted sum,
+    so that a weighted error over several characteristics is a single evaluation.
+
+    Arguments:
+        fields = a list (or dictionary) of ErrorFields on the same grid
+        weights = a list (or dictionary) of weights (default = None, i.e. all 1)
+
+    Return:
+        an ErrorField
+
+    """
+    if isinstance(fields, dict):
+        if isinstance(weights, dict):
+            weights = [weights.get(c, 0.0) for c in fields]
+        fields = list(fields.values())
+    if weights is None:
+        weights = np.ones(len(fields))
+
+    combined = object.__new__(ErrorField)
+    combined.char = '+'.join(f.char for f in fields)
+    combined.step = fields[0].step
+    combined.origin = fields[0].origin
+    combined.n_points = min(f.n_points for f in fields)
+    combined.smoothing = None
+    combined.cv_error = combined.fit_error = np.nan
+    combined.grid = np.tensordot(np.asarray(weights, dtype=np.float32),
+                                 np.stack([f.grid for f in fields]), axes=1).astype(np.float32)
+
+    return combined
+
+
+def fit_error_fields(chars, folder='data', cache=True, **kwargs):
+    """
+    Fit the error fields of characteristics from the mean errors joined with the layout.
+
+    The fields are pickled to 'error_fields.pkl' and reused as long as the file
+    is newer than the pickled data and was fitted with the same arguments.
+
+    Arguments:
+        chars = a list of characteristic names
+        folder = folder containing the pickled data (default = 'data')
+        cache = use and update the pickled fields (default = True)
+        kwargs = arguments of ErrorField (bounds, step, kernel, smoothing)
+
+    Return:
+        a dictionary of ErrorFields by characteristic name
+
+    """
+    path = os.path.join(folder, 'error_fields.pkl')
+    sources = [os.path.join(folder, f) for f in ['prep_data.pkl', 'layout_data.pkl']]
+
+    # Reuse the pickled fields if they are up to date and fitted with the same arguments
+    fields = {}
+    if cache and os.path.exists(path) and \
+            os.path.getmtime(path) >= max(os.path.getmtime(s) for s in sources):
+        with open(path, 'rb') as f:
+            stored = pickle.load(f)
+        if stored['kwargs'] == kwargs and stored.get('version') == CACHE_VERSION:
+            fields = stored['fields']
+
+    # Fit the missing fields (at the feature positions, if known)
+    missing = [c for c in chars if c not in fields]
+    if missing:
+        df = func.get_char_means(missing, folder=folder)
+        cols = ['center_x', 'center_y', 'center_z']
+        for char, group in df.groupby('char', observed=True, sort=False):
+            points = group[cols].to_numpy(dtype=float)
+            if 'offset_known' in group and group['offset_known'].all():
+                points = group[['feature_x', 'feature_y', 'feature_z']].to_numpy(dtype=float)
+            fields[char] = ErrorField(char, points, group['error'].to_numpy(), **kwargs)
+
+        if cache:
+            with open(path, 'wb') as f:
+                pickle.dump({'kwargs': kwargs, 'fields': fields, 'version': CACHE_VERSION}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    return {c: fields[c] for c in chars if c in fields}
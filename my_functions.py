@@ -5,12 +5,17 @@ Created by Torbjørn L. Leirmo
 
 
 Contents:
-	load_results()								# Load the 'results'-file
-	load_layout()								# Load the 'layout'-file
-    pickle_data()                               # Load results and layout and pickle to separate files
+	load_results(folder='data', exclude=None)	# Load the 'results'-file
+	load_layout(folder='data')					# Load the 'layout'-file
+    pickle_data(folder='data')                  # Load results and layout and pickle to separate files
 	make_dict(df, df_layout)					# NB! No pickles! Make a dictionary of characteristics
-	make_char_dict()                            # Create dictionary of characteristics from pickled data
-    save_dict(char_dict)						# Save the dictionary in separate files
+	make_char_dict(folder='data', exclude=None) # Create dictionary of characteristics from pickled data
+    save_dict(char_dict, folder=...)			# Save the dictionary in separate files
+    load_slice_distribution(files, labels=None) # Load slice distributions on a shared height grid
+    align_slices(arrays, labels)                # Align parsed slice distributions on a shared height grid
+    load_plot_data(folder='data')               # Load and aggregate pickled data once per process
+    get_results(chars, columns=None)            # Get measurements of specified characteristics
+    get_char_means(chars, columns=None)         # Get mean errors with layout data of specified characteristics
 	get_single_values(col, val, some_list)		# Get rows containing a certain value from a list of dataframes
 	exclude_values(col, val, some_list)			# Exclude rows containing a certain value from a list of dataframes
 	df_from_dict(keys, a_dict)					# Retrieve specified characteristics from the dictionary
@@ -19,29 +24,48 @@ Contents:
 	my_t_test(dft, par='z_pos')					# Perform a t-test for all combinations of a DF and return a MIDF
 	get_p_vals(dft, par='z_pos')                # Perform a t-test for all combinations of a DF and return p-vals only
     calc_laser_angle(x, y, feature_vector=...)  # Calculate laser angle
+    laser_angles(x, y, angle, ...)              # Calculate laser angles of rotated features (vectorized)
     rotate_vector(vector, a=0, b=0, c=0)        # Rotate a vector
     add_laser_angle(df, feature_vector=...)     # Add column 'laser_angle' to dataframe
+    load_feature_offsets(folder='data')         # Load the offsets of the features from the centre of the part
+    add_feature_positions(df, char_col='char')  # Add the positions of the features in the build
+    make_vectors(df, layout)                    # Pair .X/.Y/.Z components into deviation vectors in build coordinates
+    read_stl(path)                              # Read the triangles of a binary STL-file
+    derive_feature_offsets(path=...)            # Derive the offsets of the features from the STL-file
+    orientation_histograms(path, angles=...)    # Area-weighted histograms of facet orientation
 
 """
 
 # Import libraries
 
+import os
 import math
 import pandas as pd
 import numpy as np
-from scipy.stats import ttest_ind
+
+# scipy.stats is imported by the t-test functions on first use, as it is slow to import
+
+from my_profiling import profiled
+import my_characteristics as mychars
 
 ##############################################################################
 
-def load_results():
+@profiled
+def load_results(folder='data', file='Leirmo_Exp1_ALL.csv', exclude=None):
     """
     Create dataframe with selected columns from the results-file.
-	
+
+    Arguments:
+        folder = folder containing the results-file (default = 'data')
+        file = name of the results-file (default = 'Leirmo_Exp1_ALL.csv')
+        exclude = list of validity levels to drop, e.g. ['invalid', 'questionable'] (default = None,
+                  i.e. keep all, see my_characteristics.py)
+
 	Return:
 		a single dataframe
     
     """
-    path = "Data/Leirmo_Exp1_ALL.csv"
+    path = os.path.join(folder, file)
     
     # Define by header name which columns to import 
     cols = ["Uuid", \
@@ -66,6 +90,10 @@ def load_results():
     # Re-name columns to shorter more descriptive names
     df.columns = ['uuid', 'part_name', 'rep', 'char_name', 'actual', 'nominal', 'time', 'char_number']
 
+    # Drop characteristics marked as invalid or questionable before any further processing
+    if exclude:
+        df = mychars.split_by_validity(df, exclude)[0].reset_index(drop=True)
+
     # Calculating the difference between the nominal and actual values and store them in column 'error'
     df.insert(6, 'error', df['actual'] - df['nominal'], True)
 
@@ -85,12 +113,17 @@ def load_results():
     return df
     
 
-def load_layout():
+@profiled
+def load_layout(folder='data', file='leirmo_exp1_layout.csv'):
     """
 	Load the layout data and return a DataFrame using part_name as index.
 
+    Arguments:
+        folder = folder containing the layout-file (default = 'data')
+        file = name of the layout-file (default = 'leirmo_exp1_layout.csv')
+
 	"""
-    path = "Data/leirmo_exp1_layout.csv"
+    path = os.path.join(folder, file)
 
     # part_name   = Name of the specimen           (e.g. "Leirmo_Exp1_Build3_#11")
     # build       = Build number                   (1-3)
@@ -109,21 +142,26 @@ def load_layout():
     return pd.read_csv(path, sep = ';', index_col = 'part_name')
 
 
-def pickle_data():
+@profiled
+def pickle_data(folder='data'):
     """
     Pickle the dataframe with all results for faster loading.
 
+    Arguments:
+        folder = folder containing the results- and layout-files, and of the pickles (default = 'data')
+
     """
     # Load the results and the layout data into separate dataframes
-    df_res = load_results()
-    df_layout = load_layout()
+    df_res = load_results(folder)
+    df_layout = load_layout(folder)
 
     # Pickle the dataframes to specified locations
-    df_res.to_pickle("Data/prep_data.pkl")
-    df_layout.to_pickle("Data/layout_data.pkl")
+    df_res.to_pickle(os.path.join(folder, 'prep_data.pkl'))
+    df_layout.to_pickle(os.path.join(folder, 'layout_data.pkl'))
 
 
 ### NB! No pickles involved!
+@profiled
 def make_dict(df, df_layout):
     """
     Establish a dictionary of characteristics with layout data
@@ -140,24 +178,39 @@ def make_dict(df, df_layout):
     # Stores only mean measured error of repeated measurements
     # Removes redundant columns
     for char in chars:
-        char_dict[char] = df[df['char_name'] == char].groupby('part_name').mean()\
+        char_dict[char] = df[df['char_name'] == char].groupby('part_name').mean(numeric_only = True)\
         .drop(['rep', 'actual', 'nominal', 'char_number'], axis = 1).join(df_layout)
     
     return char_dict
 
 
-def make_char_dict():
+@profiled
+def make_char_dict(folder='data', exclude=None, segregate=False):
     """
     Create a dictionary of characteristics from pickled data.
     The function loads data instead of taking arguments
 
+    Arguments:
+        folder = folder containing the pickled data (default = 'data')
+        exclude = list of validity levels to leave out, e.g. ['invalid', 'questionable'] (default = None,
+                  i.e. keep all, see my_characteristics.py)
+        segregate = also return the excluded characteristics in a separate dictionary (default = False)
+
+    Return:
+        a dictionary of characteristics (and a dictionary of the excluded characteristics if segregate)
+
     """
     # Initialize empty dictionary for characteristics
     char_dict = {}
 
     # Load pickled data
-    df = pd.read_pickle("Data/prep_data.pkl")
-    layout = pd.read_pickle("Data/layout_data.pkl")
+    df = pd.read_pickle(os.path.join(folder, 'prep_data.pkl'))
+    layout = pd.read_pickle(os.path.join(folder, 'layout_data.pkl'))
+
+    # Separate invalid or questionable characteristics up front
+    excluded = df.iloc[:0]
+    if exclude:
+        df, excluded = mychars.split_by_validity(df, exclude)
     
     # Identify all the unique parts and characteristics
     chars = df['char_name'].unique()
@@ -166,21 +219,244 @@ def make_char_dict():
     # Stores only mean measured error of repeated measurements
     # Removes redundant columns
     for char in chars:
-        char_dict[char] = df[df['char_name'] == char].groupby('part_name').mean()\
+        char_dict[char] = df[df['char_name'] == char].groupby('part_name').mean(numeric_only = True)\
         .drop(['rep', 'actual', 'nominal', 'char_number'], axis = 1).join(layout)
+
+    # The excluded characteristics in a dictionary of their own
+    if segregate:
+        return char_dict, make_dict(excluded, layout) if len(excluded) else {}
     
     return char_dict
 
     
-def save_dict(char_dict):
+@profiled
+def save_dict(char_dict, folder=os.path.join('data', 'Chars')):
     """
     Save all characteristics form the dictionary to separate .csv-files.
     
     Required: A dictionary of characteristics
+    Optional: The output folder (default = 'data/Chars')
     
     """
+    os.makedirs(folder, exist_ok=True)
     for name, df in char_dict.items():
-        df.to_csv('Data/Chars/{}_mean_excel.csv'.format(name), sep = ';')
+        df.to_csv(os.path.join(folder, '{}_mean_excel.csv'.format(name)), sep = ';')
+
+
+# Data shared by all plot scripts running in the same process (see load_plot_data)
+PLOT_DATA = {}
+
+
+@profiled(rows='results')
+def load_plot_data(folder='data'):
+    """
+    Load the pickled results and layout, and aggregate the mean error of all
+    characteristics. The data is loaded once per process and shared by all
+    later calls with the same folder.
+
+    Arguments:
+        folder = folder containing the pickled data (default = 'data')
+
+    Return:
+        a dictionary with the results, the codes of the characteristic names and
+        their fields (by code), the mean errors joined with the layout and the
+        fields, and the first and last row of every characteristic in the mean errors
+
+    """
+    key = os.path.abspath(folder)
+
+    if key not in PLOT_DATA:
+        # Load pickled data
+        df = pd.read_pickle(os.path.join(folder, 'prep_data.pkl'))
+        layout = pd.read_pickle(os.path.join(folder, 'layout_data.pkl'))
+
+        # Mean measured error of repeated measurements for all characteristics in a single groupby
+        means = df.groupby(['char_name', 'part_name'])['error'].mean().reset_index(level='char_name')
+        means = means.rename(columns={'char_name': 'char'}).join(layout)
+        means['char'] = means['char'].astype('category')
+
+        # The rows are sorted by characteristic, so every characteristic is a contiguous block
+        names = means['char'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+        ends = np.r_[starts[1:], len(names)]
+        bounds = {names[a]: (a, b) for a, b in zip(starts, ends)}
+
+        # Fields of the characteristic names as compact columns (measure, feature, size, polarity, ...)
+        means = pd.concat([means, mychars.char_fields(means['char'])], axis=1)
+
+        # Positions of the features in the build (the centre of the part where the offset is unknown)
+        means = add_feature_positions(means, 'char', folder)
+
+        # Categorical codes of the characteristic names for fast selection of rows
+        names = pd.Categorical(df['char_name'])
+
+        PLOT_DATA[key] = {'results': df, 'categories': names.categories, 'codes': names.codes,
+                          'fields': mychars.parse_chars(list(names.categories)),
+                          'means': means, 'bounds': bounds}
+
+    return PLOT_DATA[key]
+
+
+@profiled
+def get_results(chars, columns=None, folder='data'):
+    """
+    Get the measurements of the specified characteristics from the shared data.
+
+    Arguments:
+        chars = a list of characteristic names
+        columns = a list of columns to include (default = None, i.e. all)
+        folder = folder containing the pickled data (default = 'data')
+
+    Return:
+        a dataframe with the measurements in their original order
+
+    """
+    data = load_plot_data(folder)
+    df = data['results']
+
+    # Select rows by the categorical codes rather than comparing strings
+    codes = data['categories'].get_indexer(chars)
+    rows = np.isin(data['codes'], codes[codes >= 0])
+
+    return df.loc[rows, columns if columns is not None else df.columns]
+
+
+@profiled
+def get_char_means(chars, columns=None, folder='data'):
+    """
+    Get the mean errors joined with layout data for the specified characteristics.
+
+    The rows of every characteristic are sliced from the shared data without
+    copying. The result should be treated as read-only (with copy-on-write
+    enabled, changes only apply to the returned dataframe).
+
+    Arguments:
+        chars = a list of characteristic names
+        columns = a list of columns to include (default = None, i.e. all)
+        folder = folder containing the pickled data (default = 'data')
+
+    Return:
+        a dataframe with part_name as index and the characteristic name in the column 'char'
+        (categorical with only the requested characteristics, in the order of chars)
+
+    """
+    data = load_plot_data(folder)
+    means = data['means'] if columns is None else data['means'][columns]
+
+    # Slice the block of rows of every characteristic
+    blocks = [means.iloc[slice(*data['bounds'][char])] for char in chars]
+    df = blocks[0] if len(blocks) == 1 else pd.concat(blocks)
+
+    # Keep only the categories of the selected rows (e.g. for the slots of a seaborn plot on x='char')
+    categorical = {col: df[col].cat.remove_unused_categories() for col in df.columns
+                   if isinstance(df[col].dtype, pd.CategoricalDtype)}
+    if 'char' in categorical:
+        categorical['char'] = df['char'].cat.set_categories([c for c in chars if c in data['bounds']])
+
+    return df.assign(**categorical) if categorical else df
+
+
+def read_slice_file(path, cache=True):
+    """
+    Read a single slice distribution exported from Materialise Magics.
+
+    The exports differ in encoding and header (e.g. 'Total slice surface (mmý)'
+    versus 'Total slice surface (mm²)' with a BOM), so the columns are read by
+    position. The parsed values are cached in a binary sidecar (.npy) next to
+    the CSV-file, and later loads memory-map the sidecar instead of parsing.
+
+    Arguments:
+        path = path to the CSV-file
+        cache = use and update the binary sidecar (default = True)
+
+    Return:
+        a float32 array with the columns height [mm] and slice area [mm²]
+
+    """
+    sidecar = os.path.splitext(path)[0] + '.npy'
+
+    # Memory-map the sidecar if it is newer than the CSV-file
+    if cache and os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+        return np.load(sidecar, mmap_mode='r')
+
+    # Parse the CSV-file with fixed column names regardless of the original header
+    arr = pd.read_csv(path, sep=';', encoding='utf-8-sig', header=0, names=['height', 'area'],
+                      dtype=np.float32).to_numpy()
+
+    # Store the parsed values for faster loading next time
+    if cache:
+        np.save(sidecar, arr)
+
+    return arr
+
+
+@profiled
+def load_slice_distribution(files, labels=None, folder='data', cache=True):
+    """
+    Load slice distributions and align them on a shared height grid.
+
+    The files do not have the same number of layers (build 3 has fewer layers
+    than builds 1 and 2). Rather than combining them by position, every slice
+    area is placed on a common grid of layer heights. Heights outside the range
+    of a file are given zero area, and files with a different layer height are
+    resampled by linear interpolation.
+
+    Arguments:
+        files = list of file identifiers (e.g. ['build1', 'build2', 'build3'])
+        labels = list of column names (default = the file identifiers)
+        folder = folder containing the files (default = 'data')
+        cache = use binary sidecars for faster loading (default = True)
+
+    Return:
+        a dataframe with float32 columns of slice area [mm²] and 'Height (mm)' as index
+
+    """
+    if labels is None:
+        labels = list(files)
+
+    # Read all files
+    arrays = [read_slice_file(os.path.join(folder, 'Slice_distribution_{}.csv'.format(f)), cache)
+              for f in files]
+
+    return align_slices(arrays, labels)
+
+
+def align_slices(arrays, labels):
+    """
+    Align parsed slice distributions on a shared height grid (see load_slice_distribution).
+
+    Arguments:
+        arrays = list of arrays with the columns height [mm] and slice area [mm²] (see read_slice_file)
+        labels = list of column names
+
+    Return:
+        a dataframe with float32 columns of slice area [mm²] and 'Height (mm)' as index
+
+    """
+    # Define the shared grid from the finest layer height and the full range of heights
+    #   PS: Heights are rounded to 0.1 µm to remove float32 noise
+    step = min(round(float(np.median(np.diff(a[:, 0]))), 4) for a in arrays)
+    start = min(round(float(a[0, 0]), 4) for a in arrays)
+    stop = max(round(float(a[-1, 0]), 4) for a in arrays)
+    n = int(round((stop - start) / step)) + 1
+    grid = start + step * np.arange(n)
+    heights = grid.astype(np.float32)
+
+    # Initiate a single array for all slice areas
+    areas = np.zeros((n, len(arrays)), dtype=np.float32)
+
+    for i, a in enumerate(arrays):
+        # Find the grid index of every layer
+        idx = np.rint((a[:, 0] - start) / step).astype(np.int64)
+
+        if np.allclose(a[:, 0], grid[idx], atol=step * 1e-3):
+            # Layers coincide with the grid: place the areas directly
+            areas[idx, i] = a[:, 1]
+        else:
+            # Resample onto the grid
+            areas[:, i] = np.interp(grid, a[:, 0], a[:, 1], left=0, right=0)
+
+    return pd.DataFrame(areas, index=pd.Index(heights, name='Height (mm)'), columns=labels)
 
 
 def get_single_values(col, val, some_list):
@@ -265,6 +541,7 @@ def get_column(col, some_list):
     return result
 
 
+@profiled
 def get_planes(some_dict):
     """
     Get a list of dataframes containing HX1 and HX2 with angle_z included
@@ -317,6 +594,7 @@ def get_planes(some_dict):
     return df_planes
 
 
+@profiled
 def my_t_test(dft, par='z_pos'):
     """
     Perform a T-test for pairwise comparison of distributions
@@ -329,6 +607,8 @@ def my_t_test(dft, par='z_pos'):
         A multi-index dataframe containing the T-statistics and P-values of all combinations
     
     """
+    from scipy.stats import ttest_ind
+
     # Find the number of unique values of 'par'
     n = len(dft[par].unique())
 
@@ -342,7 +622,7 @@ def my_t_test(dft, par='z_pos'):
     tuples = list(zip(*[sorted(labels * 2), lvl2]))
 
     # Initiate DataFrame object with multi-index
-    df_t_test = pd.DataFrame(index = pd.MultiIndex.from_tuples(tuples, names=[par,'type']), columns = labels)
+    df_t_test = pd.DataFrame(index = pd.MultiIndex.from_tuples(tuples, names=[par,'type']), columns = labels, dtype = float)
 
     # Iterate through all combinations and populate the dataframe
     #   PS: Due to symmetry, only half the dataframe is traversed
@@ -357,15 +637,16 @@ def my_t_test(dft, par='z_pos'):
             t_stat, p_val = ttest_ind(df1['error'], df2['error'])
 
             # Populate the output dataframe with the newly discovered results
-            df_t_test[labels[i]][labels[j]]['T-statistic'] = t_stat
-            df_t_test[labels[i]][labels[j]]['P-value'] = p_val
-            df_t_test[labels[j]][labels[i]]['T-statistic'] = -t_stat
-            df_t_test[labels[j]][labels[i]]['P-value'] = p_val
+            df_t_test.loc[(labels[j], 'T-statistic'), labels[i]] = t_stat
+            df_t_test.loc[(labels[j], 'P-value'), labels[i]] = p_val
+            df_t_test.loc[(labels[i], 'T-statistic'), labels[j]] = -t_stat
+            df_t_test.loc[(labels[i], 'P-value'), labels[j]] = p_val
 
     # Return a multi-index dataframe with results
     return df_t_test
 
 
+@profiled
 def get_p_vals(dft, par='z_pos'):
     """
     Perform a T-test for pairwise comparison of distributions and only get p-values
@@ -378,6 +659,8 @@ def get_p_vals(dft, par='z_pos'):
         A dataframe containing the P-values of all combinations
     
     """
+    from scipy.stats import ttest_ind
+
     # Find the number of unique values of 'par'
     n = len(dft[par].unique())
 
@@ -385,7 +668,7 @@ def get_p_vals(dft, par='z_pos'):
     labels = sorted(dft[par].unique())
 
     # Initiate DataFrame object
-    df = pd.DataFrame(index=labels, columns=labels)
+    df = pd.DataFrame(index=labels, columns=labels, dtype=float)
 
     # Iterate through all combinations and populate the dataframe
     #   PS: Due to symmetry, only half the dataframe is traversed
@@ -400,8 +683,8 @@ def get_p_vals(dft, par='z_pos'):
             t_stat, p_val = ttest_ind(df1['error'], df2['error'])
 
             # Populate the output dataframe with the newly discovered results
-            df[labels[i]][labels[j]] = p_val
-            df[labels[j]][labels[i]] = p_val
+            df.loc[labels[j], labels[i]] = p_val
+            df.loc[labels[i], labels[j]] = p_val
 
     # Return a dataframe with the p-values
     return df
@@ -430,6 +713,10 @@ def calc_angle(vector_a, vector_b):
     return math.degrees(np.arccos(over/under))
 
 
+# Position of the laser in the build volume [mm]
+LASER = np.array([170, 170, 600])
+
+
 def calc_laser_angle(x, y, feature_vector=np.array([0, 0, 1])):
     """
     Calculate laser angle.
@@ -445,15 +732,45 @@ def calc_laser_angle(x, y, feature_vector=np.array([0, 0, 1])):
     """
     # Initialize positions
     part_pos = np.array([x, y, 0])
-    laser_pos = np.array([170, 170, 600])
 
     # Calculate the vector from part position to the laser
-    laser_vector = np.subtract(laser_pos, part_pos)
+    laser_vector = np.subtract(LASER, part_pos)
 
     # Return angle in degrees
     return calc_angle(feature_vector, laser_vector)
 
 
+def laser_angles(x, y, angle, feature_vector=np.array([0, 0, 1])):
+    """
+    Calculate the laser angles of features rotated about the x-axis (as
+    calc_laser_angle of rotate_vector(feature_vector, a=angle), vectorized).
+
+    Arguments:
+        x = x-positions of the features/parts (array of any shape)
+        y = y-positions of the features/parts (broadcast with x)
+        angle = rotations about the x-axis in degrees (broadcast with x)
+        feature_vector = normal vector of the feature before rotation (default = [0, 0, 1])
+
+    Return:
+        an array of laser angles in degrees
+
+    """
+    x, y, angle = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x, y, angle)))
+    vx, vy, vz = np.asarray(feature_vector, dtype=float)
+
+    # Rotate the feature vector about the x-axis
+    a = np.radians(angle)
+    feature = np.stack([np.full(a.shape, vx), np.cos(a) * vy - np.sin(a) * vz,
+                        np.sin(a) * vy + np.cos(a) * vz], axis=-1)
+
+    # Vector from the part position to the laser
+    laser = LASER - np.stack([x, y, np.zeros(x.shape)], axis=-1)
+
+    # Angle between the vectors
+    cos = (feature * laser).sum(axis=-1) / np.sqrt((feature ** 2).sum(axis=-1) * (laser ** 2).sum(axis=-1))
+    return np.degrees(np.arccos(np.clip(cos, -1, 1)))
+
+
 def rotate_vector(vector, a=0, b=0, c=0):
     """
     Rotate a vector about x, y and z axis.
@@ -481,6 +798,7 @@ def rotate_vector(vector, a=0, b=0, c=0):
     return vector
 
 
+@profiled
 def add_laser_angle(df, feature_vector=np.array([0, 0, 1])):
     """
     Calculate the laser angle and insert as a new column in the dataframe.
@@ -492,34 +810,389 @@ def add_laser_angle(df, feature_vector=np.array([0, 0, 1])):
         A copy of the original dataframe with a column for laser angle
 
     """
-    # Get a list of column names
-    headers = list(df.columns)
+    # Find the coordinates depending on availability (the position index is converted to mm)
+    coords = []
+    for axis in ['x', 'y']:
+        if 'feature_' + axis in df.columns:
+            coords.append(df['feature_' + axis].to_numpy(dtype=float))
+        elif 'center_' + axis in df.columns:
+            coords.append(df['center_' + axis].to_numpy(dtype=float))
+        else:
+            coords.append(df[axis + '_pos'].to_numpy(dtype=float) * 100 - 30)
+
+    # Calculate the laser angles of the feature vectors rotated by the part orientation
+    df['laser_angle'] = laser_angles(*coords, df['angle'].to_numpy(dtype=float), feature_vector)
+
+    # Return the dataframe
+    return df
 
-    # Initiate a list (to be the new column)
-    new_col = []
 
-    # Iterate over the rows of the dataframe
-    for i in range(len(df)):
-        # Update feature vector with part orientation
-        new_feature_vector = rotate_vector(vector=np.array(feature_vector), a=df.iloc[i]['angle'])
+# Offset tables of the features loaded in this process (see load_feature_offsets)
+FEATURE_OFFSETS = {}
 
-        # Find x-coordinate depending on availability
-        if 'center_x' in headers:
-            x_coor = df.iloc[i]['center_x']
-        elif 'x_pos' in headers:
-            x_coor = (df.iloc[i]['x_pos'] * 100) -30
 
-        # Find y-coordinate depending on availability
-        if 'center_y' in headers:
-            y_coor = df.iloc[i]['center_y']
-        elif 'y_pos' in headers:
-            y_coor = (df.iloc[i]['y_pos'] * 100) -30
+def load_feature_offsets(folder='data'):
+    """
+    Load the nominal offsets of the features from the centre of the specimen ("feature_offsets.csv").
 
-        # Calculate the laser angle and append to list
-        new_col.append(calc_laser_angle(x_coor, y_coor, new_feature_vector))
+    Arguments:
+        folder = folder containing "feature_offsets.csv" (default = 'data')
 
-    # Add the new column to the dataframe
-    df['laser_angle'] = new_col
+    Return:
+        a dataframe indexed by feature key with the offsets 'dx', 'dy' and 'dz' [mm]
+        (NaN if unknown, and empty if the file does not exist)
 
-    # Return the dataframe
-    return df
\ No newline at end of file
+    """
+    path = os.path.abspath(os.path.join(folder, 'feature_offsets.csv'))
+
+    if path not in FEATURE_OFFSETS:
+        if os.path.exists(path):
+            df = pd.read_csv(path, sep=';', comment='#', index_col='feature_key')
+        else:
+            df = pd.DataFrame(columns=['dx', 'dy', 'dz'], index=pd.Index([], name='feature_key'))
+        FEATURE_OFFSETS[path] = df[['dx', 'dy', 'dz']].astype(float)
+
+    return FEATURE_OFFSETS[path]
+
+
+@profiled
+def add_feature_positions(df, char_col='char', folder='data'):
+    """
+    Calculate the position in the build of the feature of every characteristic
+    on every part, i.e. the centre of the part plus the offset of the feature
+    rotated by the part rotation about the x-axis.
+
+    Arguments:
+        df = a dataframe with the characteristic names and the layout data ('center_x/y/z' and 'angle')
+        char_col = name of the column with the characteristic names (default = 'char')
+        folder = folder containing "feature_offsets.csv" (default = 'data')
+
+    Return:
+        a copy of the dataframe with the columns 'feature_x', 'feature_y', 'feature_z' [mm]
+        and 'offset_known' (False where the offset is unknown and the centre of the part is used)
+
+    """
+    # Offsets of the unique characteristics, taken for every row by the codes
+    codes, chars = pd.factorize(df[char_col])
+    offsets = load_feature_offsets(folder).reindex([mychars.feature_key(c) for c in chars]).to_numpy()[codes]
+    known = ~np.isnan(offsets).any(axis=1)
+    offsets = np.nan_to_num(offsets)
+
+    # Rotate the offsets by the part rotation about the x-axis
+    angles = np.radians(df['angle'].to_numpy(dtype=float))
+    cos, sin = np.cos(angles), np.sin(angles)
+
+    return df.assign(feature_x=df['center_x'].to_numpy() + offsets[:, 0],
+                     feature_y=df['center_y'].to_numpy() + offsets[:, 1] * cos - offsets[:, 2] * sin,
+                     feature_z=df['center_z'].to_numpy() + offsets[:, 1] * sin + offsets[:, 2] * cos,
+                     offset_known=known)
+
+
+# Order of the axis components in the deviation vectors
+AXES = pd.Index(['X', 'Y', 'Z'])
+
+
+@profiled
+def make_vectors(df, layout):
+    """
+    Pair the axis components (.X/.Y/.Z) of all component characteristics into
+    deviation vectors per part, e.g. 'Position_Cyl_8mm_Pos.X' and '.Y' into
+    the vector of 'Position_Cyl_8mm_Pos'. Repeated measurements are averaged.
+
+    The components are given in the coordinate system of the part. The vectors
+    are rotated back into the coordinates of the build by the part rotation
+    about the x-axis (as in add_laser_angle).
+
+    Arguments:
+        df = a dataframe of results with 'char_name', 'part_name' and 'error'
+        layout = a dataframe with 'angle' indexed by part_name
+
+    Return:
+        a dataframe with one row per part and characteristic:
+            char, part_name     = characteristic (without axis) and part (categorical)
+            x, y, z             = components in the part coordinates (missing components are zero)
+            build_x/_y/_z       = components in the build coordinates
+            magnitude           = length of the vector
+            azimuth             = angle in the xy-plane of the build from the x-axis [degrees]
+            polar               = angle from the z-axis of the build [degrees]
+            n_components        = number of measured components (2 or 3)
+
+    """
+    # Select the component rows by the parsed axis of every unique name
+    fields = mychars.char_fields(df['char_name'])
+    rows = fields['axis'].notna().to_numpy()
+    names = df['char_name'].to_numpy()[rows]
+    axis = AXES.get_indexer(fields['axis'].to_numpy()[rows])
+
+    # Codes of the characteristics without axis and of the parts
+    char_codes, chars = pd.factorize(pd.Series(names).str.rsplit('.', n=1).str[0])
+    part_codes, parts = pd.factorize(df['part_name'].to_numpy()[rows])
+
+    # Sum and count the components of every characteristic and part in a single pass
+    keys, inverse = np.unique(char_codes.astype(np.int64) * len(parts) + part_codes, return_inverse=True)
+    flat = inverse * 3 + axis
+    sums = np.bincount(flat, weights=df['error'].to_numpy()[rows], minlength=len(keys) * 3).reshape(-1, 3)
+    counts = np.bincount(flat, minlength=len(keys) * 3).reshape(-1, 3)
+    vectors = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+    # Undo the part rotation about the x-axis
+    angles = np.radians(layout['angle'].reindex(parts[keys % len(parts)]).to_numpy(dtype=float))
+    cos, sin = np.cos(angles), np.sin(angles)
+    build = np.column_stack([vectors[:, 0],
+                             vectors[:, 1] * cos - vectors[:, 2] * sin,
+                             vectors[:, 1] * sin + vectors[:, 2] * cos])
+
+    # Magnitude and polar angles
+    magnitude = np.sqrt((build ** 2).sum(axis=1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        polar = np.degrees(np.arccos(np.clip(build[:, 2] / magnitude, -1, 1)))
+    azimuth = np.degrees(np.arctan2(build[:, 1], build[:, 0]))
+
+    return pd.DataFrame({'char': pd.Categorical.from_codes(keys // len(parts), chars),
+                         'part_name': pd.Categorical.from_codes(keys % len(parts), parts),
+                         'x': vectors[:, 0].astype(np.float32),
+                         'y': vectors[:, 1].astype(np.float32),
+                         'z': vectors[:, 2].astype(np.float32),
+                         'build_x': build[:, 0].astype(np.float32),
+                         'build_y': build[:, 1].astype(np.float32),
+                         'build_z': build[:, 2].astype(np.float32),
+                         'magnitude': magnitude.astype(np.float32),
+                         'azimuth': azimuth.astype(np.float32),
+                         'polar': polar.astype(np.float32),
+                         'n_components': (counts > 0).sum(axis=1).astype(np.int8)})
+
+
+def read_stl(path):
+    """
+    Read the triangles of a binary STL-file.
+
+    Arguments:
+        path = path to the STL-file
+
+    Return:
+        a float32 array of shape (n, 3, 3) with the vertices of every triangle
+
+    """
+    # Record layout of a binary STL-file (after the 80 byte header and triangle count)
+    dtype = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attr', '<u2')])
+
+    with open(path, 'rb') as f:
+        f.seek(80)
+        n = int(np.fromfile(f, dtype='<u4', count=1)[0])
+        records = np.fromfile(f, dtype=dtype, count=n)
+
+    return records['vertices']
+
+
+# Coaxial pairs of cylinders (see data_description.txt)
+COAXIAL_PAIRS = {'CC1_8-4': ['Cyl_8mm_Pos', 'Cyl_4mm_Pos'],
+                 'CC1_16-24': ['Cyl_16mm_Neg', 'Cyl_24mm_Neg'],
+                 'CC1_8-5': ['Cyl_8mm_Neg', 'Cyl_4mm_Neg'],
+                 'CC1_24-16': ['Cyl_24mm_Pos', 'Cyl_16mm_Pos']}
+
+
+def _stl_components(tri, mask):
+    """
+    Get the indices of the facets of every connected surface (facets sharing a vertex) among the masked facets.
+
+    """
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+
+    idx = np.flatnonzero(mask)
+    _, vertex = np.unique(np.round(tri[idx].reshape(-1, 3), 4), axis=0, return_inverse=True)
+    rows = np.repeat(np.arange(len(idx)), 3)
+    incidence = sparse.csr_matrix((np.ones(len(rows)), (rows, vertex.ravel())))
+    n, labels = connected_components(incidence @ incidence.T, directed=False)
+
+    return [idx[labels == c] for c in range(n)]
+
+
+def _fit_circle(xy):
+    """
+    Fit a circle to points by least squares (x² + y² = 2ax + 2by + c).
+
+    Return:
+        a tuple with the centre (a, b), the radius and the largest distance of a point from the circle
+
+    """
+    a, b, c = np.linalg.lstsq(np.c_[2 * xy, np.ones(len(xy))], (xy ** 2).sum(axis=1), rcond=None)[0]
+    r = math.sqrt(c + a ** 2 + b ** 2)
+
+    return a, b, r, np.abs(np.linalg.norm(xy - [a, b], axis=1) - r).max()
+
+
+def derive_feature_offsets(path=os.path.join('artifacts', 'Leirmo_Exp1_Main_Artifact.stl')):
+    """
+    Derive the nominal offsets of the features from the centre of the specimen from its STL-file.
+
+    The vertical surfaces are fitted by circles (cylinders) or grouped by their six
+    directions (hexagons, planes numbered as in get_planes), and the slanted surfaces
+    are fitted by cones (a circle at the bottom and at the top) or spheres.
+    Cylinders, cones and spheres are placed on their axis at mid-height, and planes at
+    their centroid. Coaxial pairs and opposite planes are placed between the two
+    features, and the lines of spheres and cones (e.g. 'SP_Neg_Low') at their feature.
+    The centre of the specimen is the centre of its bounding box (as in Magics).
+
+    Arguments:
+        path = path to the STL-file (default = "artifacts/Leirmo_Exp1_Main_Artifact.stl")
+
+    Return:
+        a dataframe indexed by feature key with the offsets 'dx', 'dy' and 'dz' [mm] and
+        'source' ('stl' for features fitted or combined, 'stl_feature' for the lines of a feature)
+
+    """
+    tri = read_stl(path).astype(np.float64)
+    cross = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    area = np.linalg.norm(cross, axis=1) / 2
+    keep = area > 0
+    tri, area = tri[keep], area[keep]
+    normals = cross[keep] / (2 * area[:, None])
+    centroids = tri.mean(axis=1)
+    centre = (tri.reshape(-1, 3).min(axis=0) + tri.reshape(-1, 3).max(axis=0)) / 2
+
+    positions = {}
+
+    # Positive features face away from their centre (or axis, if given in x and y only)
+    polarity = lambda fi, c: 'Pos' if np.average(((centroids[fi, :len(c)] - c) * normals[fi, :len(c)]).sum(axis=1),
+                                                  weights=area[fi]) > 0 else 'Neg'
+
+    # Vertical surfaces: cylinders and hexagons
+    for fi in _stl_components(tri, np.abs(normals[:, 2]) < 0.02):
+        if area[fi].sum() < 1:
+            continue
+        points = np.unique(tri[fi].reshape(-1, 3), axis=0)
+        z = (points[:, 2].min() + points[:, 2].max()) / 2
+
+        # Cylinder, if all vertices are on a circle
+        a, b, r, error = _fit_circle(points[:, :2])
+        if error < 0.01:
+            key = 'Cyl_{:g}mm_{}'.format(round(2 * r), polarity(fi, [a, b]))
+            positions[key] = np.array([a, b, z])
+            continue
+
+        # Hexagon, if all faces are in six directions 60 degrees apart
+        angle = np.round(np.degrees(np.arctan2(normals[fi, 1], normals[fi, 0]))).astype(int) % 360
+        if len(np.unique(angle)) != 6 or len(np.unique(angle % 60)) != 1:
+            continue
+        hexagon, first = (1, 210) if angle[0] % 60 == 30 else (2, 240)
+        planes = {}
+        for j in np.unique(angle):
+            m = angle == j
+            planes[((j - first) // 60 - 1) % 6 + 1] = np.average(centroids[fi[m]], axis=0, weights=area[fi[m]])
+        for j in range(1, 7):
+            positions['HX{}_Plane{}'.format(hexagon, j)] = planes[j]
+        for j in range(1, 4):
+            positions['HX{}_{}-{}'.format(hexagon, j, j + 3)] = (planes[j] + planes[j + 3]) / 2
+
+    # Slanted surfaces: spheres and cones
+    for fi in _stl_components(tri, (np.abs(normals[:, 2]) >= 0.02) & (np.abs(normals[:, 2]) < 0.98)):
+        if area[fi].sum() < 1:
+            continue
+        points = np.unique(tri[fi].reshape(-1, 3), axis=0)
+        heights = np.unique(np.round(points[:, 2], 3))
+
+        # Cone, if the vertices are on two circles (the bottom and top of the cone)
+        if len(heights) == 2:
+            bottom = _fit_circle(points[np.round(points[:, 2], 3) == heights[0], :2])
+            top = _fit_circle(points[np.round(points[:, 2], 3) == heights[1], :2])
+            a, b = (bottom[0] + top[0]) / 2, (bottom[1] + top[1]) / 2
+            key = 'Cone_{:g}mm_{}'.format(round(2 * max(bottom[2], top[2])), polarity(fi, [a, b]))
+            positions[key] = np.array([a, b, heights.mean()])
+            continue
+
+        # Sphere by least squares, x² + y² + z² = 2ax + 2by + 2cz + d
+        sol = np.linalg.lstsq(np.c_[2 * points, np.ones(len(points))], (points ** 2).sum(axis=1), rcond=None)[0]
+        r = math.sqrt(sol[3] + (sol[:3] ** 2).sum())
+        if np.abs(np.linalg.norm(points - sol[:3], axis=1) - r).max() < 0.01:
+            positions['SP_{}'.format(polarity(fi, sol[:3]))] = sol[:3]
+
+    # Base plate: the largest horizontal surface facing upwards
+    up = normals[:, 2] > 0.98
+    levels = np.round(centroids[up, 2], 2)
+    largest = pd.Series(area[up]).groupby(levels).sum().idxmax()
+    m = np.flatnonzero(up)[levels == largest]
+    positions['Base_Plate'] = np.average(centroids[m], axis=0, weights=area[m])
+
+    # Coaxial pairs between their cylinders
+    for key, pair in COAXIAL_PAIRS.items():
+        if all(p in positions for p in pair):
+            positions[key] = (positions[pair[0]] + positions[pair[1]]) / 2
+
+    df = pd.DataFrame(positions, index=['dx', 'dy', 'dz']).T - centre
+    df['source'] = 'stl'
+
+    # Lines of the spheres and cones at their feature
+    lines = [[f + '_' + s for s in ['Low', 'Mid', 'Hi']] for f in df.index if f.startswith('SP_')]
+    lines += [[f + '_' + s for s in ['Low', 'Mid', 'Top']] for f in df.index if f.startswith('Cone_')]
+    features = {line: line.rsplit('_', 1)[0] for group in lines for line in group}
+    sub = df.loc[list(features.values()), ['dx', 'dy', 'dz']].set_axis(list(features.keys()))
+    df = pd.concat([df, sub.assign(source='stl_feature')])
+    df.index.name = 'feature_key'
+
+    return df.round(3)
+
+
+@profiled
+def orientation_histograms(path, angles=None, bins=36, x=170, y=170):
+    """
+    Calculate area-weighted histograms of the facet orientation of an STL-file
+    for a set of part orientations.
+
+    The triangle normals are rotated about the x-axis (as the 'angle' in the layout)
+    for all orientations in a single batched operation. The z-angle is the angle
+    between the facet normal and the build direction, and the laser angle is the
+    angle between the facet normal and the vector from (x, y) to the laser.
+
+    Arguments:
+        path = path to the STL-file
+        angles = list of part rotations in degrees (default = 0-180 in steps of 5 and -90)
+        bins = number of bins between 0 and 180 degrees (default = 36)
+        x = x-position of the part (default = 170)
+        y = y-position of the part (default = 170)
+
+    Return:
+        two dataframes (z-angle and laser angle) with the facet area [mm²]
+        per bin as columns and the part rotation as index
+
+    """
+    if angles is None:
+        angles = list(range(0, 181, 5)) + [-90]
+    angles = np.asarray(angles, dtype=np.float64)
+
+    # Calculate area-weighted normals from the triangle vertices
+    tri = read_stl(path).astype(np.float64)
+    cross = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    area = np.linalg.norm(cross, axis=1) / 2
+    keep = area > 0
+    normals = cross[keep] / (2 * area[keep, None])
+    area = area[keep]
+
+    # Rotate the normals about the x-axis for every orientation at once (k, n)
+    a = np.radians(angles)[:, None]
+    n_y = np.cos(a) * normals[:, 1] - np.sin(a) * normals[:, 2]
+    n_z = np.sin(a) * normals[:, 1] + np.cos(a) * normals[:, 2]
+
+    # Angle to the build direction
+    z_angle = np.degrees(np.arccos(np.clip(n_z, -1, 1)))
+
+    # Angle to the laser (see calc_laser_angle)
+    laser = np.array([170 - x, 170 - y, 600], dtype=np.float64)
+    laser /= np.linalg.norm(laser)
+    cos_l = normals[:, 0] * laser[0] + n_y * laser[1] + n_z * laser[2]
+    laser_angle = np.degrees(np.arccos(np.clip(cos_l, -1, 1)))
+
+    # Area-weighted histograms for all orientations using a single bincount each
+    edges = np.linspace(0, 180, bins + 1)
+    offset = (np.arange(len(angles)) * bins)[:, None]
+    weights = np.broadcast_to(area, z_angle.shape).ravel()
+
+    result = []
+    for values in [z_angle, laser_angle]:
+        idx = np.clip(np.digitize(values, edges) - 1, 0, bins - 1) + offset
+        hist = np.bincount(idx.ravel(), weights=weights, minlength=len(angles) * bins)
+        result.append(pd.DataFrame(hist.reshape(len(angles), bins),
+                                   index=pd.Index(angles.astype(int), name='angle'),
+                                   columns=edges[:-1]))
+
+    return result[0], result[1]
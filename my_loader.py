@@ -0,0 +1,224 @@
+"""
+Module for loading all inputs of an experiment concurrently.
+
+A full analysis reads the layout, the results, the slice distributions, the
+room data of every build and the weather data. Every file is parsed into its
+compact form by the loader of its module (my_functions, my_environment) in a
+thread pool, so that reading and parsing of the files overlap. Every load is
+recorded in a single report of the file, time and number of rows.
+
+    bundle = my_loader.load_bundle('data', verbose=True)
+    bundle.layout, bundle.results, bundle.slices, bundle.room, bundle.weather
+    store = bundle.environment()
+
+
+Contents:
+    Bundle(folder)                              # Loaded inputs of a single experiment and the report of the loads
+    load_bundle(folder='data', ...)             # Load all inputs of an experiment concurrently
+    load_bundles(folders, ...)                  # Load several experiments in a single thread pool
+
+"""
+
+# Import libraries
+
+import os
+import time
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import my_functions as func
+import my_environment as myenv
+
+##############################################################################
+
+# Slice distributions of the experiment (see load_slice_distribution)
+SLICE_FILES = ['build1', 'build2', 'build3', 'build1_main', 'spheres']
+
+# Builds of the experiment
+BUILDS = [1, 2, 3]
+
+
+class Bundle:
+    """
+    Loaded inputs of a single experiment. Inputs without a file in the folder are None.
+
+    Arguments:
+        folder = folder containing the data of the experiment
+
+    Attributes:
+        folder = folder containing the data
+        layout = dataframe of the layout indexed by part_name (see load_layout)
+        results = dataframe of the results (see load_results)
+        slices = dataframe of the slice distributions on a shared height grid (see load_slice_distribution)
+        room = dataframe of the room data of all builds indexed by build and time (see parse_room_data)
+        weather = dataframe of the weather data indexed by date (see load_weather_data)
+        report = dataframe of the loads with 'input', 'file', 'seconds', 'rows' and 'thread'
+
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.layout = None
+        self.results = None
+        self.slices = None
+        self.room = None
+        self.weather = None
+        self.report = None
+
+    def __repr__(self):
+        loaded = [k for k in ['layout', 'results', 'slices', 'room', 'weather'] if getattr(self, k) is not None]
+        return "Bundle({!r}, {})".format(self.folder, loaded)
+
+    def environment(self):
+        """
+        Get a store of the room and weather data (see my_environment.EnvironmentStore).
+
+        """
+        return myenv.EnvironmentStore(self.room, self.weather)
+
+
+def _read_layout(folder):
+    """
+    Read the pickled layout if available, else the layout-file.
+
+    """
+    path = os.path.join(folder, 'layout_data.pkl')
+    if os.path.exists(path):
+        return path, pd.read_pickle(path)
+    return os.path.join(folder, 'leirmo_exp1_layout.csv'), func.load_layout(folder)
+
+
+def _read_results(folder):
+    """
+    Read the pickled results if available, else the results-file.
+
+    """
+    path = os.path.join(folder, 'prep_data.pkl')
+    if os.path.exists(path):
+        return path, pd.read_pickle(path)
+    return os.path.join(folder, 'Leirmo_Exp1_ALL.csv'), func.load_results(folder)
+
+
+def _tasks(folder, builds, slices):
+    """
+    Get the loads of an experiment as (input, function) pairs, skipping missing files.
+
+    The functions return the path of the file and the parsed data.
+
+    """
+    exists = lambda f: os.path.exists(os.path.join(folder, f))
+    tasks = []
+
+    if exists('layout_data.pkl') or exists('leirmo_exp1_layout.csv'):
+        tasks.append(('layout', lambda: _read_layout(folder)))
+    if exists('prep_data.pkl') or exists('Leirmo_Exp1_ALL.csv'):
+        tasks.append(('results', lambda: _read_results(folder)))
+
+    # One load per file (slice files are parsed once and aligned afterwards)
+    for s in slices:
+        path = os.path.join(folder, 'Slice_distribution_{}.csv'.format(s))
+        if os.path.exists(path):
+            tasks.append(('slice_{}'.format(s), lambda p=path: (p, func.read_slice_file(p))))
+    for b in builds:
+        path = os.path.join(folder, 'Room_data_Build_{}.csv'.format(b))
+        if os.path.exists(path):
+            tasks.append(('room_{}'.format(b), lambda b=b, p=path: (p, myenv.load_room_data(b, folder))))
+    if exists('Weather_data.csv'):
+        tasks.append(('weather', lambda: (os.path.join(folder, 'Weather_data.csv'), myenv.load_weather_data(folder))))
+
+    return tasks
+
+
+def _timed(key, function):
+    """
+    Run a load and record its time (executed in a worker thread).
+
+    """
+    start = time.perf_counter()
+    path, data = function()
+    seconds = time.perf_counter() - start
+
+    return key, data, {'input': key[1], 'file': path, 'seconds': seconds, 'rows': len(data),
+                       'thread': threading.current_thread().name}
+
+
+def load_bundles(folders, builds=BUILDS, slices=SLICE_FILES, jobs=None, verbose=False):
+    """
+    Load all inputs of several experiments in a single thread pool.
+
+    Arguments:
+        folders = list of folders of the experiments
+        builds = list of build numbers of the room data (default = [1, 2, 3])
+        slices = list of slice distributions (default = SLICE_FILES)
+        jobs = number of threads (default = None, i.e. the default of ThreadPoolExecutor)
+        verbose = print every finished load (default = False)
+
+    Return:
+        a dictionary of Bundles by folder (the report of every bundle holds its own loads,
+        the time of the whole load is stored in report.attrs['seconds'])
+
+    """
+    tasks = [((folder, name), function) for folder in folders for name, function in _tasks(folder, builds, slices)]
+    loaded = {folder: {} for folder in folders}
+    records = {folder: [] for folder in folders}
+
+    # Load all files concurrently
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_timed, key, function) for key, function in tasks]
+        for i, future in enumerate(as_completed(futures)):
+            (folder, name), data, record = future.result()
+            loaded[folder][name] = data
+            records[folder].append(record)
+            if verbose:
+                print("[{}/{}] {:<20} {:>8.3f} s {:>9} rows   {}".format(i + 1, len(tasks), name, record['seconds'],
+                                                                        record['rows'], record['file']))
+    seconds = time.perf_counter() - start
+
+    # Combine the loads of every experiment
+    bundles = {}
+    for folder in folders:
+        data = loaded[folder]
+        bundle = Bundle(folder)
+        bundle.layout = data.get('layout')
+        bundle.results = data.get('results')
+
+        # Align the parsed slice distributions
+        found = [s for s in slices if 'slice_{}'.format(s) in data]
+        if found:
+            bundle.slices = func.align_slices([data['slice_{}'.format(s)] for s in found], found)
+
+        rooms = [data['room_{}'.format(b)] for b in builds if 'room_{}'.format(b) in data]
+        if rooms:
+            bundle.room = pd.concat(rooms)
+        bundle.weather = data.get('weather')
+
+        report = pd.DataFrame(records[folder], columns=['input', 'file', 'seconds', 'rows', 'thread'])
+        bundle.report = report.sort_values('seconds', ascending=False).reset_index(drop=True)
+        bundle.report.attrs['seconds'] = seconds
+        bundles[folder] = bundle
+
+    if verbose:
+        total = sum(b.report['seconds'].sum() for b in bundles.values())
+        print("Loaded {} files in {:.3f} s (sum of loads {:.3f} s)".format(len(tasks), seconds, total))
+
+    return bundles
+
+
+def load_bundle(folder='data', builds=BUILDS, slices=SLICE_FILES, jobs=None, verbose=False):
+    """
+    Load all inputs of an experiment concurrently.
+
+    Arguments:
+        folder = folder containing the data (default = 'data')
+        builds = list of build numbers of the room data (default = [1, 2, 3])
+        slices = list of slice distributions (default = SLICE_FILES)
+        jobs = number of threads (default = None, i.e. the default of ThreadPoolExecutor)
+        verbose = print every finished load (default = False)
+
+    Return:
+        a Bundle
+
+    """
+    return load_bundles([folder], builds, slices, jobs, verbose)[folder]
@@ -0,0 +1,271 @@
+"""
+Module of an optimizer for the placement of parts in a build.
+
+The parts are placed at positions and rotations (about the x-axis) within the
+build volume to minimise the predicted weighted error of chosen characteristics:
+    cost of a part = predicted error at its position (see my_field.py)
+                   + effect of its rotation (mean error by rotation in the data)
+                   + laser_weight * laser angle of its top face (see my_functions.laser_angles)
+Parts closer than the spacing in the xy-plane and in z are penalised.
+
+The search starts from the best positions on a lattice that satisfies the
+spacing, and improves the layout by moving one part at a time. Every iteration
+scores a batch of candidate moves in a single vectorized operation, and
+independent searches (restarts) run in a process pool.
+
+
+Contents:
+    PlacementProblem(field, angles, ...)        # Cost model and constraints of a placement
+    make_problem(chars, weights=None, ...)      # Create a problem from the fitted error fields and the data
+    initial_layout(problem, n_parts)            # Best positions on a lattice satisfying the spacing
+    search(problem, positions, angles, ...)     # Improve a layout by batched moves of single parts
+    optimize_layout(problem, n_parts, ...)      # Run searches in a process pool and return the best layout
+
+"""
+
+# Import libraries
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+import my_functions as func
+import my_field as myfield
+
+##############################################################################
+
+# Rotations about the x-axis used in the experiment [degrees] (0-180 in steps of 5, and -90 for the anchor specimen)
+ANGLES = [-90] + list(range(0, 181, 5))
+
+
+class PlacementProblem:
+    """
+    Cost model and constraints of a placement.
+
+    Arguments:
+        field = an ErrorField of the (weighted) predicted error
+        angles = list of allowed rotations about the x-axis [degrees]
+        angle_cost = cost of every rotation (default = None, i.e. zero)
+        laser_weight = cost per degree of laser angle (default = 0)
+        spacing_xy = minimum distance between part centres in the xy-plane [mm] (default = 60)
+        spacing_z = minimum distance between part centres in z [mm] (default = 60)
+        bounds = bounds of the part centres per axis (default = 40 mm inside the build volume)
+        penalty = cost per mm² of violated spacing (default = 1.0)
+
+    """
+
+    def __init__(self, field, angles=ANGLES, angle_cost=None, laser_weight=0.0, spacing_xy=60.0, spacing_z=60.0,
+                 bounds=((40, 300), (40, 300), (40, 560)), penalty=1.0):
+        self.field = field
+        self.angles = np.asarray(angles, dtype=float)
+        self.angle_cost = np.zeros(len(angles)) if angle_cost is None else np.asarray(angle_cost, dtype=float)
+        self.laser_weight = laser_weight
+        self.spacing_xy = spacing_xy
+        self.spacing_z = spacing_z
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.penalty = penalty
+
+    def part_cost(self, points, angle_idx):
+        """
+        Cost of parts at positions (... x 3) with rotations given by index into angles (...).
+
+        """
+        cost = self.field.evaluate(points) + self.angle_cost[angle_idx]
+
+        # Laser angle of the top face after rotation
+        if self.laser_weight:
+            laser = func.laser_angles(points[..., 0], points[..., 1], self.angles[angle_idx])
+            cost = cost + self.laser_weight * laser
+
+        return cost
+
+    def overlap(self, a, b):
+        """
+        Violation of the spacing between positions a (... x 3) and b (... x 3) [mm²].
+
+        """
+        dxy = np.sqrt(((a[..., :2] - b[..., :2]) ** 2).sum(axis=-1))
+        dz = np.abs(a[..., 2] - b[..., 2])
+        return np.maximum(self.spacing_xy - dxy, 0) * np.maximum(self.spacing_z - dz, 0)
+
+    def score(self, positions, angle_idx):
+        """
+        Total cost of a batch of layouts.
+
+        Arguments:
+            positions = array of positions (B x N x 3)
+            angle_idx = array of rotation indices (B x N)
+
+        Return:
+            an array of costs (B)
+
+        """
+        cost = self.part_cost(positions, angle_idx).sum(axis=-1)
+
+        # Every pair of parts counted once
+        overlap = self.overlap(positions[:, :, None, :], positions[:, None, :, :])
+        overlap = np.triu(overlap, k=1).sum(axis=(1, 2))
+
+        return cost + self.penalty * overlap
+
+
+def make_problem(chars, weights=None, folder='data', absolute=True, **kwargs):
+    """
+    Create a placement problem from the error fields and the rotation effects of characteristics.
+
+    Arguments:
+        chars = a list of characteristic names
+        weights = a dictionary of weights by characteristic (default = None, i.e. all 1)
+        folder = folder containing the pickled data (default = 'data')
+        absolute = minimise the magnitude of the error rather than the signed error (default = True)
+        kwargs = arguments of PlacementProblem (angles, laser_weight, spacing_xy, ...), the
+                 default angles are the rotations of the parts in the layout
+
+    Return:
+        a PlacementProblem
+
+    """
+    weights = np.array([1.0 if weights is None else weights.get(c, 0.0) for c in chars])
+    fields = myfield.fit_error_fields(chars, folder=folder)
+
+    # Weighted sum of the predicted errors
+    grids = np.stack([fields[c].grid for c in chars])
+    field = myfield.combine_fields([fields[c] for c in chars], weights)
+    if absolute:
+        field.grid = np.tensordot(weights.astype(np.float32), np.abs(grids), axes=1)
+
+    # Effect of the rotation: weighted mean error by rotation relative to the mean of every characteristic
+    df = func.get_char_means(chars, ['char', 'error', 'angle'], folder=folder)
+    angles = np.asarray(kwargs.pop('angles', np.unique(df['angle'])), dtype=float)
+    if absolute:
+        df = df.assign(error=df['error'].abs())
+    effect = df.groupby(['char', 'angle'], observed=True)['error'].mean().unstack('angle')
+    effect = effect.sub(df.groupby('char', observed=True)['error'].mean(), axis=0)
+    effect = effect.reindex(index=chars, columns=angles).fillna(0)
+    angle_cost = weights @ effect.to_numpy()
+
+    return PlacementProblem(field, angles=angles, angle_cost=angle_cost, **kwargs)
+
+
+def initial_layout(problem, n_parts):
+    """
+    Get the best positions on a lattice with the spacing of the problem, each with its best rotation.
+
+    Return:
+        a tuple with the positions (N x 3) and the rotation indices (N)
+
+    """
+    axes = [np.arange(lo, hi + 1e-9, s) for (lo, hi), s in
+            zip(problem.bounds, [problem.spacing_xy, problem.spacing_xy, problem.spacing_z])]
+    slots = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    if len(slots) < n_parts:
+        raise ValueError("The build volume holds at most {} parts with the given spacing".format(len(slots)))
+
+    # Cost of every slot with every rotation, keeping the best rotation of every slot
+    idx = np.broadcast_to(np.arange(len(problem.angles)), (len(slots), len(problem.angles)))
+    costs = problem.part_cost(np.repeat(slots[:, None, :], len(problem.angles), axis=1), idx)
+    best = costs.argmin(axis=1)
+    order = np.argsort(costs[np.arange(len(slots)), best])[:n_parts]
+
+    return slots[order], best[order]
+
+
+def search(problem, positions, angle_idx, iterations=2000, batch=64, step=20.0, temperature=0.0, seed=0):
+    """
+    Improve a layout by moving one part at a time. Every iteration proposes a
+    batch of moves (new position and/or rotation of a random part), scores the
+    change in cost of all of them at once and applies the best one.
+
+    Arguments:
+        problem = a PlacementProblem
+        positions, angle_idx = the initial layout (N x 3 and N)
+        iterations = number of iterations (default = 2000)
+        batch = number of candidate moves per iteration (default = 64)
+        step = standard deviation of the moves [mm] (default = 20)
+        temperature = accept worse moves with probability exp(-delta/temperature) (default = 0, i.e. never)
+        seed = seed of the random number generator (default = 0)
+
+    Return:
+        a tuple with the positions, the rotation indices and the total cost
+
+    """
+    rng = np.random.default_rng(seed)
+    positions = np.array(positions, dtype=float)
+    angle_idx = np.array(angle_idx)
+    n = len(positions)
+    lo, hi = problem.bounds[:, 0], problem.bounds[:, 1]
+    part_cost = problem.part_cost(positions, angle_idx)
+
+    for it in range(iterations):
+        # Candidate moves of random parts (half of them also change the rotation)
+        k = rng.integers(n, size=batch)
+        new_pos = np.clip(positions[k] + rng.normal(0, step, (batch, 3)), lo, hi)
+        new_angle = np.where(rng.random(batch) < 0.5, rng.integers(len(problem.angles), size=batch), angle_idx[k])
+
+        # Change in cost of the moved part and of its overlap with all other parts
+        others = np.arange(n)[None, :] != k[:, None]
+        old_overlap = (problem.overlap(positions[k][:, None, :], positions[None, :, :]) * others).sum(axis=1)
+        new_overlap = (problem.overlap(new_pos[:, None, :], positions[None, :, :]) * others).sum(axis=1)
+        new_cost = problem.part_cost(new_pos, new_angle)
+        delta = new_cost - part_cost[k] + problem.penalty * (new_overlap - old_overlap)
+
+        # Apply the best move if it improves (or by chance at a temperature)
+        b = delta.argmin()
+        T = temperature * (1 - it / iterations)
+        if delta[b] < 0 or (T > 0 and rng.random() < np.exp(-delta[b] / T)):
+            positions[k[b]] = new_pos[b]
+            angle_idx[k[b]] = new_angle[b]
+            part_cost[k[b]] = new_cost[b]
+
+    total = problem.score(positions[None], angle_idx[None])[0]
+
+    return positions, angle_idx, total
+
+
+def _run_search(args):
+    """
+    Run a single search (executed in a worker process).
+
+    """
+    problem, positions, angle_idx, kwargs = args
+    return search(problem, positions, angle_idx, **kwargs)
+
+
+def optimize_layout(problem, n_parts, restarts=4, jobs=None, seed=0, **kwargs):
+    """
+    Optimize the placement of parts by independent searches in a process pool.
+
+    Arguments:
+        problem = a PlacementProblem
+        n_parts = number of parts
+        restarts = number of independent searches (default = 4)
+        jobs = number of worker processes (default = None, i.e. one per CPU)
+        seed = seed of the first search (default = 0)
+        kwargs = arguments of search (iterations, batch, step, temperature)
+
+    Return:
+        a dataframe of the best layout with 'part_index', 'center_x/y/z', 'angle' and the 'cost' of every part
+        (the total cost, including the penalty of violated spacing, is stored in attrs['cost'])
+
+    """
+    positions, angle_idx = initial_layout(problem, n_parts)
+
+    # Independent searches from the same start with different seeds
+    tasks = [(problem, positions, angle_idx, dict(kwargs, seed=seed + i)) for i in range(restarts)]
+    if restarts == 1 or jobs == 1:
+        results = [_run_search(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_run_search, tasks))
+
+    positions, angle_idx, total = min(results, key=lambda r: r[2])
+
+    df = pd.DataFrame({'part_index': np.arange(1, n_parts + 1),
+                       'center_x': positions[:, 0],
+                       'center_y': positions[:, 1],
+                       'center_z': positions[:, 2],
+                       'angle': problem.angles[angle_idx],
+                       'cost': problem.part_cost(positions, angle_idx)})
+    df.attrs['cost'] = total
+
+    return df
@@ -6,35 +6,49 @@ Created by Torbjørn L. Leirmo
 
 
 Contents:
-    p_val_heat_map(ax, df)                      # Create heatmap for p-values
+    p_val_heat_map(ax, df, fast=False)          # Create heatmap for p-values
+    binned_scatter(ax, data, x, y, hue=None)    # Scatterplot rendered as a density raster
+    save_figure(fig, name, formats=[...])       # Save a figure in several formats with a single raster render
 
 """
 
 # Import libraries
 
+import io
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+
+# seaborn and matplotlib are imported on first use (the axes and figures are passed in)
 
 ##############################################################################
 
-def p_val_heat_map(ax, df):
+# Resolution of every output format (for PDF the resolution of rasterized artists)
+DPI = {'jpeg': 600, 'png': 600, 'tiff': 600, 'pdf': 300}
+
+# Number of elements (points, vertices) above which an artist is rasterized in vector output
+#   PS: Below this, vector output is usually smaller than the raster
+RASTER_THRESHOLD = 50000
+
+
+def p_val_heat_map(ax, df, fast=False, max_annotations=400, threshold=5):
     """
     Create a heatmap from a dataframe of p-values.
 
     Arguments:
         ax = an axis-object (empty)
         df = dataframe of p-values (see my_functions.py)
+        fast = thin out the annotations of large matrices (default = False)
+        max_annotations = maximum number of annotated cells in fast mode, the most significant
+                          are kept (default = 400)
+        threshold = in fast mode, large matrices only annotate p-values below this percentage (default = 5)
 
     Return:
         ax = the axis-object now with the plot
 
     """
 
-    # Replace NA-values with ones and multiply show percent
-    df.fillna(1, inplace=True)
-    df = df.applymap(lambda x: x*100)
+    # Replace NA-values with ones and multiply show percent (without changing the input)
+    values = df.fillna(1).to_numpy(dtype=float) * 100
 
     # Set labels for all ticks
     x_labels = df.columns
@@ -44,7 +58,8 @@ def p_val_heat_map(ax, df):
     cmap = "RdYlGn"
 
     # Initialize figure
-    im = ax.imshow(df, cmap=cmap, vmin=0, vmax=100)
+    #   PS: The cells are a single image, which is embedded as a raster in vector output
+    im = ax.imshow(values, cmap=cmap, vmin=0, vmax=100)
 
     # Create colorbar
     cbar = ax.figure.colorbar(im, ax=ax)
@@ -58,14 +73,207 @@ def p_val_heat_map(ax, df):
     ax.set_xticklabels(x_labels)
     ax.set_yticklabels(y_labels)
 
-    # Loop over data dimensions and create text annotations
-    for i in range(len(x_labels)):
-        for j in range(len(y_labels)):
-            ax.text(j, i, "{:.2f} %".format(df.iloc[i,j]),
-                   ha="center", va="center", color="black")
+    # Select the cells to annotate
+    rows, cols = np.indices(values.shape)
+    show = np.ones(values.shape, dtype=bool)
+    if fast and values.size > max_annotations:
+        # Only annotate the significant cells, and only the most significant if there are still too many
+        show = values < threshold
+        if show.sum() > max_annotations:
+            keep = np.argsort(values, axis=None, kind='stable')[:max_annotations]
+            show = np.zeros(values.shape, dtype=bool)
+            show.flat[keep] = True
+
+    # Create text annotations
+    for i, j, value in zip(rows[show], cols[show], values[show]):
+        ax.text(j, i, "{:.2f} %".format(value), ha="center", va="center", color="black")
 
     # Remove a potential grid
     ax.grid(False)
 
     # Return the axis-object containing the plot
-    return ax
\ No newline at end of file
+    return ax
+
+
+def binned_scatter(ax, data, x, y, hue=None, palette='colorblind', bins=None, legend=True, dpi=None):
+    """
+    Create a scatterplot rendered as a density raster.
+
+    The points are binned into one 2D histogram per hue category with a single
+    bincount, and drawn as an image where every pixel has the colour of the most
+    frequent category and an opacity given by the (log) number of points. The
+    render time and file size are thus given by the resolution, not the number
+    of points. Reference lines etc. can be added to the axis as usual.
+
+    Arguments:
+        ax = an axis-object
+        data = a dataframe
+        x = column name (or array) for the x-axis
+        y = column name (or array) for the y-axis
+        hue = column name (or array) for colouring by category (default = None)
+        palette = name of a seaborn palette (default = 'colorblind')
+        bins = number of bins as (nx, ny) (default = None, i.e. one bin per pixel of the axis when saved)
+        legend = create a legend for the categories (default = True)
+        dpi = resolution of the saved figure for the default bins (default = None, i.e. DPI['png'])
+
+    Return:
+        ax = the axis-object now with the plot
+
+    """
+    # Get the values as arrays
+    x_val = np.asarray(data[x] if isinstance(x, str) else x, dtype=float)
+    y_val = np.asarray(data[y] if isinstance(y, str) else y, dtype=float)
+
+    # Find the categories (in order of appearance, as seaborn)
+    if hue is None:
+        codes = np.zeros(len(x_val), dtype=np.int64)
+        labels = [None]
+    else:
+        codes, labels = pd.factorize(data[hue] if isinstance(hue, str) else hue)
+
+    import seaborn as sns
+    colors = np.array(sns.color_palette(palette, len(labels)))
+
+    # Use one bin per pixel of the axis at the resolution of the saved figure unless specified
+    #   PS: The window extent is given in pixels at the resolution of the figure on screen
+    if bins is None:
+        extent = ax.get_window_extent()
+        scale = (DPI['png'] if dpi is None else dpi) / ax.figure.dpi
+        bins = (max(int(extent.width * scale), 1), max(int(extent.height * scale), 1))
+    nx, ny = bins
+
+    # Remove missing values
+    ok = np.isfinite(x_val) & np.isfinite(y_val) & (codes >= 0)
+    x_val, y_val, codes = x_val[ok], y_val[ok], codes[ok]
+
+    # Leave the axis unchanged if there is nothing to bin
+    if len(x_val) == 0:
+        return ax
+
+    # Define the limits of the raster with a small margin
+    x_min, x_max = x_val.min(), x_val.max()
+    y_min, y_max = y_val.min(), y_val.max()
+    x_pad = (x_max - x_min) * 0.02 or 0.5
+    y_pad = (y_max - y_min) * 0.02 or 0.5
+    x_min, x_max, y_min, y_max = x_min - x_pad, x_max + x_pad, y_min - y_pad, y_max + y_pad
+
+    # Count the points in every bin for every category with a single bincount
+    ix = np.clip(((x_val - x_min) / (x_max - x_min) * nx).astype(np.int64), 0, nx - 1)
+    iy = np.clip(((y_val - y_min) / (y_max - y_min) * ny).astype(np.int64), 0, ny - 1)
+    counts = np.bincount((codes * ny + iy) * nx + ix, minlength=len(labels) * nx * ny)
+    counts = counts.reshape(len(labels), ny, nx)
+
+    # Colour every pixel by its most frequent category and set opacity by log-density
+    #   PS: Single points are kept visible with a minimum opacity
+    total = counts.sum(axis=0)
+    image = np.zeros((ny, nx, 4))
+    image[..., :3] = colors[counts.argmax(axis=0)]
+    image[..., 3] = np.where(total > 0, 0.3 + 0.7 * np.log1p(total) / np.log1p(total.max()), 0)
+
+    # Draw the raster
+    ax.imshow(image, origin='lower', extent=(x_min, x_max, y_min, y_max), aspect='auto',
+              interpolation='nearest', zorder=2)
+
+    # Add an empty labelled marker per category so that ax.legend() works as for scatterplots
+    if hue is not None:
+        for color, label in zip(colors, labels):
+            ax.plot([], [], marker='o', linestyle='', color=color, label=label)
+
+        if legend:
+            ax.legend()
+
+    # Return the axis-object containing the plot
+    return ax
+
+
+def rasterize_heavy_artists(fig, threshold=RASTER_THRESHOLD):
+    """
+    Rasterize the artists of a figure with many elements (e.g. scatterplots and
+    filled density estimates), while text, axes and light artists remain vector.
+
+    Arguments:
+        fig = a figure-object
+        threshold = number of points or vertices above which an artist is rasterized
+                    (default = RASTER_THRESHOLD)
+
+    Return:
+        a list of the rasterized artists
+
+    """
+    rasterized = []
+
+    for ax in fig.axes:
+        for artist in ax.collections:
+            # Count the vertices, as a filled area is a single path with many vertices
+            vertices = sum(len(path.vertices) for path in artist.get_paths())
+            if max(len(artist.get_offsets()), vertices) > threshold:
+                rasterized.append(artist)
+        for artist in ax.lines:
+            if len(artist.get_xdata()) > threshold:
+                rasterized.append(artist)
+
+    for artist in rasterized:
+        artist.set_rasterized(True)
+
+    return rasterized
+
+
+def save_figure(fig, name, formats=['jpeg', 'pdf'], dpi=None, rasterize=True, bbox_inches='tight'):
+    """
+    Save a figure in several formats.
+
+    The figure is rendered once by Agg, and every raster format is written from
+    that single render. Vector formats are saved with heavy artists rasterized
+    (see rasterize_heavy_artists), keeping text and axes as vector graphics.
+
+    Arguments:
+        fig = a figure-object
+        name = file name without extension
+        formats = list of formats (default = ['jpeg', 'pdf'])
+        dpi = dictionary of resolution per format (default = None, i.e. DPI)
+        rasterize = rasterize heavy artists in vector formats (default = True)
+        bbox_inches = bounding box as for savefig (default = 'tight')
+
+    Return:
+        a list of the saved file names
+
+    """
+    from PIL import Image
+
+    dpi = dict(DPI, **(dpi or {}))
+    raster = [f for f in formats if f in ['jpeg', 'jpg', 'png', 'tiff', 'tif']]
+    vector = [f for f in formats if f not in raster]
+    saved = []
+
+    if raster:
+        # Render once at the highest requested resolution
+        res = max(dpi.get(f, dpi['png']) for f in raster)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=res, bbox_inches=bbox_inches)
+        buffer.seek(0)
+        image = Image.open(buffer)
+        image.load()
+
+        # Write every raster format from the same render
+        for f in raster:
+            path = '{}.{}'.format(name, f)
+            if f in ['jpeg', 'jpg']:
+                image.convert('RGB').save(path, quality=95, dpi=(res, res))
+            else:
+                image.save(path, dpi=(res, res))
+            saved.append(path)
+
+    if vector:
+        # Rasterize heavy artists temporarily
+        artists = rasterize_heavy_artists(fig) if rasterize else []
+
+        try:
+            for f in vector:
+                path = '{}.{}'.format(name, f)
+                fig.savefig(path, format=f, dpi=dpi.get(f, dpi['pdf']), bbox_inches=bbox_inches)
+                saved.append(path)
+        finally:
+            for artist in artists:
+                artist.set_rasterized(False)
+
+    return saved
@@ -0,0 +1,234 @@
+"""
+Opt-in instrumentation of the library functions.
+
+Functions decorated with @profiled record the number of calls, wall time,
+rows processed and peak memory while profiling is enabled. When profiling is
+disabled, the decorated function is called directly after a single check.
+
+Profiling is enabled either
+    - by the environment variable MY_PROFILE=1 (MY_PROFILE=time skips the memory
+      tracing), optionally with MY_PROFILE_REPORT=<file.json|file.csv> to write
+      the report when the process exits, or
+    - with the context manager:
+
+        with my_profiling.profile() as stats:
+            char_dict = func.make_char_dict()
+        my_profiling.save_report('profile.csv')
+
+Contents:
+    profiled(function, rows=None)               # Decorator recording calls, time, rows and peak memory
+    enable(memory=True) / disable() / reset()   # Switch profiling on or off and clear the statistics
+    profile(memory=True)                        # Context manager enabling profiling within a block
+    get_report()                                # Recorded statistics as a dataframe
+    save_report(path)                           # Save the statistics as JSON or CSV
+
+"""
+
+# Import libraries
+
+import os
+import time
+import json
+import atexit
+import functools
+import tracemalloc
+import contextlib
+import pandas as pd
+
+##############################################################################
+
+# Environment variables
+ENV_VAR = 'MY_PROFILE'
+ENV_REPORT = 'MY_PROFILE_REPORT'
+
+# State of the instrumentation (checked on every call of a decorated function)
+#   PS: 'tracing' is True if memory tracing was started by enable (and is stopped by disable)
+STATE = {'enabled': False, 'memory': False, 'tracing': False}
+
+# Recorded statistics per function
+STATS = {}
+
+# Running peak memory of the enclosing profiled calls (see profiled)
+_PEAKS = []
+
+
+def count_rows(obj):
+    """
+    Count the rows of a dataframe, a series, or a list or dictionary of these (None otherwise).
+
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if isinstance(obj, dict):
+        obj = list(obj.values())
+    if isinstance(obj, (list, tuple)) and obj and all(isinstance(o, (pd.DataFrame, pd.Series)) for o in obj):
+        return sum(len(o) for o in obj)
+    return None
+
+
+def record(name, seconds, rows, peak):
+    """
+    Add a single call to the statistics of a function.
+
+    """
+    stats = STATS.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak_mb': None})
+    stats['calls'] += 1
+    stats['seconds'] += seconds
+    if rows is not None:
+        stats['rows'] += rows
+    if peak is not None:
+        stats['peak_mb'] = max(stats['peak_mb'] or 0.0, peak / 2**20)
+
+
+def profiled(function=None, rows=None):
+    """
+    Decorator recording calls, wall time, rows and peak memory of a function while profiling is enabled.
+
+    Rows are counted from the first dataframe argument, or from the return value if there is none.
+    Functions returning a dictionary of mixed values give the key of the dataframe to count, e.g.
+
+        @profiled(rows='results')
+        def load_plot_data(folder='data'):
+
+    """
+    if function is None:
+        return functools.partial(profiled, rows=rows)
+
+    name = '{}.{}'.format(function.__module__, function.__name__)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # Call the function directly when disabled
+        if not STATE['enabled']:
+            return function(*args, **kwargs)
+
+        # Trace memory from the peak of this call only
+        #   PS: The peak of an enclosing call is kept in _PEAKS, as reset_peak affects all calls
+        memory = STATE['memory'] and tracemalloc.is_tracing()
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if _PEAKS:
+                _PEAKS[-1] = max(_PEAKS[-1], peak)
+            tracemalloc.reset_peak()
+            _PEAKS.append(0)
+
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak = None
+            if memory:
+                peak = max(_PEAKS.pop(), tracemalloc.get_traced_memory()[1])
+                if _PEAKS:
+                    _PEAKS[-1] = max(_PEAKS[-1], peak)
+                peak -= current
+
+        # Count the rows of the input, otherwise of the output
+        n = next((len(a) for a in args if isinstance(a, pd.DataFrame)), None)
+        if n is None:
+            n = count_rows(result if rows is None else result[rows])
+        record(name, seconds, n, peak)
+
+        return result
+
+    return wrapper
+
+
+def enable(memory=True):
+    """
+    Enable profiling (with memory tracing unless memory=False).
+
+    """
+    STATE['enabled'] = True
+    STATE['memory'] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        STATE['tracing'] = True
+
+
+def disable():
+    """
+    Disable profiling (the recorded statistics are kept). Memory tracing is only
+    stopped if it was started by enable.
+
+    """
+    if STATE['tracing'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    STATE['enabled'] = False
+    STATE['memory'] = False
+    STATE['tracing'] = False
+
+
+def reset():
+    """
+    Remove all recorded statistics.
+
+    """
+    STATS.clear()
+
+
+@contextlib.contextmanager
+def profile(memory=True, clear=False):
+    """
+    Context manager enabling profiling within a block.
+
+    Arguments:
+        memory = trace peak memory (default = True, slows down allocations)
+        clear = remove previously recorded statistics, including those recorded under
+                MY_PROFILE=1 (default = False, i.e. the block adds to them)
+
+    Return:
+        the dictionary of recorded statistics
+
+    """
+    previous = dict(STATE)
+    if clear:
+        reset()
+
+    enable(memory)
+    try:
+        yield STATS
+    finally:
+        disable()
+        if previous['enabled']:
+            enable(previous['memory'])
+
+
+def get_report():
+    """
+    Get the recorded statistics as a dataframe sorted by total time.
+
+    Return:
+        a dataframe with calls, total and mean seconds, rows, rows per second and peak memory per function
+
+    """
+    df = pd.DataFrame.from_dict(STATS, orient='index', columns=['calls', 'seconds', 'rows', 'peak_mb'])
+    df.index.name = 'function'
+    df['mean_seconds'] = df['seconds'] / df['calls']
+    df['rows_per_second'] = df['rows'] / df['seconds'].where(df['seconds'] > 0)
+
+    return df.sort_values('seconds', ascending=False)[['calls', 'seconds', 'mean_seconds', 'rows',
+                                                       'rows_per_second', 'peak_mb']]
+
+
+def save_report(path):
+    """
+    Save the recorded statistics as JSON (.json) or CSV (any other extension).
+
+    """
+    df = get_report()
+
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(json.loads(df.to_json(orient='index')), f, indent=2)
+    else:
+        df.to_csv(path, sep=';')
+
+
+## Enable profiling from the environment
+if os.environ.get(ENV_VAR, '') not in ('', '0'):
+    enable(memory=os.environ[ENV_VAR] != 'time')
+
+    if os.environ.get(ENV_REPORT):
+        atexit.register(save_report, os.environ[ENV_REPORT])
@@ -0,0 +1,201 @@
+"""
+Module of batched regression of the error on the position in the build chamber.
+
+The same design matrix (polynomial terms of the position, orientation, laser
+angle and build dummies) is fitted to many characteristics at once. Parts with
+missing values are masked: the characteristics are grouped by their pattern of
+missing parts, and every group is fitted by a single least-squares solve with
+one right-hand side per characteristic.
+
+
+Contents:
+    design_matrix(layout, degree=2, ...)        # Design matrix of the parts
+    fit(Y, X)                                   # Fit the design matrix to every column of Y
+    regress_chars(chars, folder='data', ...)    # Fit the mean errors of characteristics
+
+"""
+
+# Import libraries
+
+import numpy as np
+import pandas as pd
+
+import my_functions as func
+import my_characteristics as mychars
+
+# scipy.stats is imported by fit on first use, as it is slow to import
+
+##############################################################################
+
+
+def design_matrix(layout, degree=2, orientation=True, laser_angle=True, builds=True):
+    """
+    Create the design matrix of the parts from the layout data.
+
+    Arguments:
+        layout = a dataframe indexed by part_name with 'center_x/y/z', 'angle' and 'build'
+                 (the feature positions 'feature_x/y/z' are used if available)
+        degree = degree of the polynomial terms of the position (default = 2)
+        orientation = include the sine and cosine of the part rotation (default = True)
+        laser_angle = include the laser angle of the feature facing up (default = True)
+        builds = include dummies of the builds, the first build as reference (default = True)
+
+    Return:
+        a dataframe indexed by part_name with one column per term
+
+    """
+    # Positions centred on the mean of the parts (for the conditioning of the polynomial terms)
+    cols = ['feature_x', 'feature_y', 'feature_z'] if 'feature_x' in layout else ['center_x', 'center_y', 'center_z']
+    pos = layout[cols].to_numpy(dtype=float)
+    pos = pos - pos.mean(axis=0)
+
+    X = {'intercept': np.ones(len(layout))}
+
+    # Polynomial terms of x, y and z, including interactions (e.g. x, y, z, x^2, x*y, ...)
+    for d in range(1, degree + 1):
+        for powers in _powers(3, d):
+            name = '*'.join('{}{}'.format(a, '^{}'.format(p) if p > 1 else '')
+                            for a, p in zip('xyz', powers) if p)
+            X[name] = np.prod(pos ** np.array(powers), axis=1)
+
+    # Orientation of the part
+    angles = np.radians(layout['angle'].to_numpy(dtype=float))
+    if orientation:
+        X['angle_sin'] = np.sin(angles)
+        X['angle_cos'] = np.cos(angles)
+
+    # Laser angle of the rotated vector [0, 0, 1]
+    if laser_angle:
+        xy = layout[cols[:2]].to_numpy(dtype=float)
+        X['laser_angle'] = func.laser_angles(xy[:, 0], xy[:, 1], layout['angle'].to_numpy(dtype=float))
+
+    # Dummies of the builds
+    if builds:
+        for b in sorted(layout['build'].unique())[1:]:
+            X['build_{}'.format(b)] = (layout['build'] == b).to_numpy(dtype=float)
+
+    X = pd.DataFrame(X, index=layout.index)
+
+    # Remove terms without variation (e.g. build dummies of a single build)
+    constant = (X.std() == 0) & (X.columns != 'intercept')
+    return X.loc[:, ~constant.to_numpy()]
+
+
+def _powers(n, degree):
+    """
+    Get all combinations of n non-negative powers with the given sum (in the order x, y, z).
+
+    """
+    if n == 1:
+        return [(degree,)]
+    return [(p,) + rest for p in range(degree, -1, -1) for rest in _powers(n - 1, degree - p)]
+
+
+def fit(Y, X):
+    """
+    Fit the design matrix to every column of Y by least squares. Missing values
+    in Y are masked, and columns with the same missing rows are fitted together.
+
+    Arguments:
+        Y = a dataframe with one column per characteristic (rows aligned with X, NaN if missing)
+        X = a design matrix (see design_matrix)
+
+    Return:
+        a dictionary of dataframes indexed by characteristic:
+            coef = coefficients of every term
+            se = standard errors of the coefficients
+            t = t-statistics of the coefficients
+            p = p-values of the coefficients (two-sided)
+            stats = n, dof, rank, rss, sigma, r2 and adj_r2 of every characteristic
+
+    """
+    from scipy.stats import t as t_dist
+
+    Y = Y.reindex(X.index)
+    A = X.to_numpy(dtype=float)
+    V = Y.to_numpy(dtype=float)
+    n_terms = A.shape[1]
+
+    coef = np.full((V.shape[1], n_terms), np.nan)
+    se = np.full((V.shape[1], n_terms), np.nan)
+    stats = np.full((V.shape[1], 6), np.nan)
+
+    # Group the characteristics by their pattern of available parts
+    mask = ~np.isnan(V)
+    patterns, group = np.unique(mask.T, axis=0, return_inverse=True)
+    group = group.ravel()
+
+    for g, rows in enumerate(patterns):
+        cols = np.flatnonzero(group == g)
+        n = rows.sum()
+        if n <= n_terms:
+            continue
+
+        # A single solve with one right-hand side per characteristic
+        Ag, Vg = A[rows], V[np.ix_(rows, cols)]
+        B, _, rank, _ = np.linalg.lstsq(Ag, Vg, rcond=None)
+        resid = Vg - Ag @ B
+        rss = (resid ** 2).sum(axis=0)
+        dof = n - rank
+        sigma2 = rss / dof
+
+        # Standard errors from the diagonal of the inverse of A'A (shared by the group)
+        #   PS: Undefined if the design matrix is rank deficient for these parts
+        if rank == n_terms:
+            diag = np.diag(np.linalg.inv(Ag.T @ Ag))
+            se[cols] = np.sqrt(np.outer(sigma2, diag))
+
+        tss = ((Vg - Vg.mean(axis=0)) ** 2).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r2 = 1 - rss / tss
+            adj_r2 = 1 - (1 - r2) * (n - 1) / (n - rank)
+
+        coef[cols] = B.T
+        stats[cols] = np.column_stack([np.full(len(cols), n), np.full(len(cols), dof),
+                                       np.sqrt(sigma2), rss, r2, adj_r2])
+
+    stats = pd.DataFrame(stats, index=Y.columns, columns=['n', 'dof', 'sigma', 'rss', 'r2', 'adj_r2'])
+    t = coef / se
+    p = 2 * t_dist.sf(np.abs(t), stats['dof'].to_numpy()[:, None])
+
+    return {'coef': pd.DataFrame(coef, index=Y.columns, columns=X.columns),
+            'se': pd.DataFrame(se, index=Y.columns, columns=X.columns),
+            't': pd.DataFrame(t, index=Y.columns, columns=X.columns),
+            'p': pd.DataFrame(p, index=Y.columns, columns=X.columns),
+            'stats': stats}
+
+
+def regress_chars(chars, folder='data', **kwargs):
+    """
+    Fit the mean error of repeated measurements of characteristics to the design matrix of the parts.
+
+    Arguments:
+        chars = a list of characteristic names
+        folder = folder containing the pickled data (default = 'data')
+        kwargs = arguments of design_matrix (degree, orientation, laser_angle, builds)
+
+    Return:
+        the dictionary of dataframes of fit (the characteristics of a feature are fitted to
+        the positions of the feature, terms missing from the design matrix of a feature are NaN)
+
+    """
+    df = func.get_char_means(chars, folder=folder)
+
+    # One column per characteristic, one row per part (NaN where a part is missing)
+    Y = df.pivot_table(index=df.index, columns='char', values='error', observed=True)
+    Y = Y[[c for c in chars if c in Y.columns]]
+
+    # Characteristics on the same feature share the positions (the part centres if the offset is unknown)
+    known = df.groupby('char', observed=True)['offset_known'].all()
+    groups = pd.Series([mychars.feature_key(c) if known[c] else None for c in Y.columns], index=Y.columns)
+
+    # Fit every group to the layout of its parts (one row per part)
+    results = []
+    for key, names in groups.groupby(groups.fillna(''), sort=False):
+        layout = df[df['char'].isin(names.index)]
+        layout = layout[~layout.index.duplicated()].drop(columns=['char', 'error'])
+        if not key:
+            layout = layout.drop(columns=['feature_x', 'feature_y', 'feature_z'])
+        results.append(fit(Y[names.index], design_matrix(layout, **kwargs)))
+
+    return {k: pd.concat([r[k] for r in results]).reindex(Y.columns) for k in results[0]}
@@ -0,0 +1,284 @@
+"""
+Module of spatial autocorrelation of the errors between neighbouring parts.
+
+The neighbours of every part are found once by a KD-tree over the centres of
+the parts, and stored as a sparse weight matrix. All statistics are
+computed for many characteristics at once by products of the sparse matrix
+with a matrix of one column per characteristic (parts without a value are
+masked). Parts in different builds are never neighbours.
+
+
+Contents:
+    neighbours(points, k=8, radius=None, ...)   # Sparse weight matrix of the neighbours of every point
+    morans_i(Y, W, permutations=999, seed=0)    # Global Moran's I of every column with permutation p-values
+    local_means(Y, W)                           # Mean of the neighbours of every part for every column
+    variogram(points, Y, bins, builds=None)     # Empirical semivariogram of every column
+    spatial_stats(chars, folder='data', ...)    # All of the above for the mean errors of characteristics
+
+"""
+
+# Import libraries
+
+import numpy as np
+import pandas as pd
+
+import my_functions as func
+
+# scipy.spatial and scipy.sparse are imported on use, as they are slow to import
+
+##############################################################################
+
+
+def _separate_builds(points, builds):
+    """
+    Shift the points of every build far apart along x, so that no neighbours are found across builds.
+
+    """
+    points = np.asarray(points, dtype=float)
+    if builds is None:
+        return points
+
+    codes = pd.factorize(np.asarray(builds))[0]
+    shift = 10 * (np.ptp(points, axis=0).max() + 1)
+    return points + np.outer(codes, [shift, 0, 0])
+
+
+def neighbours(points, k=8, radius=None, builds=None, standardize=True):
+    """
+    Find the neighbours of every point by a KD-tree.
+
+    Arguments:
+        points = array of positions (n x 3) [mm]
+        k = number of nearest neighbours (default = 8, None for all within the radius)
+        radius = maximum distance of a neighbour [mm] (default = None, i.e. no limit)
+        builds = build of every point, neighbours only within a build (default = None)
+        standardize = divide the weights of every row by their sum (default = True)
+
+    Return:
+        a sparse matrix (CSR, n x n) of weights, with zero diagonal
+
+    """
+    from scipy.spatial import cKDTree
+    from scipy import sparse
+
+    if k is None and radius is None:
+        raise ValueError("Specify k and/or radius")
+
+    points = _separate_builds(points, builds)
+    n = len(points)
+    tree = cKDTree(points)
+
+    if k is not None:
+        # The nearest point is the point itself (unless positions are repeated)
+        dist, idx = tree.query(points, k=min(k + 1, n), distance_upper_bound=np.inf if radius is None else radius)
+        rows = np.repeat(np.arange(n), idx.shape[1])
+        cols = idx.ravel()
+        keep = np.isfinite(dist.ravel()) & (cols != rows)
+        rows, cols = rows[keep], cols[keep]
+    else:
+        pairs = tree.query_pairs(radius, output_type='ndarray')
+        rows = np.r_[pairs[:, 0], pairs[:, 1]]
+        cols = np.r_[pairs[:, 1], pairs[:, 0]]
+
+    W = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
+    if standardize:
+        total = np.asarray(W.sum(axis=1)).ravel()
+        W = sparse.diags(np.divide(1, total, out=np.zeros(n), where=total > 0)) @ W
+
+    return W.tocsr()
+
+
+def _centre(Y):
+    """
+    Centre every column on the mean of its available values and set missing values to zero.
+
+    Return:
+        a tuple with the centred values and the mask of available values (float)
+
+    """
+    Y = np.asarray(Y, dtype=float)
+    mask = ~np.isnan(Y)
+    Z = np.where(mask, Y - np.nanmean(Y, axis=0), 0)
+
+    return Z, mask.astype(float)
+
+
+def _moran(Z, M, W):
+    """
+    Moran's I of every column of centred values Z with mask M.
+
+    """
+    S0 = (M * (W @ M)).sum(axis=0)
+    m2 = (Z ** 2).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return M.sum(axis=0) / S0 * (Z * (W @ Z)).sum(axis=0) / m2
+
+
+def morans_i(Y, W, permutations=999, seed=0):
+    """
+    Global Moran's I of every column, with the significance by random permutations
+    of the parts (the same permutations for all columns, each a single sparse product).
+
+    Arguments:
+        Y = a dataframe (or array) with one row per part and one column per characteristic (NaN if missing)
+        W = a sparse weight matrix (see neighbours)
+        permutations = number of permutations (default = 999, 0 for none)
+        seed = seed of the random number generator (default = 0)
+
+    Return:
+        a dataframe with one row per column of Y:
+            I = Moran's I
+            expected = expected value without autocorrelation, -1/(n-1)
+            z = standardised I relative to the permutations
+            p = pseudo p-value of the permutations (two-sided)
+            n = number of parts with a value
+
+    """
+    Z, M = _centre(Y)
+    n = M.sum(axis=0)
+    I = _moran(Z, M, W)
+
+    # Permute the parts (keeping the mask with the values)
+    rng = np.random.default_rng(seed)
+    sims = np.empty((permutations, Z.shape[1]))
+    for p in range(permutations):
+        perm = rng.permutation(len(Z))
+        sims[p] = _moran(Z[perm], M[perm], W)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if permutations:
+            z = (I - sims.mean(axis=0)) / sims.std(axis=0, ddof=1)
+            larger = (sims >= I).sum(axis=0)
+            extreme = np.minimum(larger, permutations - larger)
+            pval = (extreme + 1) / (permutations + 1) * 2
+        else:
+            z = pval = np.full(len(I), np.nan)
+
+        expected = -1 / (n - 1)
+
+    index = Y.columns if isinstance(Y, pd.DataFrame) else None
+    return pd.DataFrame({'I': I, 'expected': expected, 'z': z, 'p': np.minimum(pval, 1), 'n': n.astype(int)},
+                        index=index)
+
+
+def local_means(Y, W):
+    """
+    Mean of the available values of the neighbours of every part, for every column.
+
+    Arguments:
+        Y = a dataframe (or array) with one row per part and one column per characteristic (NaN if missing)
+        W = a sparse weight matrix (see neighbours)
+
+    Return:
+        a dataframe (or array) like Y (NaN if no neighbour has a value)
+
+    """
+    V = np.asarray(Y, dtype=float)
+    M = ~np.isnan(V)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (W @ np.where(M, V, 0)) / (W @ M.astype(float))
+
+    if isinstance(Y, pd.DataFrame):
+        return pd.DataFrame(means, index=Y.index, columns=Y.columns)
+    return means
+
+
+def variogram(points, Y, bins=np.arange(0, 401, 50), builds=None, chunk=2**22):
+    """
+    Empirical semivariogram of every column, i.e. half the mean squared
+    difference between pairs of parts by bins of distance.
+
+    Arguments:
+        points = array of positions (n x 3) [mm]
+        Y = a dataframe (or array) with one row per part and one column per characteristic (NaN if missing)
+        bins = edges of the bins of distance [mm] (default = 0 to 400 mm by 50 mm, the parts are about 100 mm apart)
+        builds = build of every point, pairs only within a build (default = None)
+        chunk = maximum number of values (pairs x columns) processed at once (default = 2**22)
+
+    Return:
+        a tuple with the semivariance (a dataframe indexed by the bin centres with
+        one column per column of Y) and the number of pairs of every bin and column
+
+    """
+    from scipy.spatial import cKDTree
+
+    bins = np.asarray(bins, dtype=float)
+    points = _separate_builds(points, builds)
+    tree = cKDTree(points)
+
+    # All pairs within the largest distance
+    pairs = tree.query_pairs(bins[-1], output_type='ndarray')
+    dist = np.sqrt(((points[pairs[:, 0]] - points[pairs[:, 1]]) ** 2).sum(axis=1))
+    b = np.digitize(dist, bins) - 1
+    keep = (b >= 0) & (b < len(bins) - 1)
+    pairs, b = pairs[keep], b[keep]
+
+    V = np.asarray(Y, dtype=float)
+    n_bins = len(bins) - 1
+    total = np.zeros((n_bins, V.shape[1]))
+    count = np.zeros((n_bins, V.shape[1]))
+
+    # Squared differences summed by bin (in chunks of pairs, to limit the memory)
+    step = max(chunk // max(V.shape[1], 1), 1)
+    for start in range(0, len(pairs), step):
+        i, j = pairs[start:start + step].T
+        d2 = (V[i] - V[j]) ** 2
+        valid = ~np.isnan(d2)
+        onehot = np.eye(n_bins)[b[start:start + step]].T
+        total += onehot @ np.where(valid, d2, 0)
+        count += onehot @ valid
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gamma = total / count / 2
+
+    centres = pd.Index((bins[:-1] + bins[1:]) / 2, name='distance')
+    columns = Y.columns if isinstance(Y, pd.DataFrame) else None
+
+    return pd.DataFrame(gamma, index=centres, columns=columns), pd.DataFrame(count, index=centres, columns=columns)
+
+
+def spatial_stats(chars, folder='data', k=8, radius=None, by_build=True, permutations=999, bins=np.arange(0, 401, 50),
+                  seed=0):
+    """
+    Spatial statistics of the mean error of repeated measurements of characteristics.
+
+    Arguments:
+        chars = a list of characteristic names
+        folder = folder containing the pickled data (default = 'data')
+        k, radius = neighbours of every part (see neighbours, default = 8 nearest)
+        by_build = neighbours and pairs only within a build (default = True)
+        permutations = number of permutations of Moran's I (default = 999)
+        bins = edges of the bins of distance of the variogram [mm]
+        seed = seed of the permutations (default = 0)
+
+    Return:
+        a dictionary with
+            morans_i = dataframe of morans_i indexed by characteristic
+            local_means = dataframe of the mean error of the neighbours (parts x characteristics)
+            variogram = dataframe of semivariances (bins x characteristics)
+            pairs = dataframe of the number of pairs of the variogram
+            weights = the sparse weight matrix (rows in the order of the index of local_means)
+
+    """
+    df = func.get_char_means(chars, folder=folder)
+
+    # One column per characteristic, one row per part (NaN where a part is missing)
+    Y = df.pivot_table(index=df.index, columns='char', values='error', observed=True)
+    Y = Y[[c for c in chars if c in Y.columns]]
+
+    # Positions of the part centres (a single graph for all characteristics, the features are on
+    # different positions of a part)
+    layout = df[~df.index.duplicated()].reindex(Y.index)
+    points = layout[['center_x', 'center_y', 'center_z']].to_numpy(dtype=float)
+    builds = layout['build'].to_numpy() if by_build else None
+
+    W = neighbours(points, k=k, radius=radius, builds=builds)
+    gamma, count = variogram(points, Y, bins=bins, builds=builds)
+
+    return {'morans_i': morans_i(Y, W, permutations=permutations, seed=seed),
+            'local_means': local_means(Y, W),
+            'variogram': gamma,
+            'pairs': count,
+            'weights': W}
@@ -7,31 +7,26 @@ Line plot showing the slice distribution of all builds in a single figure
 
 ## Import packages
 import os
+import sys
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib import transforms
 from matplotlib.lines import Line2D
 
+sys.path.append('..')
+import my_functions as func
+import my_plot as myplt
 
-## Prepare data
-# Load the slice distribution of each build from CSV-files
-df_b1 = pd.read_csv(os.path.join('..', 'data', 'Slice_distribution_build1.csv'), sep=';')
-df_b2 = pd.read_csv(os.path.join('..', 'data', 'Slice_distribution_build2.csv'), sep=';')
-df_b3 = pd.read_csv(os.path.join('..', 'data', 'Slice_distribution_build3.csv'), sep=';')
-
-# Use the first build as a foundation for common dataframe
-df = df_b1.rename(columns={"Total slice surface (mmý)": "Build 1"})
 
-# Add the other two build to the common dataframe
-df.insert(2, "Build 2", df_b2['Total slice surface (mmý)'])
-df.insert(3, "Build 3", df_b3['Total slice surface (mmý)'])
+## Prepare data
+# Load the slice distribution of each build aligned on a common height grid
+df = func.load_slice_distribution(['build1', 'build2', 'build3'],
+                                  labels=['Build 1', 'Build 2', 'Build 3'],
+                                  folder=os.path.join('..', 'data'))
 
 # Convert to cm²
-for i in [1, 2, 3]: df['Build {}'.format(i)] = df['Build {}'.format(i)] / 100
-
-# Set the height as index
-df.set_index('Height (mm)', inplace=True)
+df = df / 100
 
 
 ## Define parameters for figure
@@ -85,9 +80,8 @@ ax.set_ybound(lower=0)
 ax.set_xticks(list(range(0, 501, 50)))
 
 # Set grid lines for the y-axis
-ax.grid(b=True, axis='both')
+ax.grid(True, axis='both')
 
 
 # Save figure
-plt.savefig('04.3_Slice_distribution_all_builds.jpeg', dpi=600, bbox_inches='tight')
-plt.savefig('04.3_Slice_distribution_all_builds.pdf', bbox_inches='tight')
\ No newline at end of file
+myplt.save_figure(plt.gcf(), '04.3_Slice_distribution_all_builds', formats=['jpeg', 'pdf'])
\ No newline at end of file
@@ -8,29 +8,26 @@ the main specimens of build 1.
 
 ## Import packages
 import os
+import sys
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib import transforms
 
+sys.path.append('..')
+import my_functions as func
+import my_plot as myplt
+
 
 ## Prepare data
 # The slice distribution considering only the main specimens of build 1
-df_main = pd.read_csv(os.path.join('..', 'data', 'Slice_distribution_build1_main.csv'), sep=';')
+df_main = func.load_slice_distribution(['build1_main'], folder=os.path.join('..', 'data'))
 
 # The slice distribution considering perfect spheres in the defined positions
-df_sphere = pd.read_csv(os.path.join('..', 'data', 'Slice_distribution_spheres.csv'), sep=';')
-
-# Put dataframes in list for simple processing
-dfs = [df_main, df_sphere]
+df_sphere = func.load_slice_distribution(['spheres'], folder=os.path.join('..', 'data'))
 
-# For both dataframes:
-for df in dfs:   
-    # Convert to cm²
-    df['Total slice surface (mm²)'] = df['Total slice surface (mm²)'] / 100
-        
-    # Set the height as index
-    df.set_index('Height (mm)', inplace=True)
+# Convert to cm² and put dataframes in list for simple processing
+dfs = [df_main / 100, df_sphere / 100]
 
 
 ## Define parameters for figure
@@ -79,9 +76,8 @@ for i in range(len(axs)):
     axs[i].set_xticks(list(range(0, 501, 50)))
 
     # Set grid lines for the y-axis
-    axs[i].grid(b=True, axis='both')
+    axs[i].grid(True, axis='both')
     
     
 # Save figure
-plt.savefig('05.3_Initial_slice_distribution.jpeg', dpi=600, bbox_inches='tight')
-plt.savefig('05.3_Initial_slice_distribution.pdf', bbox_inches='tight')
\ No newline at end of file
+myplt.save_figure(plt.gcf(), '05.3_Initial_slice_distribution', formats=['jpeg', 'pdf'])
\ No newline at end of file
@@ -12,18 +12,15 @@ import pandas as pd
 import matplotlib.pyplot as plt 
 import seaborn as sns
 import os
+import sys
 
+sys.path.append('..')
+import my_functions as func
+import my_plot as myplt
+import my_characteristics as mychars
 
-## Prepare data
-# Create path
-path = os.path.join('..', 'data', 'prep_data.pkl')
-
-# Load data from pickle to dataframe
-df = pd.read_pickle(path)
-
-# Drop irrelevant columns
-df = df[['part_name', 'rep', 'char_name', 'error', 'time', 'char_number']]
 
+## Prepare data
 # Specify characteristics
 chars = ['Cylindricity_Cyl_4mm_Pos',
             'Cylindricity_Cyl_8mm_Neg',
@@ -55,8 +52,9 @@ chars = ['Cylindricity_Cyl_4mm_Pos',
 # Define list of strings to simplify column selection
 reps = ['rep1', 'rep2', 'rep3']
 
-# Extract specified characteristics
-df_s = df[df['char_name'].isin(chars)]
+# Extract specified characteristics and relevant columns (shared between scripts)
+df_s = func.get_results(chars, columns=['part_name', 'rep', 'char_name', 'error', 'time', 'char_number'],
+                        folder=os.path.join('..', 'data'))
 
 
 ## Restructuring to have repeated measurements as columns
@@ -76,10 +74,8 @@ df_tot = pd.concat([df_r1, df_r2['rep2'], df_r3['rep3']], axis=1)
 # Drop redundant columns and reset index
 df_tot = df_tot[['char_type', 'rep1', 'rep2', 'rep3']].reset_index()
 
-# Replace exact characteristic name with simply characteristic type
-df_tot.loc[df_tot['char_type'].str.startswith('Cylindricity'), 'char_type'] = 'Cylindricity'
-df_tot.loc[df_tot['char_type'].str.startswith('Flatness'), 'char_type'] = 'Flatness'
-df_tot.loc[df_tot['char_type'].str.startswith('Diameter'), 'char_type'] = 'Diameter'
+# Replace exact characteristic name with simply characteristic type (every name is parsed once)
+df_tot['char_type'] = mychars.char_fields(df_tot['char_type'])['measure'].astype(str).to_numpy()
 
 # Calculate difference between minimum and maximum
 df_tot['diff'] = df_tot[reps].max(axis=1) - df_tot[reps].min(axis=1)
@@ -93,6 +89,9 @@ std = df_tot['diff'].std()
 # Reset index
 data.reset_index(drop=True, inplace=True)
 
+# Render the scatterplots as density rasters for large datasets (see my_plot.binned_scatter)
+aggregate = len(data) > 100000
+
 
 ## Define parameters for figure
 # Definition for font sizes
@@ -119,7 +118,10 @@ sns.set_context("paper", font_scale=1.2)
 
 ## PLOT 1
 # Scatterplot in first frame
-sns.scatterplot(ax=axs[0], data=data, y='diff', x=data.index, hue='char_type', legend=True, palette='colorblind')
+if aggregate:
+    myplt.binned_scatter(axs[0], data, y='diff', x=data.index, hue='char_type', palette='colorblind')
+else:
+    sns.scatterplot(ax=axs[0], data=data, y='diff', x=data.index, hue='char_type', legend=True, palette='colorblind')
 
 # Insert horizontal line at five standard deviations
 axs[0].axhline(y=std*5, color='black', linestyle='--', alpha=0.7)
@@ -153,7 +155,10 @@ data = data[data['diff'] < std * 5]
 
 ## PLOT 2
 # Scatterplot in second frame
-sns.scatterplot(ax=axs[1], data=data, y='diff', x=data.index, hue='char_type', legend=False, palette='colorblind')
+if aggregate:
+    myplt.binned_scatter(axs[1], data, y='diff', x=data.index, hue='char_type', palette='colorblind', legend=False)
+else:
+    sns.scatterplot(ax=axs[1], data=data, y='diff', x=data.index, hue='char_type', legend=False, palette='colorblind')
 
 
 # Get number of datapoints for each characteristic
@@ -190,5 +195,4 @@ for ax in axs:
     ax.xaxis.grid(False)
 
 # Save figure
-plt.savefig("30.6_Difference_between_repeated_measurements.jpeg", dpi=600, bbox_inches='tight')
-plt.savefig("30.6_Difference_between_repeated_measurements.pdf", bbox_inches='tight')
\ No newline at end of file
+myplt.save_figure(plt.gcf(), "30.6_Difference_between_repeated_measurements", formats=['jpeg', 'pdf'])
\ No newline at end of file
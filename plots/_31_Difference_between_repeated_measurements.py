@@ -12,9 +12,15 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 from scipy import stats
 from matplotlib.lines import Line2D
 
+sys.path.append('..')
+import my_functions as func
+import my_plot as myplt
+import my_characteristics as mychars
+
 
 ## Define function for retrieving the frozen distribution of the fitted probability density function
 #  Valid distributions include lognorm, invgamma and powerlognorm
@@ -23,15 +29,6 @@ def calc_pdf(x, data):
 
 
 ## Prepare data
-# Create path
-path = os.path.join('..', 'data', 'prep_data.pkl')
-
-# Load data from pickle to dataframe
-df = pd.read_pickle(path)
-
-# Drop irrelevant columns
-df = df[['part_name', 'rep', 'char_name', 'error', 'time', 'char_number']]
-
 # Specify characteristics
 chars = ['Cylindricity_Cyl_4mm_Pos',
             'Cylindricity_Cyl_8mm_Neg',
@@ -63,8 +60,9 @@ chars = ['Cylindricity_Cyl_4mm_Pos',
 # Define list of strings to simplify column selection
 reps = ['rep1', 'rep2', 'rep3']
 
-# Extract specified characteristics
-df_s = df[df['char_name'].isin(chars)]
+# Extract specified characteristics and relevant columns (shared between scripts)
+df_s = func.get_results(chars, columns=['part_name', 'rep', 'char_name', 'error', 'time', 'char_number'],
+                        folder=os.path.join('..', 'data'))
 
 
 ## Restructuring to have repeated measurements as columns
@@ -84,10 +82,8 @@ df_tot = pd.concat([df_r1, df_r2['rep2'], df_r3['rep3']], axis=1)
 # Drop redundant columns and reset index
 df_tot = df_tot[['char_type', 'rep1', 'rep2', 'rep3']].reset_index()
 
-# Replace exact characteristic name with simply characteristic type
-df_tot.loc[df_tot['char_type'].str.startswith('Cylindricity'), 'char_type'] = 'Cylindricity'
-df_tot.loc[df_tot['char_type'].str.startswith('Flatness'), 'char_type'] = 'Flatness'
-df_tot.loc[df_tot['char_type'].str.startswith('Diameter'), 'char_type'] = 'Diameter'
+# Replace exact characteristic name with simply characteristic type (every name is parsed once)
+df_tot['char_type'] = mychars.char_fields(df_tot['char_type'])['measure'].astype(str).to_numpy()
 
 # Calculate difference between minimum and maximum
 df_tot['diff'] = df_tot[reps].max(axis=1) - df_tot[reps].min(axis=1)
@@ -195,5 +191,4 @@ for ax in axs:
     ax.tick_params(labelsize=x_small)
 
 # Save figure
-plt.savefig("31.2_Difference_between_repeated_measurements.jpeg", dpi=600, bbox_inches='tight')
-plt.savefig("31.2_Difference_between_repeated_measurements.pdf", bbox_inches='tight')
\ No newline at end of file
+myplt.save_figure(plt.gcf(), "31.2_Difference_between_repeated_measurements", formats=['jpeg', 'pdf'])
\ No newline at end of file
@@ -12,31 +12,20 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 
+sys.path.append('..')
+import my_functions as func
+import my_plot as myplt
 
-## Prepare data
-# Load pickled data
-df = pd.read_pickle(os.path.join('..', 'data', 'prep_data.pkl'))
-layout = pd.read_pickle(os.path.join('..', 'data', 'layout_data.pkl'))
 
+## Prepare data
 # Specify characteristics
 chars = ['Flatness_HX2_Plane2',\
         'Flatness_HX2_Plane5']
 
-# Initialize empty list for characteristics
-char_list = []
-
-# Populate char_list with the dataframes:
-for i in range(len(chars)):
-    # Calculate the mean value of repeated measurements and remove redundant columns
-    temp = df[df['char_name'] == chars[i]].groupby('part_name').mean()\
-    .drop(['rep', 'actual', 'nominal', 'char_number'], axis = 1).join(layout)
-
-    # Add the temporary dataframe to the characteristics list
-    char_list.append(temp)
-
-# Merge the dataframes into a single one
-df = pd.concat(char_list)
+# Get the mean value of repeated measurements with layout data (shared between scripts)
+df = func.get_char_means(chars, folder=os.path.join('..', 'data'))
 
 
 ## Define parameters for figure
@@ -94,5 +83,4 @@ for ax in axs:
 
 
 # Save figure
-plt.savefig("51.2_Variation_between_z-positions_for_vertical_planes.jpeg", dpi=600, bbox_inches='tight')
-plt.savefig("51.2_Variation_between_z-positions_for_vertical_planes.pdf",  bbox_inches='tight')
\ No newline at end of file
+myplt.save_figure(plt.gcf(), "51.2_Variation_between_z-positions_for_vertical_planes", formats=['jpeg', 'pdf'])
\ No newline at end of file
@@ -12,40 +12,24 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 from matplotlib.patches import Patch
 
+sys.path.append('..')
+import my_functions as func
+import my_plot as myplt
+import my_characteristics as mychars
 
-## Prepare data
-# Load pickled data
-df = pd.read_pickle(os.path.join('..', 'data', 'prep_data.pkl'))
-layout = pd.read_pickle(os.path.join('..', 'data', 'layout_data.pkl'))
-
-# Specify characteristics
-chars = ['Diameter_Cyl_4mm_Pos',\
-        'Diameter_Cyl_8mm_Neg',\
-        'Diameter_Cyl_8mm_Pos',\
-        'Diameter_Cyl_16mm_Neg',\
-        'Diameter_Cyl_16mm_Pos',\
-        'Diameter_Cyl_24mm_Neg',\
-        'Diameter_Cyl_24mm_Pos']
-
-# Initialize empty list for characteristics
-char_list = []
 
-# Populate char_list with the dataframes:
-for i in range(len(chars)):
-    # Calculate the mean value of repeated measurements and remove redundant columns
-    temp = df[df['char_name'] == chars[i]].groupby('part_name').mean()\
-    .drop(['rep', 'actual', 'nominal', 'char_number'], axis = 1).join(layout)
-
-    # Isolate the specimen rotated -90 degrees
-    temp = temp[temp['angle'] == -90]
+## Prepare data
+# Specify characteristics (all valid cylinder diameters, i.e. without the invalid 4 mm concave cylinder)
+chars = mychars.select_chars(measure='Diameter', feature='Cyl')
 
-    # Add the temporary dataframe to the characteristics list
-    char_list.append(temp)
+# Get the mean value of repeated measurements with layout data (shared between scripts)
+df = func.get_char_means(chars, columns=['error', 'angle', 'z_pos', 'y_pos'], folder=os.path.join('..', 'data'))
 
-# Merge the dataframes into a single one
-df = pd.concat(char_list)
+# Isolate the specimen rotated -90 degrees
+df = df[df['angle'] == -90]
 
 # Extract columns of interest and converting to absolute values
 df = df[['error', 'z_pos', 'y_pos']]
@@ -94,5 +78,4 @@ ax.tick_params(labelsize=small)
 
 
 # Save figure
-plt.savefig('60.5_Diameter_anchor_positions.jpeg', dpi=600, bbox_inches='tight')
-plt.savefig('60.5_Diameter_anchor_positions.pdf', bbox_inches='tight')
\ No newline at end of file
+myplt.save_figure(plt.gcf(), '60.5_Diameter_anchor_positions', formats=['jpeg', 'pdf'])
\ No newline at end of file
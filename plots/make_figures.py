@@ -0,0 +1,225 @@
+"""
+Build all figures listed in "_Overview.csv"
+
+Every figure that is coded separately ("_<Number>_<Name>.py") is rendered in a
+process pool. The hashes of the script and of its input data are stored in
+".figure_hashes.json", and figures are skipped when neither has changed since
+the previous build and the output files exist.
+
+Usage (from the plots folder):
+    python make_figures.py              # Build changed figures
+    python make_figures.py 30 31        # Build only figures 30 and 31 (if changed)
+    python make_figures.py --force      # Build all figures
+
+"""
+
+## Import packages
+import os
+import re
+import sys
+import json
+import time
+import runpy
+import hashlib
+import argparse
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+
+## Define paths
+# Folder of this file (the scripts save figures to the working directory)
+PLOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Folders of the data and the modules imported by the scripts
+DATA_DIR = os.path.join(PLOT_DIR, '..', 'data')
+ROOT_DIR = os.path.join(PLOT_DIR, '..')
+
+# File with the hashes of the previous build
+MANIFEST = os.path.join(PLOT_DIR, '.figure_hashes.json')
+
+# Data files read by the shared loaders of the modules (the scripts do not name them)
+LOADER_INPUTS = {'my_functions': (r"func\.(?:load_plot_data|get_results|get_char_means)\(",
+                                  ['prep_data.pkl', 'layout_data.pkl', 'data_description.txt', 'feature_offsets.csv']),
+                 'my_characteristics': (r"mychars\.\w+\(", ['data_description.txt'])}
+
+
+def file_hash(path):
+    """
+    Calculate the SHA-256 hash of a file (None if the file does not exist).
+
+    """
+    if not os.path.exists(path):
+        return None
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def get_figures(numbers=None):
+    """
+    Get the figures that are coded separately from "_Overview.csv".
+
+    Arguments:
+        numbers = list of figure numbers to include (default = None, i.e. all)
+
+    Return:
+        a list of dictionaries with number, version, name, script and outputs
+
+    """
+    df = pd.read_csv(os.path.join(PLOT_DIR, '_Overview.csv'), dtype=str)
+    df = df[df['Status'] == 'Coded separatly']
+
+    figures = []
+    for _, row in df.iterrows():
+        if numbers and row['Number'] not in numbers:
+            continue
+
+        stem = '{}.{}_{}'.format(row['Number'], row['Latest version'], row['Name'])
+        figures.append({'number': row['Number'],
+                        'name': row['Name'],
+                        'script': '_{}_{}.py'.format(row['Number'], row['Name']),
+                        'outputs': [stem + '.jpeg', stem + '.pdf']})
+
+    return figures
+
+
+def get_inputs(script):
+    """
+    Find the input files of a script, i.e. the data files it refers to and the
+    modules in the root folder it imports.
+
+    """
+    with open(os.path.join(PLOT_DIR, script), encoding='utf-8') as f:
+        text = f.read()
+
+    # Data files named in the script (e.g. 'prep_data.pkl')
+    inputs = [os.path.join(DATA_DIR, name) for name in
+              sorted(set(re.findall(r"['\"]([\w\-.]+\.(?:pkl|csv))['\"]", text)))]
+
+    # Data files loaded through func.load_slice_distribution(['build1', ...])
+    for group in re.findall(r"load_slice_distribution\(\s*\[([^\]]*)\]", text):
+        for name in re.findall(r"['\"]([\w\-]+)['\"]", group):
+            inputs.append(os.path.join(DATA_DIR, 'Slice_distribution_{}.csv'.format(name)))
+
+    # Data files loaded through the shared loaders (e.g. func.get_char_means)
+    for pattern, names in LOADER_INPUTS.values():
+        if re.search(pattern, text):
+            inputs.extend(os.path.join(DATA_DIR, name) for name in names if
+                          os.path.join(DATA_DIR, name) not in inputs)
+
+    # Modules from the root folder, including the ones they import in turn
+    modules = set()
+    queue = imported_modules(text)
+    while queue:
+        module = queue.pop()
+        path = os.path.join(ROOT_DIR, module + '.py')
+        if module in modules or not os.path.exists(path):
+            continue
+        modules.add(module)
+        with open(path, encoding='utf-8') as f:
+            queue.extend(imported_modules(f.read()))
+    inputs.extend(os.path.join(ROOT_DIR, module + '.py') for module in sorted(modules))
+
+    return inputs
+
+
+def imported_modules(text):
+    """
+    Find the modules from the root folder (my_*) imported by a source text.
+
+    """
+    return sorted(set(re.findall(r"^\s*(?:import|from) (my_\w+)", text, re.M)))
+
+
+def get_hashes(figure):
+    """
+    Get the hashes of the script and the input data of a figure.
+
+    """
+    inputs = get_inputs(figure['script'])
+    data = hashlib.sha256()
+    for path in inputs:
+        data.update('{}={}\n'.format(os.path.basename(path), file_hash(path)).encode())
+
+    return {'script': file_hash(os.path.join(PLOT_DIR, figure['script'])), 'data': data.hexdigest()}
+
+
+def render(script):
+    """
+    Run a single plotting script in the plots folder (executed in a worker process).
+
+    Return:
+        a tuple with the script, the elapsed time and the error message (or None)
+
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    os.chdir(PLOT_DIR)
+
+    try:
+        # Start every figure from the default style
+        matplotlib.rcdefaults()
+        runpy.run_path(script, run_name='__main__')
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        plt.close('all')
+
+    return script, time.perf_counter() - start, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the figures listed in _Overview.csv")
+    parser.add_argument('numbers', nargs='*', help="figure numbers to build (default = all)")
+    parser.add_argument('--force', action='store_true', help="build figures even if unchanged")
+    parser.add_argument('--jobs', type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    # Load the hashes of the previous build
+    manifest = {}
+    if os.path.exists(MANIFEST):
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+
+    # Find the figures that need to be rendered
+    figures = get_figures(args.numbers)
+    todo = {}
+    for figure in figures:
+        hashes = get_hashes(figure)
+        outputs_exist = all(os.path.exists(os.path.join(PLOT_DIR, o)) for o in figure['outputs'])
+
+        if args.force or manifest.get(figure['script']) != hashes or not outputs_exist:
+            todo[figure['script']] = hashes
+        else:
+            print("Unchanged: {}".format(figure['script']))
+
+    # Render in a process pool
+    failed = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for script, elapsed, error in pool.map(render, todo):
+                if error is None:
+                    manifest[script] = todo[script]
+                    print("Built:     {} ({:.1f} s)".format(script, elapsed))
+                else:
+                    failed.append(script)
+                    print("Failed:    {}\n{}".format(script, error))
+
+    # Store the hashes of the successful builds
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
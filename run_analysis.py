@@ -0,0 +1,231 @@
+"""
+Reproduce the result tables of the notebooks without Jupyter.
+
+The analyses of the notebooks 01-04 (repeatability of measurements, comparison
+of builds, variation in the z-direction and in the xy-plane), as well as the
+T-tests stored as "T-test_*.csv", are run as separate stages in a process pool.
+Every stage writes its tables as CSV-files to the output folder. The files are
+written with a fixed float format so that identical input gives identical output.
+
+Usage:
+    python run_analysis.py                          # Run all stages
+    python run_analysis.py --stages z xy            # Run selected stages
+    python run_analysis.py --data data --out results --jobs 4
+
+Exit codes:
+    0 = all stages succeeded
+    1 = one or more stages failed
+    2 = input data is missing
+
+"""
+
+# Import libraries
+
+import os
+import sys
+import time
+import argparse
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+import my_functions as func
+
+##############################################################################
+
+# Characteristics used in the notebooks
+CYLINDRICITY = ['Cylindricity_Cyl_4mm_Pos', 'Cylindricity_Cyl_8mm_Neg', 'Cylindricity_Cyl_8mm_Pos',
+                'Cylindricity_Cyl_16mm-Neg', 'Cylindricity_Cyl_16mm_Pos', 'Cylindricity_Cyl_24mm_Neg',
+                'Cylindricity_Cyl_24mm_Pos']
+DIAMETER = ['Diameter_Cyl_4mm_Pos', 'Diameter_Cyl_8mm_Neg', 'Diameter_Cyl_8mm_Pos', 'Diameter_Cyl_16mm_Neg',
+            'Diameter_Cyl_16mm_Pos', 'Diameter_Cyl_24mm_Neg', 'Diameter_Cyl_24mm_Pos']
+FLATNESS = ['Flatness_HX{}_Plane{}'.format(i, j) for i in [1, 2] for j in range(1, 7)]
+VERTICAL = ['Flatness_HX2_Plane2', 'Flatness_HX2_Plane5']
+
+# Vertical plane of the t-test across builds (notebook 02 tests plane 2 only)
+VERTICAL_BUILDS = ['Flatness_HX2_Plane2']
+
+# Fixed float format for deterministic output
+FLOAT_FORMAT = '%.10g'
+
+
+def write_table(df, out, name):
+    """
+    Write a result table to the output folder with deterministic formatting.
+
+    """
+    path = os.path.join(out, name + '.csv')
+    with open(path, 'w', newline='\n') as f:
+        df.to_csv(f, sep=';', float_format=FLOAT_FORMAT)
+    return path
+
+
+def stage_repeatability(data, out):
+    """
+    Notebook 01: Difference between repeated measurements.
+
+    """
+    reps = ['rep1', 'rep2', 'rep3']
+    df = func.get_results(CYLINDRICITY + DIAMETER + FLATNESS, ['part_name', 'rep', 'char_name', 'error'],
+                          folder=data)
+
+    # Repeated measurements as columns (one row per part and characteristic)
+    df_tot = df.pivot_table(index=['part_name', 'char_name'], columns='rep', values='error')
+    df_tot.columns = ['rep{}'.format(c) for c in df_tot.columns]
+    df_tot = df_tot.reset_index()
+
+    # Replace exact characteristic name with simply characteristic type
+    df_tot['char_type'] = df_tot['char_name'].str.split('_').str[0]
+
+    # Calculate difference between minimum and maximum
+    df_tot['diff'] = df_tot[reps].max(axis=1) - df_tot[reps].min(axis=1)
+
+    # Statistical description for all data and every characteristic type
+    stats = df_tot.groupby('char_type')['diff'].describe()
+    stats.loc['All'] = df_tot['diff'].describe()
+
+    # Threshold of three standard deviations from the mean and the number of points above
+    lim = df_tot['diff'].mean() + 3 * df_tot['diff'].std()
+    outliers = pd.DataFrame({'threshold': [lim],
+                             'n_filtered': [int((df_tot['diff'] > lim).sum())],
+                             'ratio': [(df_tot['diff'] > lim).mean()]})
+
+    return [write_table(stats, out, 'repeatability_stats'),
+            write_table(outliers, out, 'repeatability_threshold')]
+
+
+def stage_builds(data, out):
+    """
+    Notebook 02: Comparison of builds.
+
+    """
+    # Anchors at position (2,3), all planes
+    df = func.get_char_means(FLATNESS, folder=data)
+    df = df[(df['x_pos'] == 2) & (df['y_pos'] == 3)]
+    p_anchor = func.get_p_vals(df, 'build')
+
+    # Vertical plane at all positions
+    p_vertical = func.get_p_vals(func.get_char_means(VERTICAL_BUILDS, folder=data), 'build')
+
+    return [write_table(p_anchor, out, 'p_vals_build_anchor_planes'),
+            write_table(p_vertical, out, 'p_vals_build_vertical_planes')]
+
+
+def stage_z(data, out):
+    """
+    Notebook 03: Variation along the z-axis.
+
+    """
+    paths = []
+
+    for name, chars, absolute in [('cylindricity', CYLINDRICITY, False), ('diameter', DIAMETER, True),
+                                  ('flatness', FLATNESS, False)]:
+        df = func.get_char_means(chars, ['error', 'angle', 'x_pos', 'y_pos', 'z_pos'], folder=data)
+        if absolute:
+            df = df.assign(error=df['error'].abs())
+
+        # Reference specimen at (2,3) and at (3,1) rotated -90 degrees
+        df_23 = df[(df['x_pos'] == 2) & (df['y_pos'] == 3)]
+        df_31 = df[(df['x_pos'] == 3) & (df['y_pos'] == 1) & (df['angle'] == -90)]
+
+        paths.append(write_table(func.get_p_vals(df_23), out, 'p_vals_z_{}_23'.format(name)))
+        paths.append(write_table(func.get_p_vals(df_31), out, 'p_vals_z_{}_31'.format(name)))
+
+    # All vertical planes
+    df = func.get_char_means(VERTICAL, ['error', 'z_pos'], folder=data)
+    paths.append(write_table(func.get_p_vals(df), out, 'p_vals_z_vertical_planes'))
+
+    return paths
+
+
+def stage_xy(data, out):
+    """
+    Notebook 04: Variation in the xy-plane.
+
+    """
+    df = func.get_char_means(VERTICAL, ['char', 'error', 'x_pos', 'y_pos'], folder=data)
+
+    # Compare the two vertical planes after removing values beyond three standard deviations
+    std = df['error'].std()
+    mean = df['error'].mean()
+    df_filtered = df[(df['error'] < mean + 3 * std) & (df['error'] > mean - 3 * std)]
+
+    return [write_table(func.get_p_vals(df_filtered, 'char'), out, 'p_vals_xy_vertical_planes_char'),
+            write_table(func.get_p_vals(df, 'x_pos'), out, 'p_vals_xy_vertical_planes_x'),
+            write_table(func.get_p_vals(df, 'y_pos'), out, 'p_vals_xy_vertical_planes_y')]
+
+
+def stage_t_tests(data, out):
+    """
+    T-tests stored as "T-test_Angle_Cylindricity.csv" and "T-test_Z-dir_Cylinders.csv".
+
+    """
+    df = func.get_char_means(CYLINDRICITY, ['error', 'angle', 'x_pos', 'y_pos', 'z_pos'], folder=data)
+
+    return [write_table(func.my_t_test(df, 'angle'), out, 'T-test_Angle_Cylindricity'),
+            write_table(func.my_t_test(df[(df['x_pos'] == 2) & (df['y_pos'] == 3)], 'z_pos'),
+                        out, 'T-test_Z-dir_Cylinders')]
+
+
+# All stages in the order of the notebooks
+STAGES = {'repeatability': stage_repeatability,
+          'builds': stage_builds,
+          'z': stage_z,
+          'xy': stage_xy,
+          't-tests': stage_t_tests}
+
+
+def run_stage(name, data, out):
+    """
+    Run a single stage (executed in a worker process).
+
+    Return:
+        a tuple with the name, the written files, the elapsed time and the error message (or None)
+
+    """
+    start = time.perf_counter()
+    try:
+        paths = STAGES[name](data, out)
+        error = None
+    except Exception:
+        paths = []
+        error = traceback.format_exc()
+
+    return name, paths, time.perf_counter() - start, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproduce the result tables of the notebooks")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help="stages to run (default = all)")
+    parser.add_argument('--data', default='data', help="folder with prep_data.pkl and layout_data.pkl")
+    parser.add_argument('--out', default='results', help="output folder (default = results)")
+    parser.add_argument('--jobs', type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    # Check the input data
+    missing = [f for f in ['prep_data.pkl', 'layout_data.pkl']
+               if not os.path.exists(os.path.join(args.data, f))]
+    if missing:
+        print("Missing input data in '{}': {}".format(args.data, ', '.join(missing)), file=sys.stderr)
+        return 2
+
+    os.makedirs(args.out, exist_ok=True)
+
+    # Run the stages in parallel and report in the order of the stages
+    failed = False
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(run_stage, name, args.data, args.out) for name in args.stages]
+        for future in futures:
+            name, paths, elapsed, error = future.result()
+            if error is None:
+                print("{:<15}{:>6.1f} s  {}".format(name, elapsed, ', '.join(os.path.basename(p) for p in paths)))
+            else:
+                failed = True
+                print("{:<15}failed\n{}".format(name, error), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+Generate synthetic data with the same format as the data of the experiment.
+
+The generated files follow the schema of the original files, so that all
+functions can be run and benchmarked at any scale (see benchmark.py):
+    "Leirmo_Exp1_ALL.csv"           CMM export with the original 'K...' headers
+    "leirmo_exp1_layout.csv"        Layout of the builds
+    "Slice_distribution_<>.csv"     Slice distributions as exported from Magics
+    "Room_data_Build_<>.csv"        Room data as exported from the P395 logger
+    "Weather_data.csv"              Daily weather data tagged with the running build
+
+Every build repeats the layout of one of the three original builds. The errors
+are drawn from a simple model with a characteristic offset, a z-effect, an
+effect of the part rotation and measurement noise.
+
+Usage:
+    python synthetic_data.py <folder> --builds 30 --seed 0
+
+"""
+
+# Import libraries
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+##############################################################################
+
+# Folder of this file (holds the original data used as templates)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Headers of the CMM export (the columns read by load_results)
+CMM_HEADER = ["Uuid", "Characteristic", "K1 Measured value", "K2001 Characteristic number",
+              "K2101 Nominal value", "K4 Time/Date", "K14 Part ident", "K53 Order number"]
+
+# Header of the room data logger
+ROOM_HEADER = "P395\tTime\tTemperature (°C)\tHumidity(%rh)\tDew Point(°C)\tComments"
+
+# Header of the weather data
+WEATHER_HEADER = ['Date', 'Minimum temperature', 'Maximum temperature', 'Mean temperature', 'Precipitation',
+                  'Build']
+
+
+def get_char_names():
+    """
+    Get the names of all characteristics from "data_description.txt".
+
+    """
+    with open(os.path.join(DATA_DIR, 'data_description.txt'), encoding='latin-1') as f:
+        return [line.split('=')[0].strip() for line in f if '=' in line]
+
+
+def get_nominal(char):
+    """
+    Get a plausible nominal value of a characteristic (size for diameters and distances, else zero).
+
+    """
+    if char.startswith('Diameter'):
+        for part in char.replace('_mm', 'mm').split('_'):
+            if part.endswith('mm'):
+                return float(part[:-2])
+        return 20.0
+    if char.startswith('Dist'):
+        return 30.0
+    if char.startswith('Cone_Angle'):
+        return 90.0
+    return 0.0
+
+
+def make_layout(n_builds):
+    """
+    Create a layout of n builds by repeating the layouts of the original builds.
+
+    Return:
+        a dataframe with the same columns as "leirmo_exp1_layout.csv" (part_name as index)
+
+    """
+    template = pd.read_csv(os.path.join(DATA_DIR, 'leirmo_exp1_layout.csv'), sep=';',
+                           encoding='utf-8-sig', index_col='part_name')
+
+    layouts = []
+    for b in range(1, n_builds + 1):
+        df = template[template['build'] == (b - 1) % 3 + 1].copy()
+        df['build'] = b
+        df.index = ['Leirmo_Exp1_Build{}_#{}'.format(b, i) for i in df['part_index']]
+        layouts.append(df)
+
+    layout = pd.concat(layouts)
+    layout.index.name = 'part_name'
+
+    return layout
+
+
+def make_cmm_export(layout, chars=None, reps=3, seed=0, start='2020-07-01 08:00:00'):
+    """
+    Create a CMM export for all parts of a layout.
+
+    Arguments:
+        layout = a dataframe from make_layout
+        chars = list of characteristic names (default = all in "data_description.txt")
+        reps = number of repeated measurements (default = 3)
+        seed = seed of the random number generator (default = 0)
+        start = time of the first measurement (default = '2020-07-01 08:00:00')
+
+    Return:
+        a dataframe with the columns of CMM_HEADER
+
+    """
+    rng = np.random.default_rng(seed)
+    chars = np.array(get_char_names() if chars is None else chars)
+    n_parts, n_chars = len(layout), len(chars)
+
+    # One row for every part, repetition and characteristic (in that order)
+    part = np.repeat(np.arange(n_parts), reps * n_chars)
+    rep = np.tile(np.repeat(np.arange(1, reps + 1), n_chars), n_parts)
+    char = np.tile(np.arange(n_chars), n_parts * reps)
+
+    # Error model: offset per characteristic, z-effect, rotation effect and noise
+    nominal = np.array([get_nominal(c) for c in chars])
+    form = nominal == 0
+    offset = rng.normal(0.05, 0.03, n_chars)
+    z = layout['center_z'].to_numpy() / 450
+    rot = np.abs(np.sin(np.radians(layout['angle'].to_numpy())))
+    part_effect = rng.normal(0, 0.01, n_parts) + 0.02 * z + 0.01 * rot
+    error = offset[char] + part_effect[part] + rng.normal(0, 0.005, len(part))
+    error[form[char]] = np.abs(error[form[char]])
+    actual = nominal[char] + error
+
+    # Timestamps: twenty minutes per measurement run, one second per characteristic
+    run = part * reps + (rep - 1)
+    time = pd.Timestamp(start) + pd.to_timedelta(run * 1200 + char, unit='s')
+
+    # Uuid as the id of the measurement run followed by the id of the characteristic
+    run_ids = np.array([rng.bytes(16).hex() for _ in range(n_parts * reps)])
+    char_ids = np.array([rng.bytes(16).hex() for _ in range(n_chars)])
+    uuid = np.char.add(run_ids[run], char_ids[char])
+
+    return pd.DataFrame({"Uuid": uuid,
+                         "Characteristic": chars[char],
+                         "K1 Measured value": actual,
+                         "K2001 Characteristic number": char + 1,
+                         "K2101 Nominal value": nominal[char],
+                         "K4 Time/Date": time.strftime('%Y-%m-%d %H:%M:%S'),
+                         "K14 Part ident": rep,
+                         "K53 Order number": layout.index.to_numpy()[part]})
+
+
+def make_slice_distribution(n_layers=4050, layer=0.12, seed=0):
+    """
+    Create a slice distribution as exported from Magics.
+
+    Return:
+        a dataframe with the columns 'Height (mm)' and 'Total slice surface (mm²)'
+
+    """
+    rng = np.random.default_rng(seed)
+    height = layer / 2 + layer * np.arange(n_layers)
+
+    # Five levels of parts with some variation in area
+    area = np.zeros(n_layers)
+    for z in [50.88, 150.6, 250.32, 350.04, 449.76]:
+        area += 4000 * np.exp(-((height - z) / 18) ** 2)
+    area *= rng.uniform(0.9, 1.1, n_layers)
+
+    return pd.DataFrame({'Height (mm)': height, 'Total slice surface (mm²)': area})
+
+
+def make_room_data(build, minutes=4320, seed=0):
+    """
+    Create room data as logged by the P395 logger (one reading per minute).
+
+    Return:
+        a dataframe with the columns of the logger
+
+    """
+    rng = np.random.default_rng(seed + build)
+    start = pd.Timestamp('2020-06-01 10:00') + pd.Timedelta(days=7 * (build - 1))
+    t = np.arange(minutes)
+
+    temp = 20.2 + 0.5 * np.sin(2 * np.pi * t / 1440) + rng.normal(0, 0.05, minutes)
+    hum = 45 + 5 * np.sin(2 * np.pi * t / 1440 + 1) + rng.normal(0, 0.5, minutes)
+    dew = temp - (100 - hum) / 5
+
+    return pd.DataFrame({'P395': 10000 * build + t,
+                         'Time': (start + pd.to_timedelta(t, unit='min')).strftime('%d.%m.%Y %H:%M'),
+                         'Temperature': temp.round(1),
+                         'Humidity': hum.round(0).astype(int),
+                         'Dew Point': dew.round(2),
+                         'Comments': ''})
+
+
+def make_weather_data(n_builds, minutes=4320, seed=0):
+    """
+    Create daily weather data covering the room data of all builds, with the
+    build number on the days a build was running ('NONE' otherwise).
+
+    Return:
+        a dataframe with the columns of the weather data
+
+    """
+    rng = np.random.default_rng(seed)
+    first = pd.Timestamp('2020-06-01 10:00')
+    starts = first + pd.to_timedelta(7 * np.arange(n_builds), unit='D')
+    end = starts[-1] + pd.Timedelta(minutes=minutes) + pd.Timedelta(days=1)
+    dates = pd.date_range(first.normalize(), end.normalize())
+
+    mean = 17 + rng.normal(0, 3, len(dates))
+    low = mean - rng.uniform(3, 8, len(dates))
+    high = mean + rng.uniform(3, 8, len(dates))
+    rain = np.where(rng.random(len(dates)) < 0.3, rng.exponential(5, len(dates)), 0)
+
+    # Same periods as make_room_data
+    build = np.full(len(dates), 'NONE', dtype=object)
+    for b, start in enumerate(starts, 1):
+        running = (dates >= start.normalize()) & (dates <= start + pd.Timedelta(minutes=minutes - 1))
+        build[running] = str(b)
+
+    return pd.DataFrame(dict(zip(WEATHER_HEADER, [dates.strftime('%d.%m.%Y'), low.round(1), high.round(1),
+                                                  mean.round(1), rain.round(1), build])))
+
+
+def generate(folder, n_builds=3, seed=0):
+    """
+    Write a complete synthetic dataset of n builds to a folder.
+
+    Arguments:
+        folder = output folder
+        n_builds = number of builds (default = 3)
+        seed = seed of the random number generator (default = 0)
+
+    Return:
+        the layout dataframe
+
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    # Layout
+    layout = make_layout(n_builds)
+    layout.to_csv(os.path.join(folder, 'leirmo_exp1_layout.csv'), sep=';', encoding='utf-8-sig')
+
+    # CMM export, written build by build to limit memory use
+    #   PS: The builds are measured one after another (twenty minutes per measurement run)
+    path = os.path.join(folder, 'Leirmo_Exp1_ALL.csv')
+    start = pd.Timestamp('2020-07-01 08:00:00')
+    with open(path, 'w', newline='\n') as f:
+        for b in range(1, n_builds + 1):
+            parts = layout[layout['build'] == b]
+            df = make_cmm_export(parts, seed=seed + b, start=start)
+            df.to_csv(f, index=False, header=(b == 1))
+            start += pd.Timedelta(seconds=len(parts) * 3 * 1200)
+
+    # Slice distributions and room data for every build
+    for b in range(1, n_builds + 1):
+        make_slice_distribution(seed=seed + b).to_csv(
+            os.path.join(folder, 'Slice_distribution_build{}.csv'.format(b)),
+            sep=';', index=False, float_format='%.3f', encoding='utf-8-sig')
+
+        room = make_room_data(b, seed=seed)
+        with open(os.path.join(folder, 'Room_data_Build_{}.csv'.format(b)), 'w', encoding='latin-1') as f:
+            f.write(ROOM_HEADER + '\n')
+            room.to_csv(f, sep='\t', index=False, header=False)
+
+    # Weather data of the whole period
+    make_weather_data(n_builds, seed=seed).to_csv(os.path.join(folder, 'Weather_data.csv'), sep=';',
+                                                  index=False, encoding='utf-8-sig')
+
+    return layout
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic data of the experiment")
+    parser.add_argument('folder', help="output folder")
+    parser.add_argument('--builds', type=int, default=3, help="number of builds (default = 3)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default = 0)")
+    args = parser.parse_args()
+
+    generate(args.folder, args.builds, args.seed)
+    sys.exit(0)
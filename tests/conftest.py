@@ -0,0 +1,24 @@
+"""
+Shared fixtures of the tests (the modules are imported from the root of the repository).
+
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_data
+
+
+@pytest.fixture(scope='session')
+def synthetic_folder(tmp_path_factory):
+    """
+    Folder with a synthetic dataset of three builds (see synthetic_data.generate).
+
+    """
+    folder = str(tmp_path_factory.mktemp('synthetic'))
+    synthetic_data.generate(folder, n_builds=3, seed=0)
+    return folder
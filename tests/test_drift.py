@@ -0,0 +1,49 @@
+"""
+Tests of the drift analysis on synthetic data with and without an injected drift.
+
+"""
+
+import pandas as pd
+import pytest
+
+import my_functions as func
+import my_drift as mydrift
+
+
+@pytest.fixture(scope='module')
+def measurements(synthetic_folder):
+    return func.load_results(synthetic_folder), func.load_layout(synthetic_folder)
+
+
+def drift_table(df, layout, rate=0.0):
+    """
+    Drift table of the results with a linear drift of the given rate [mm/hour] added to the errors.
+
+    """
+    hours = (df['time'] - df['time'].min()) / pd.Timedelta(hours=1)
+    df = df.assign(error=df['error'] + rate * hours)
+    return mydrift.drift_table(mydrift.sort_measurements(df, layout), permutations=99)
+
+
+def test_no_drift(measurements):
+    table = drift_table(*measurements)
+
+    # About alpha of the characteristics are flagged by chance
+    assert table['drift'].mean() < 0.1
+    assert table['change_point'].mean() < 0.1
+
+
+def test_injected_drift(measurements):
+    table = drift_table(*measurements, rate=0.005)
+
+    assert table['drift'].all()
+    assert table['slope_per_hour'].median() == pytest.approx(0.005, rel=0.1)
+
+
+def test_residuals_remove_layout_effects(measurements):
+    df, layout = measurements
+    sorted_df = mydrift.sort_measurements(df, layout)
+
+    # The errors vary with the position, the residuals do not
+    by_z = lambda col: sorted_df.join(layout['z_pos'], on='part_name').groupby('z_pos')[col].mean()
+    assert by_z('residual').abs().max() < 0.25 * (by_z('error').max() - by_z('error').min())
@@ -0,0 +1,119 @@
+"""
+Tests of following a room data log that is being appended (RoomDataTail and follow).
+
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import my_environment as myenv
+
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+THRESHOLDS = {'temperature': (19, 22)}
+
+
+@pytest.fixture
+def log(tmp_path):
+    """
+    Lines of a real room data log, with the first 200 readings written to a temporary log.
+
+    """
+    with open(os.path.join(DATA, 'Room_data_Build_1.csv'), 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    path = tmp_path / 'Room_data_Build_1.csv'
+    path.write_bytes(b''.join(lines[:201]))
+    return path, lines
+
+
+def append(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+def reading(time, temperature):
+    """
+    A line of the log with the specified time and temperature.
+
+    """
+    return '9999\t{:%d.%m.%Y %H:%M}\t{}\t40\t6.09\t\n'.format(time, temperature).encode('latin-1')
+
+
+def make_tail(path):
+    alarms = []
+    store = myenv.EnvironmentStore(myenv.load_room_data(1, folder=str(path.parent)))
+    tail = myenv.RoomDataTail(str(path), 1, store, THRESHOLDS,
+                              callback=lambda *args: alarms.append(args))
+    return tail, alarms
+
+
+def test_poll_reads_new_bytes(log):
+    path, lines = log
+    tail, alarms = make_tail(path)
+
+    # The readings already in the store are skipped
+    assert tail.poll() == 0
+    assert tail.offset == os.path.getsize(path)
+
+    # Overwrite the consumed bytes, which fails to parse if they are read again
+    size = tail.offset
+    path.write_bytes(b'x' * size)
+    append(path, b''.join(lines[201:301]))
+
+    assert tail.poll() == 100
+    assert tail.offset == os.path.getsize(path)
+    assert tail.poll() == 0
+
+
+def test_aggregates_match_recompute(log):
+    path, lines = log
+    tail, alarms = make_tail(path)
+    tail.poll()
+
+    # Append in several polls of different sizes
+    for start, stop in [(201, 202), (202, 260), (260, 400)]:
+        append(path, b''.join(lines[start:stop]))
+        tail.poll()
+
+    expected = myenv.EnvironmentStore(myenv.load_room_data(1, folder=str(path.parent)))
+    pd.testing.assert_frame_equal(tail.store.data, expected.data)
+    pd.testing.assert_frame_equal(tail.store.summary, expected.summary)
+    for window in expected.windows:
+        pd.testing.assert_frame_equal(tail.store.rolling[window], expected.rolling[window])
+
+
+def test_callback_on_partial_line(log):
+    path, lines = log
+    tail, alarms = make_tail(path)
+    tail.poll()
+
+    last = tail.store.last_time(1)
+    hot = reading(last + pd.Timedelta('1min'), 23.5)
+    cold = reading(last + pd.Timedelta('2min'), 18.5)
+
+    # The logger has written one reading and half of the next
+    append(path, hot + cold[:10])
+    assert tail.poll() == 1
+    assert [(a[2], a[3]) for a in alarms] == [('temperature', pytest.approx(23.5))]
+
+    # The rest of the line is consumed (and checked) by the next poll
+    append(path, cold[10:])
+    assert tail.poll() == 1
+    assert [a[1] for a in alarms] == [last + pd.Timedelta('1min'), last + pd.Timedelta('2min')]
+    assert alarms[1][3] == pytest.approx(18.5)
+    assert alarms[1][4] == THRESHOLDS['temperature']
+
+
+def test_follow(log):
+    path, lines = log
+    tail, alarms = make_tail(path)
+    append(path, b''.join(lines[201:211]))
+
+    # Stop after a single round of polls
+    calls = []
+    myenv.follow([tail], interval=0, stop=lambda: calls.append(1) or len(calls) > 1)
+
+    assert tail.store.last_time(1) == myenv.parse_room_data(str(path), 1).index[-1][1]
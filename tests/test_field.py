@@ -0,0 +1,45 @@
+"""
+Tests of the error fields on a smooth synthetic error with noise.
+
+"""
+
+import numpy as np
+import pytest
+
+import my_field as myfield
+
+
+NOISE = 0.02
+
+
+@pytest.fixture(scope='module')
+def data():
+    """
+    Noisy errors with a smooth trend at a lattice of positions inside the build volume.
+
+    """
+    rng = np.random.default_rng(0)
+    axes = [np.linspace(40, 210, 6), np.linspace(40, 210, 6), np.linspace(10, 80, 4)]
+    points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    trend = 0.05 + 0.0004 * points[:, 0] - 0.0003 * points[:, 2] + 0.02 * np.sin(points[:, 1] / 40)
+    return points, trend, trend + rng.normal(0, NOISE, len(points))
+
+
+def test_reproduces_means_within_noise(data):
+    points, trend, values = data
+    field = myfield.ErrorField('test', points, values)
+
+    assert field.smoothing > 0
+    assert field.fit_error < 1.2 * NOISE
+    assert np.sqrt(np.mean((field(points) - trend) ** 2)) < NOISE
+
+
+def test_no_extrapolation(data):
+    points, trend, values = data
+    field = myfield.ErrorField('test', points, values)
+
+    # The grid stays within the fitted values and is constant outside the bounding box
+    assert values.min() <= field.grid.min() and field.grid.max() <= values.max()
+    inside = np.array([[40.0, 120.0, 10.0], [210.0, 120.0, 80.0]])
+    outside = np.array([[0.0, 120.0, 0.0], [250.0, 120.0, 250.0]])
+    np.testing.assert_allclose(field(outside), field(inside), atol=1e-6)